@@ -1,11 +1,90 @@
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+import config
 import rag_chain
+from stage_limits import StageBusy
 
 app = FastAPI(title="Legally RAG API", version="1.0")
 
+# Пайплайн блокирующий (модели, Pinecone, Groq): выполняется в отдельном ограниченном пуле,
+# event loop остаётся свободным для остальных клиентов и /api/v1/stats
+_executor = ThreadPoolExecutor(max_workers=config.API_WORKERS, thread_name_prefix="rag")
+_pending = 0
+_api_stats = {"completed": 0, "streamed": 0, "rejected_pending": 0, "rejected_stage": 0}
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """fn в пуле _executor; сверх API_MAX_PENDING запросов в работе или при StageBusy — 503."""
+    global _pending
+    if _pending >= config.API_MAX_PENDING:
+        _api_stats["rejected_pending"] += 1
+        raise HTTPException(status_code=503, detail="Сервис перегружен, повторите позже", headers={"Retry-After": "1"})
+    _pending += 1
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+    except StageBusy as e:
+        _api_stats["rejected_stage"] += 1
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    finally:
+        _pending -= 1
+    _api_stats["completed"] += 1
+    return result
+
+
+class SingleFlight:
+    """Одновременные запросы с одним ключом ждут одно общее вычисление и получают его результат.
+
+    Вычисление — отдельная задача: отключение клиента, который его запустил, не отменяет ответ остальным.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = self._inflight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(functools.partial(self._finished, key))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Исключение получат ожидающие; если все отключились — не шумим "never retrieved"
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+# Ключ — тот же, что у кэша ответов: вопрос, история, промпт, модель, версия корпуса
+_single_flight = SingleFlight()
+
+
+async def invoke_qa_coalesced(query: str, history: Optional[List[dict]] = None) -> dict:
+    key = rag_chain.answer_cache_key(query, history)
+    return await _single_flight.do(key, lambda: run_blocking(rag_chain.invoke_qa, query, history=history))
+
+
+@app.on_event("startup")
+def warmup_rag():
+    # rag_chain создаёт модели лениво — грузим всё до первого запроса и печатаем тайминги загрузки
+    rag_chain.warmup()
+
 class ChatRequest(BaseModel):
     query: str
     history: Optional[List[dict]] = []
@@ -39,42 +118,109 @@ def convert_numpy_types(obj):
         return [convert_numpy_types(i) for i in obj]
     return obj
 
+def format_sources(docs) -> List[dict]:
+    source_docs = []
+    for doc in docs:
+        if hasattr(doc, "metadata"):
+            # Clean metadata of numpy types
+            metadata = convert_numpy_types(doc.metadata)
+            source_docs.append({
+                "page_content": doc.page_content,
+                "metadata": metadata
+            })
+        else:
+            # Handle case where it might be a dict already or something else
+            source_docs.append(convert_numpy_types(doc))
+    return source_docs
+
 @app.post("/api/v1/internal-chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     try:
         # Invoke the RAG chain
-        response = rag_chain.invoke_qa(request.query, history=request.history)
-        
-        # Format the response
-        result = response.get("result", "")
-        source_docs = []
-        
-        for doc in response.get("source_documents", []):
-            if hasattr(doc, "metadata"):
-                # Clean metadata of numpy types
-                metadata = convert_numpy_types(doc.metadata)
-                source_docs.append({
-                    "page_content": doc.page_content,
-                    "metadata": metadata
-                })
-            else:
-                # Handle case where it might be a dict already or something else
-                source_docs.append(convert_numpy_types(doc))
+        response = await invoke_qa_coalesced(request.query, history=request.history)
 
         return ChatResponse(
-            result=result,
-            source_documents=source_docs
+            result=response.get("result", ""),
+            source_documents=format_sources(response.get("source_documents", []))
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error processing request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_event(event: dict) -> str:
+    kind = event.pop("event")
+    if kind == "sources":
+        event["source_documents"] = format_sources(event["source_documents"])
+    return _sse(kind, event)
+
+
+async def _chat_events(events, first: dict):
+    """События rag_chain.stream_qa в формате SSE; шаги генератора выполняются в пуле _executor."""
+    global _pending
+    step = None
+    _pending += 1
+    try:
+        yield _sse_event(first)
+        while True:
+            # concurrent.futures.Future: при отмене корутины видно, что шаг ещё выполняется в пуле
+            step = _executor.submit(next, events, None)
+            event = await asyncio.wrap_future(step)
+            if event is None:
+                break
+            yield _sse_event(event)
+        _api_stats["streamed"] += 1
+    except StageBusy as e:
+        # Заголовки уже отправлены — перегрузку LLM сообщаем событием
+        _api_stats["rejected_stage"] += 1
+        yield _sse("error", {"status": 503, "detail": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        print(f"Error streaming answer: {str(e)}")
+        yield _sse("error", {"status": 500, "detail": str(e)})
+    finally:
+        _pending -= 1
+        # Клиент отключился — закрываем генератор (освобождает слот LLM), но не посреди шага в пуле
+        if step is not None and not step.done():
+            step.add_done_callback(lambda _: _executor.submit(events.close))
+        else:
+            events.close()
+
+@app.post("/api/v1/internal-chat/stream")
+async def chat_stream(request: ChatRequest):
+    """SSE-вариант internal-chat: sources (после rerank) → token (фрагменты LLM) → done (вердикт validate_answer).
+
+    done: {"result": ..., "answer": ..., "valid": bool} — при valid=false клиент заменяет показанный текст на result.
+    """
+    events = rag_chain.stream_qa(request.query, history=request.history)
+    try:
+        # Первое событие (кэш ответов или retrieval) — до начала ответа: перегрузка и ошибки поиска — обычные 503/500
+        first = await run_blocking(next, events)
+    except HTTPException:
+        events.close()
+        raise
     except Exception as e:
+        events.close()
         print(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        _chat_events(events, first),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/api/v1/analyze", response_model=AnalysisResponse)
 async def analyze(request: AnalysisRequest):
     try:
         # Call the analysis function from rag_chain
-        result = rag_chain.analyze_text(request.text)
+        result = await run_blocking(rag_chain.analyze_text, request.text)
         return AnalysisResponse(result=result)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -94,16 +240,32 @@ async def get_stats():
             }
         }
         
-        if hasattr(rag_chain, "_vector_store"):
-            # Try to get Pinecone index stats
+        # Только уже загруженный индекс: статистика не должна блокировать event loop загрузкой
+        vector_store = rag_chain._components.get("vector_store")
+        if vector_store is not None:
+            # Pinecone: статистика индекса; локальный индекс отдаёт те же ключи сам
             try:
-                index_stats = rag_chain._vector_store.get_pinecone_index().describe_index_stats()
+                if hasattr(vector_store, "describe_index_stats"):
+                    index_stats = vector_store.describe_index_stats()
+                else:
+                    # Сетевой вызов Pinecone — в поток по умолчанию, мимо очереди пайплайна
+                    index_stats = await asyncio.to_thread(vector_store.get_pinecone_index().describe_index_stats)
                 stats["total_vectors"] = index_stats.get("total_vector_count", 0)
                 stats["index_dimension"] = index_stats.get("dimension", 0)
             except Exception as e:
                 print(f"Failed to get Pinecone stats: {e}")
                 # Fallback: maybe just return 0 or cached value
-        
+
+        if hasattr(rag_chain, "cache_stats"):
+            stats["caches"] = rag_chain.cache_stats()
+        stats["api"] = {
+            "workers": config.API_WORKERS,
+            "max_pending": config.API_MAX_PENDING,
+            "pending": _pending,
+            **_api_stats,
+            "single_flight": _single_flight.stats(),
+        }
+
         return stats
     except Exception as e:
         print(f"Error fetching stats: {str(e)}")
@@ -113,7 +275,7 @@ async def get_stats():
 async def generate_eval_data(request: ChatRequest):
     try:
         # We reuse ChatRequest (query: str) for simpler reuse
-        response = rag_chain.invoke_qa(request.query)
+        response = await invoke_qa_coalesced(request.query)
         
         result = response.get("result", "")
         chunks = [doc.page_content for doc in response.get("source_documents", [])]
@@ -128,6 +290,8 @@ async def generate_eval_data(request: ChatRequest):
             "chunks": chunks,
             "articles": articles
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating eval data: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
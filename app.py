@@ -7,7 +7,7 @@ from datetime import datetime
 import streamlit as st
 
 import config
-from rag_chain import invoke_qa, validate_answer
+from rag_chain import stream_qa
 
 CHAT_STORE_PATH = "chat_history.json"
 
@@ -94,6 +94,37 @@ DELETE_CHAT = {"ru": "Удалить чат", "kz": "Чатты жою"}
 RENAME_CHAT = {"ru": "Переименовать", "kz": "Атауын өзгерту"}
 SAVE_CHAT = {"ru": "Сохранить историю", "kz": "Тарихты сақтау"}
 
+
+# Источники ответа (карточки со ссылкой на файл, кодекс, статью и цитатой)
+def _render_sources(sources) -> None:
+    if not sources:
+        return
+    st.markdown(f"<div class=\"sources-title\">{SOURCES_LABEL[st.session_state.lang]}</div>", unsafe_allow_html=True)
+    st.markdown("<div class=\"sources-footer\">", unsafe_allow_html=True)
+    for i, doc in enumerate(sources, 1):
+        src = doc.metadata.get("source", "неизвестно")
+        filename = src.split("/")[-1] if "/" in src else src
+        code_ru = doc.metadata.get("code_ru", "")
+        art = doc.metadata.get("article_number", "")
+        preview = doc.page_content[:280].replace("\n", " ").strip()
+        title_bits = []
+        if code_ru:
+            title_bits.append(f"**{code_ru}**")
+        if art:
+            title_bits.append(f"ст.{art}")
+        title_text = " • ".join(title_bits)
+        st.markdown(
+            f"<div class=\"source-item\">"
+            f"<div class=\"source-meta\">🔗 {i}. <strong>{filename}</strong>"
+            + (f" — {title_text}" if title_text else "")
+            + "</div>"
+            + f"<div class=\"source-quote\">{preview}...</div>"
+            + "</div>",
+            unsafe_allow_html=True,
+        )
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
 # Базовый стиль
 st.markdown(
     """
@@ -329,45 +360,40 @@ if prompt:
     with st.chat_message("user", avatar="👤"):
         st.markdown(prompt)
 
-    with st.spinner("Ищу в текстах законов..." if st.session_state.lang == "ru" else "Заң мәтінінде іздеймін..."):
+    with st.chat_message("assistant", avatar="⚖️"):
+        # Ответ печатается по мере генерации; источники — под ним, сразу после поиска (до LLM)
+        answer_box = st.empty()
+        sources_box = st.empty()
+        sources = []
         try:
-            result = invoke_qa(prompt)
-            response = result["result"]
-            sources = result["source_documents"]
-            response = validate_answer(prompt, response, sources)
-            if response == "Информация не найдена в доступных текстах законов.":
-                sources = []
+            with st.spinner("Ищу в текстах законов..." if st.session_state.lang == "ru" else "Заң мәтінінде іздеймін..."):
+                events = stream_qa(prompt)
+                sources = next(events)["source_documents"]
+            with sources_box.container():
+                _render_sources(sources)
+
+            done: dict = {}
+
+            def _answer_tokens():
+                for event in events:
+                    if event["event"] == "token":
+                        yield event["text"]
+                    elif event["event"] == "done":
+                        done.update(event)
+
+            answer_box.write_stream(_answer_tokens())
+            response = done["result"]
+            if not done["valid"]:
+                # validate_answer отклонил ответ — показанный текст заменяется вердиктом
+                answer_box.markdown(response)
+                if response == "Информация не найдена в доступных текстах законов.":
+                    sources = []
+                    sources_box.empty()
         except Exception as e:
             response = f"Ошибка при обработке вопроса: {str(e)}"
             sources = []
-
-    with st.chat_message("assistant", avatar="⚖️"):
-        st.markdown(response)
-        if sources:
-            st.markdown(f"<div class=\"sources-title\">{SOURCES_LABEL[st.session_state.lang]}</div>", unsafe_allow_html=True)
-            st.markdown("<div class=\"sources-footer\">", unsafe_allow_html=True)
-            for i, doc in enumerate(sources, 1):
-                src = doc.metadata.get("source", "неизвестно")
-                filename = src.split("/")[-1] if "/" in src else src
-                code_ru = doc.metadata.get("code_ru", "")
-                art = doc.metadata.get("article_number", "")
-                preview = doc.page_content[:280].replace("\n", " ").strip()
-                title_bits = []
-                if code_ru:
-                    title_bits.append(f"**{code_ru}**")
-                if art:
-                    title_bits.append(f"ст.{art}")
-                title_text = " • ".join(title_bits)
-                st.markdown(
-                    f"<div class=\"source-item\">"
-                    f"<div class=\"source-meta\">🔗 {i}. <strong>{filename}</strong>"
-                    + (f" — {title_text}" if title_text else "")
-                    + "</div>"
-                    + f"<div class=\"source-quote\">{preview}...</div>"
-                    + "</div>",
-                    unsafe_allow_html=True,
-                )
-            st.markdown("</div>", unsafe_allow_html=True)
+            answer_box.markdown(response)
+            sources_box.empty()
     if sources:
         sources_text = "\n".join([
             f"{j + 1}. {doc.metadata.get('source', '')} — {doc.metadata.get('code_ru', '')} ст.{doc.metadata.get('article_number', '')} — {doc.page_content[:200].replace(chr(10), ' ')}..."
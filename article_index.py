@@ -0,0 +1,110 @@
+# article_index.py — прямой индекс (code_ru, article_number) → чанки, без эмбеддингов и векторного поиска
+
+"""
+Строится в памяти из тех же чанков, что и BM25 (chunk_store.ChunkStore, старый chunks_for_bm25.pkl / prepare_data).
+Запросы вида "Статья 136 УК РК" или "ст. 188" отвечаются точным поиском по словарю:
+чанки статьи в исходном порядке, за микросекунды, без энкодера и Pinecone.
+Диапазоны ("ст. 120–135 УК") — бинарный поиск по отсортированному списку статей кодекса.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+
+_ARTICLE_NUM_RE = re.compile(r"^(\d+)(.*)$")
+
+
+def _norm_article(value) -> str:
+    return str(value or "").strip().lower()
+
+
+def _article_sort_key(article: str) -> Tuple[int, str] | None:
+    """Ключ сортировки: "136" → (136, ""), "5а" → (5, "а"); нечисловые номера в диапазоны не попадают."""
+    m = _ARTICLE_NUM_RE.match(article)
+    return (int(m.group(1)), m.group(2)) if m else None
+
+
+class ArticleIndex:
+    """(code_ru, article_number) → позиции чанков в исходном списке (по возрастанию)."""
+
+    def __init__(self, docs: Sequence[Document]):
+        self.docs = docs
+        positions: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        if hasattr(docs, "column"):
+            # ChunkStore: ключи из int32-столбцов и таблиц значений, без создания Document на каждый чанк
+            code_ids, code_values = docs.column("code_ru")
+            article_ids, article_values = docs.column("article_number")
+            if code_ids is not None and article_ids is not None:
+                codes = [v.strip() for v in code_values]
+                articles = [_norm_article(v) for v in article_values]
+                for i, (c, a) in enumerate(zip(code_ids.tolist(), article_ids.tolist())):
+                    if c >= 0 and a >= 0 and codes[c] and articles[a]:
+                        positions[(codes[c], articles[a])].append(i)
+        else:
+            for i, doc in enumerate(docs):
+                meta = doc.metadata or {}
+                code = (meta.get("code_ru") or "").strip()
+                article = _norm_article(meta.get("article_number"))
+                if code and article:
+                    positions[(code, article)].append(i)
+        self._positions = dict(positions)
+        # Для диапазонов: по кодексу отсортированные (номер, суффикс) и параллельный список номеров для bisect
+        by_code: Dict[str, List[Tuple[int, str, str]]] = defaultdict(list)
+        for code, article in self._positions:
+            key = _article_sort_key(article)
+            if key is not None:
+                by_code[code].append((key[0], key[1], article))
+        self._sorted: Dict[str, List[Tuple[int, str, str]]] = {code: sorted(items) for code, items in by_code.items()}
+        self._numbers: Dict[str, List[int]] = {code: [n for n, _, _ in items] for code, items in self._sorted.items()}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def positions(self, codes: Iterable[str], articles: Iterable[str]) -> List[int]:
+        """Позиции чанков: по статьям в порядке запроса, внутри статьи — по кодексам и порядку в тексте."""
+        codes = list(codes)
+        found: List[int] = []
+        seen = set()
+        for article in articles:
+            article = _norm_article(article)
+            for code in codes:
+                for pos in self._positions.get((code, article), ()):
+                    if pos not in seen:
+                        seen.add(pos)
+                        found.append(pos)
+        return found
+
+    def _copy(self, pos: int) -> Document:
+        doc = self.docs[pos]
+        if isinstance(self.docs, list):
+            doc = Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+        # ChunkStore и так создаёт новый Document на каждое обращение
+        return doc
+
+    def lookup(self, codes: Iterable[str], articles: Iterable[str]) -> List[Document]:
+        """Копии чанков статей (reranker и обрезка контекста не трогают общие объекты)."""
+        return [self._copy(i) for i in self.positions(codes, articles)]
+
+    def range_articles(self, codes: Iterable[str], start: int, end: int) -> List[Tuple[str, str]]:
+        """(code_ru, article_number) со start <= номер <= end, по возрастанию номера (суффиксы — после основной)."""
+        found: List[Tuple[int, str, int, str, str]] = []
+        for rank, code in enumerate(codes):
+            items = self._sorted.get(code)
+            if not items:
+                continue
+            numbers = self._numbers[code]
+            for num, suffix, article in items[bisect_left(numbers, start) : bisect_right(numbers, end)]:
+                found.append((num, suffix, rank, code, article))
+        found.sort()
+        return [(code, article) for _, _, _, code, article in found]
+
+    def range_lookup(self, codes: Iterable[str], start: int, end: int) -> List[List[Document]]:
+        """Чанки статей диапазона, сгруппированные по статьям в порядке номеров."""
+        return [
+            [self._copy(pos) for pos in self._positions[(code, article)]]
+            for code, article in self.range_articles(list(codes), start, end)
+        ]
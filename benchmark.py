@@ -22,6 +22,8 @@ import config
 config.BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
 TEST_QUERIES_PATH = Path(os.environ.get("LEGAL_RAG_TEST_QUERIES_PATH", "test_queries.json"))
 DEFAULT_FALLBACK = "Информация не найдена в доступных текстах законов."
+# Размеры шортлиста FlashRank, для которых считается recall (каскад reranker'а, config.RERANK_SHORTLIST_K)
+SHORTLIST_SIZES = (5, 8, 10, 12, 15, 20)
 
 # Вопросы для бенчмарка (id, вопрос, язык)
 BENCHMARK_QUESTIONS = [
@@ -316,6 +318,30 @@ def _compute_retrieval_metrics(
     }
 
 
+def _shortlist_recall(
+    candidates: List[Any], ranked: List[Any], relevant_articles: List[str]
+) -> Dict[str, Optional[float]]:
+    """Доля релевантных статей из кандидатов ретривера, которые FlashRank оставляет в первых s позициях."""
+    rel_set = {_normalize_article(x) for x in relevant_articles if _normalize_article(x)}
+    reachable = rel_set & {_doc_article(d) for d in candidates}
+    if not reachable:
+        return {f"recall@shortlist{s}": None for s in SHORTLIST_SIZES}
+    return {
+        f"recall@shortlist{s}": len(reachable & {_doc_article(d) for d in ranked[:s]}) / len(reachable)
+        for s in SHORTLIST_SIZES
+    }
+
+
+def _make_flashrank() -> Any:
+    try:
+        from flashrank import Ranker
+
+        return Ranker(model_name=config.FLASHRANK_MODEL, cache_dir=str(config.BASE_DIR / ".flashrank"))
+    except Exception as e:
+        print(f"FlashRank недоступен ({e}) — recall@shortlist не считается")
+        return None
+
+
 def evaluate_groundedness(answer: str, context: str, llm: Any) -> float:
     judge_prompt = f"""
 Оцени, насколько ответ полностью основан на предоставленном контексте.
@@ -353,13 +379,20 @@ def run_benchmark(timeout_sec: float = None):
 
     print("Загрузка RAG-цепи...")
     try:
-        from rag_chain import invoke_qa, retriever, llm
+        from rag_chain import cache_stats, invoke_qa, law_aware_retriever, retriever, llm
     except Exception as e:
         print(f"Ошибка загрузки rag_chain: {e}")
         sys.exit(1)
 
     questions = _load_eval_questions()
     use_judge = os.environ.get("LEGAL_RAG_ENABLE_GROUNDEDNESS_JUDGE", "1") == "1"
+    flashrank = _make_flashrank() if any(q.get("relevant_articles") for q in questions) else None
+    cascade = None
+    if flashrank is not None:
+        from rag_chain import BGEReranker, CascadeReranker
+
+        # Вторая стадия здесь не вызывается: нужен только shortlist() — тот же код, что в каскаде пайплайна
+        cascade = CascadeReranker(first_stage=flashrank, second_stage=BGEReranker(), shortlist_k=max(SHORTLIST_SIZES))
 
     results = []
     print(f"\nБенчмарк: {len(questions)} вопросов, таймаут {timeout_sec} с\n")
@@ -394,6 +427,14 @@ def run_benchmark(timeout_sec: float = None):
             result = {"result": f"[Ошибка: {e}]", "source_documents": []}
             print(f"   Ошибка: {e}")
 
+        # Recall шортлиста первой стадии каскада: кандидаты ретривера (до rerank) в порядке FlashRank.
+        # Считается после замера QA, чтобы лишний вызов ретривера не прогревал кэши до invoke_qa
+        shortlist_metrics: Dict[str, Optional[float]] = {}
+        if cascade is not None and relevant_articles:
+            candidates = law_aware_retriever.invoke(query)
+            ranked = cascade.shortlist(candidates, query, k=max(SHORTLIST_SIZES))
+            shortlist_metrics = _shortlist_recall(candidates, ranked, relevant_articles)
+
         answer = result.get("result", "")
         sources = result.get("source_documents", [])
         judge_sec = 0.0
@@ -420,6 +461,7 @@ def run_benchmark(timeout_sec: float = None):
             "recall@10": retrieval_metrics["recall@10"],
             "mrr": retrieval_metrics["mrr"],
             "hit_rate@5": retrieval_metrics["hit_rate@5"],
+            **shortlist_metrics,
             "groundedness": groundedness,
             "refusal_rate": refusal_rate,
             "latency_retrieval_sec": round(retrieval_sec, 3),
@@ -462,6 +504,10 @@ def run_benchmark(timeout_sec: float = None):
             "avg_latency_generation_sec": _avg([r.get("latency_generation_sec") for r in results]),
             "avg_latency_judge_sec": _avg([r.get("latency_judge_sec") for r in results]),
             "avg_latency_total_sec": _avg([r.get("latency_total_sec") for r in results]),
+            **{
+                f"avg_recall@shortlist{s}": _avg([r.get(f"recall@shortlist{s}") for r in results])
+                for s in SHORTLIST_SIZES
+            },
         }
         json.dump(
             {
@@ -469,6 +515,7 @@ def run_benchmark(timeout_sec: float = None):
                 "questions_count": len(results),
                 "judge_enabled": use_judge,
                 "summary": summary,
+                "caches": cache_stats(),
                 "results": results,
             },
             f,
@@ -532,6 +579,16 @@ def run_benchmark(timeout_sec: float = None):
         print(f"Average Groundedness: {avg_grounded:.3f}")
     if avg_refusal is not None:
         print(f"Average Refusal Rate: {avg_refusal:.3f}")
+    shortlist_recall = {s: _avg([r.get(f"recall@shortlist{s}") for r in results]) for s in SHORTLIST_SIZES}
+    if any(v is not None for v in shortlist_recall.values()):
+        print("Recall@shortlist (FlashRank): " + ", ".join(
+            f"{s}: {v:.3f}" for s, v in shortlist_recall.items() if v is not None
+        ))
+    for stage, row in cache_stats().get("rerank_stages", {}).items():
+        print(f"Rerank stage {stage}: avg {row['avg_ms']:.1f} мс, max {row['max_ms']:.1f} мс ({row['count']} вызовов)")
+    for name, cache in cache_stats().items():
+        if isinstance(cache, dict) and cache.get("hit_ratio") is not None:
+            print(f"Кэш {name}: hit ratio {cache['hit_ratio']:.3f} ({cache['hits']}/{cache['hits'] + cache['misses']})")
     return results
 
 
@@ -0,0 +1,605 @@
+# benchmark_components.py — микро-бенчмарки отдельных компонентов retrieval (без LLM и Pinecone)
+
+"""
+Запуск:
+  python benchmark_components.py bm25 [--repeat 20] [--k 20]
+  python benchmark_components.py rerank-batching [--concurrency 1,8,16] [--candidates 24]
+  python benchmark_components.py embeddings [--sample 400] [--repeat 5]
+  python benchmark_components.py reranker [--candidates 24] [--top 8]
+  python benchmark_components.py stemming [--repeat 50]
+  python benchmark_components.py chunk-store [--workers 4] [--top 200]
+
+bm25 — BM25Retriever (rank_bm25) против предсобранного BM25-индекса (bm25_index.py):
+       плотный скоринг по постингам, CSR mat-vec и block-max прунинг top-k, на реальном корпусе documents/
+       и вопросах из test_queries.json + BENCHMARK_QUESTIONS (benchmark.py).
+rerank-batching — пропускная способность BGE reranker'а при N параллельных чатах: прямые вызовы
+       compute_score против BatchingReranker (reranker_service.py); кандидаты — BM25 top-N по корпусу.
+embeddings — паритет и latency ONNX int8 (onnx_engines.py) против fp32 HuggingFaceEmbeddings:
+       косинус между векторами на выборке корпуса и вопросах, совпадение top-10, время embed_query.
+reranker — движки reranker'а (flag fp32 без лимита длины как эталон, flag с лимитом, onnx int8):
+       latency на пару и совпадение top-8 с эталоном на вопросах test_queries.json.
+stemming — Snowball на каждый токен против мемо словоформ (text_processing.StemMemo): стемминг корпуса,
+       сборка BM25-индекса, предобработка вопроса с мемо корпуса, размер и загрузка сохранённой таблицы.
+chunk-store — память воркеров: pickle списка Document против колоночного mmap-хранилища (chunk_store.py).
+       N процессов одновременно загружают чанки, строят индекс статей и читают top-N документов;
+       RSS/PSS/USS каждого — из /proc/self/smaps_rollup (PSS делит общие mmap-страницы между воркерами).
+
+Результаты печатаются и сохраняются в benchmark_results/components_<имя>_<время>.json.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import pickle
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+import config
+
+
+def _load_chunks() -> list:
+    """Чанки реального корпуса documents/ (как в build_vector_db.py), без вывода prepare_data."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import prepare_data
+    return prepare_data.chunks
+
+
+def _benchmark_queries() -> List[str]:
+    from benchmark import BENCHMARK_QUESTIONS, TEST_QUERIES_PATH
+
+    queries: List[str] = []
+    if TEST_QUERIES_PATH.exists():
+        with open(TEST_QUERIES_PATH, "r", encoding="utf-8") as f:
+            queries.extend((item.get("query") or "").strip() for item in json.load(f))
+    queries.extend(item["query"] for item in BENCHMARK_QUESTIONS)
+    return [q for q in queries if q]
+
+
+def _time_ms(fn: Callable[[], Any], repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def _summary(times: List[float]) -> Dict[str, float]:
+    ordered = sorted(times)
+    return {
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+
+
+def _save(name: str, payload: Dict[str, Any]) -> None:
+    config.BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    path = config.BENCHMARK_DIR / f"components_{name}_{timestamp}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены: {path}")
+
+
+def run_bm25_benchmark(repeat: int = 20, k: int = 20) -> Dict[str, Any]:
+    from langchain_community.retrievers import BM25Retriever
+
+    from bm25_index import BM25Index, PrebuiltBM25Retriever, build_bm25_index
+    from text_processing import BM25_PREPROCESS_NAME, bm25_tokenize
+
+    chunks = _load_chunks()
+    texts = [c.page_content for c in chunks]
+    queries = _benchmark_queries()
+    print(f"Корпус: {len(chunks)} чанков, вопросов: {len(queries)}, повторов: {repeat}, k={k}")
+
+    start = time.perf_counter()
+    reference = BM25Retriever.from_documents(chunks, preprocess_func=bm25_tokenize, k=k)
+    reference_build_sec = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        build_bm25_index(tmp, texts, preprocess_func=bm25_tokenize, preprocess_name=BM25_PREPROCESS_NAME)
+        index_build_sec = time.perf_counter() - start
+        start = time.perf_counter()
+        index = BM25Index.load(tmp)
+        index_load_sec = time.perf_counter() - start
+
+        def _dense_top(scores: np.ndarray) -> List[int]:
+            top = np.argsort(scores)[::-1][:k]
+            return [int(i) for i in top if scores[i] > 0]
+
+        engines: Dict[str, Callable[[List[str]], List[int]]] = {
+            "rank_bm25": lambda tokens: _dense_top(reference.vectorizer.get_scores(tokens)),
+            "postings_dense": lambda tokens: _dense_top(index.get_scores(tokens)),
+            "csr_matvec": lambda tokens: [doc_id for doc_id, _ in index.top_k(tokens, k)],
+            "block_max_pruned": lambda tokens: [doc_id for doc_id, _ in index.top_k_pruned(tokens, k)],
+        }
+        timings: Dict[str, List[float]] = {name: [] for name in engines}
+        overlap: Dict[str, List[float]] = {name: [] for name in engines}
+        scanned_ratio: List[float] = []
+        for query in queries:
+            # Токенизация одинакова для всех движков — меряем только скоринг и top-k
+            tokens = bm25_tokenize(query)
+            stats: Dict[str, int] = {}
+            index.top_k_pruned(tokens, k, stats=stats)
+            if stats.get("postings_total"):
+                scanned_ratio.append(stats["postings_scanned"] / stats["postings_total"])
+            expected = set(engines["rank_bm25"](tokens))
+            for name, engine in engines.items():
+                timings[name].extend(_time_ms(lambda: engine(tokens), repeat))
+                got = engine(tokens)
+                overlap[name].append(len(expected & set(got)) / len(expected) if expected else 1.0)
+
+        # Паритет на уровне ретривера (то, что получает EnsembleRetriever): число кандидатов и их состав
+        prebuilt = PrebuiltBM25Retriever.load(
+            tmp, docs=chunks, preprocess_func=bm25_tokenize, preprocess_name=BM25_PREPROCESS_NAME, k=k
+        )
+        count_mismatch = 0
+        positive_mismatch = 0
+        for query in queries:
+            ref_docs = reference.invoke(query)
+            got_docs = prebuilt.invoke(query)
+            count_mismatch += len(ref_docs) != len(got_docs)
+            scores = reference.vectorizer.get_scores(bm25_tokenize(query))
+            ref_positive = {i for i in np.flatnonzero(scores > 0) if chunks[i] in ref_docs}
+            got_ids = {id(d) for d in got_docs}
+            positive_mismatch += any(id(chunks[i]) not in got_ids for i in ref_positive)
+
+    report = {
+        "corpus_chunks": len(chunks),
+        "queries": len(queries),
+        "repeat": repeat,
+        "k": k,
+        "build_sec": {"rank_bm25": round(reference_build_sec, 3), "prebuilt_index": round(index_build_sec, 3)},
+        "index_load_sec": round(index_load_sec, 4),
+        "pruned_postings_scanned_ratio": round(statistics.fmean(scanned_ratio), 4) if scanned_ratio else None,
+        "retriever_count_mismatch": count_mismatch,
+        "retriever_positive_mismatch": positive_mismatch,
+        "engines": {
+            name: {**_summary(times), f"overlap@{k}_vs_rank_bm25": round(statistics.fmean(overlap[name]), 4)}
+            for name, times in timings.items()
+        },
+    }
+
+    print(f"\nСборка: rank_bm25 {reference_build_sec:.2f} с, предсобранный индекс {index_build_sec:.2f} с "
+          f"(загрузка {index_load_sec * 1000:.1f} мс)")
+    base = report["engines"]["rank_bm25"]["mean_ms"]
+    for name, row in report["engines"].items():
+        speedup = base / row["mean_ms"] if row["mean_ms"] else float("inf")
+        print(f"  {name:16s} mean={row['mean_ms']:8.3f} мс  p50={row['p50_ms']:8.3f}  p95={row['p95_ms']:8.3f}  "
+              f"x{speedup:6.1f}  overlap@{k}={row[f'overlap@{k}_vs_rank_bm25']:.3f}")
+    print(f"Ретривер против BM25Retriever: другое число кандидатов — {count_mismatch}, "
+          f"потеряны документы с оценкой > 0 — {positive_mismatch} из {len(queries)} вопросов")
+    if report["pruned_postings_scanned_ratio"] is not None:
+        print(f"Прунинг: прочитано {report['pruned_postings_scanned_ratio']:.1%} постингов терминов запроса")
+    _save("bm25", report)
+    return report
+
+
+def _rerank_candidates(queries: List[str], n: int) -> List[List[List[str]]]:
+    """Пары [запрос, чанк] для reranker'а: BM25 top-n по реальному корпусу (без Pinecone и эмбеддингов)."""
+    from bm25_index import BM25Index, build_bm25_index
+    from text_processing import BM25_PREPROCESS_NAME, bm25_tokenize
+
+    chunks = _load_chunks()
+    texts = [c.page_content for c in chunks]
+    try:
+        index = BM25Index.load(config.BM25_INDEX_DIR)
+        if not index.matches(texts, BM25_PREPROCESS_NAME):
+            raise ValueError("индекс устарел")
+        return [[[q, texts[i]] for i, _ in index.top_k(bm25_tokenize(q), n)] for q in queries]
+    except Exception:
+        with tempfile.TemporaryDirectory() as tmp:
+            build_bm25_index(tmp, texts, preprocess_func=bm25_tokenize, preprocess_name=BM25_PREPROCESS_NAME)
+            index = BM25Index.load(tmp)
+            return [[[q, texts[i]] for i, _ in index.top_k(bm25_tokenize(q), n)] for q in queries]
+
+
+def run_rerank_batching_benchmark(concurrency: List[int], candidates: int = 24) -> Dict[str, Any]:
+    from reranker_service import BatchingReranker, load_reranker_scorer
+
+    queries = _benchmark_queries()
+    requests = [pairs for pairs in _rerank_candidates(queries, candidates) if pairs]
+    print(f"Запросов: {len(requests)}, пар на запрос: до {candidates}")
+    compute_score = load_reranker_scorer(
+        "BAAI/bge-reranker-v2-m3",
+        engine=config.RERANKER_ENGINE,
+        max_length=config.RERANKER_MAX_LENGTH,
+        threads=config.RERANKER_THREADS,
+    )
+    compute_score(requests[0][:2])  # прогрев
+
+    def _run(score: Callable[[List[List[str]]], Any], workers: int) -> Dict[str, Any]:
+        latencies: List[float] = []
+        outputs: List[Any] = [None] * len(requests)
+
+        def _one(i: int) -> None:
+            start = time.perf_counter()
+            outputs[i] = score(requests[i])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_one, range(len(requests))))
+        wall = time.perf_counter() - start
+        return {"wall_sec": round(wall, 3), "requests_per_sec": round(len(requests) / wall, 3),
+                **_summary(latencies), "_outputs": outputs}
+
+    report: Dict[str, Any] = {"requests": len(requests), "candidates": candidates, "runs": {}}
+    for workers in concurrency:
+        service = BatchingReranker(
+            compute_score,
+            max_batch_pairs=config.RERANK_MAX_BATCH_PAIRS,
+            max_wait_ms=config.RERANK_BATCH_WINDOW_MS,
+        )
+        direct = _run(compute_score, workers)
+        batched = _run(service.score, workers)
+        max_diff = max(
+            float(np.max(np.abs(np.atleast_1d(np.asarray(a, dtype=float)) - np.asarray(b, dtype=float))))
+            for a, b in zip(direct.pop("_outputs"), batched.pop("_outputs"))
+        )
+        report["runs"][str(workers)] = {
+            "direct": direct, "batched": batched, "batching": service.stats(), "max_score_diff": round(max_diff, 5),
+        }
+        print(f"  concurrency={workers:3d}  direct {direct['requests_per_sec']:7.2f} req/s "
+              f"(p95 {direct['p95_ms']:.0f} мс)  batched {batched['requests_per_sec']:7.2f} req/s "
+              f"(p95 {batched['p95_ms']:.0f} мс)  пар/батч {service.stats()['avg_pairs_per_batch']}  "
+              f"max|Δscore|={max_diff:.4f}")
+    _save("rerank_batching", report)
+    return report
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def run_embeddings_benchmark(sample: int = 400, repeat: int = 5, k: int = 10) -> Dict[str, Any]:
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from onnx_engines import OnnxEmbeddings
+
+    chunks = _load_chunks()
+    step = max(1, len(chunks) // sample)
+    passages = ["passage: " + c.page_content for c in chunks[::step][:sample]]
+    queries = ["query: " + q for q in _benchmark_queries()]
+    print(f"Выборка корпуса: {len(passages)} чанков, вопросов: {len(queries)}")
+
+    config.configure_hf_hub()
+    engines = {
+        "torch_fp32": HuggingFaceEmbeddings(
+            model_name=config.EMBEDDING_MODEL,
+            encode_kwargs={"normalize_embeddings": True},
+            cache_folder=config.HF_CACHE_DIR,
+        ),
+        "onnx_int8": OnnxEmbeddings(config.EMBEDDING_MODEL, quantize=True),
+    }
+    vectors = {
+        name: (np.asarray(e.embed_documents(passages)), np.asarray([e.embed_query(q) for q in queries]))
+        for name, e in engines.items()
+    }
+    ref_p, ref_q = vectors["torch_fp32"]
+    cand_p, cand_q = vectors["onnx_int8"]
+    passage_cos = _cosine_rows(ref_p, cand_p)
+    query_cos = _cosine_rows(ref_q, cand_q)
+    # Поиск по fp32-индексу (как в проде после build_vector_db.py) запросами обоих движков
+    ref_top = np.argsort(-(ref_q @ ref_p.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_q @ ref_p.T), axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]
+
+    latency = {
+        name: _summary([t for q in queries for t in _time_ms(lambda: e.embed_query(q), repeat)])
+        for name, e in engines.items()
+    }
+    report = {
+        "model": config.EMBEDDING_MODEL,
+        "passages": len(passages),
+        "queries": len(queries),
+        "parity": {
+            "passage_cosine_mean": round(float(passage_cos.mean()), 5),
+            "passage_cosine_min": round(float(passage_cos.min()), 5),
+            "query_cosine_mean": round(float(query_cos.mean()), 5),
+            "query_cosine_min": round(float(query_cos.min()), 5),
+            f"top{k}_overlap_vs_fp32": round(statistics.fmean(overlap), 4),
+        },
+        "embed_query_latency": latency,
+    }
+    print(f"Паритет: cos(passages) mean={report['parity']['passage_cosine_mean']:.4f} "
+          f"min={report['parity']['passage_cosine_min']:.4f}, cos(queries) mean={report['parity']['query_cosine_mean']:.4f}, "
+          f"top{k} overlap={report['parity'][f'top{k}_overlap_vs_fp32']:.3f}")
+    for name, row in latency.items():
+        print(f"  {name:12s} embed_query mean={row['mean_ms']:8.2f} мс  p50={row['p50_ms']:8.2f}  p95={row['p95_ms']:8.2f}")
+    _save("embeddings", report)
+    return report
+
+
+def run_reranker_benchmark(candidates: int = 24, top: int = 8) -> Dict[str, Any]:
+    from benchmark import TEST_QUERIES_PATH
+    from reranker_service import load_reranker_scorer
+
+    with open(TEST_QUERIES_PATH, "r", encoding="utf-8") as f:
+        queries = [q for q in ((item.get("query") or "").strip() for item in json.load(f)) if q]
+    requests = [pairs for pairs in _rerank_candidates(queries, candidates) if pairs]
+    print(f"Вопросов test_queries.json: {len(requests)}, кандидатов: до {candidates}, top-{top}")
+
+    model_name = "BAAI/bge-reranker-v2-m3"
+    max_length = config.RERANKER_MAX_LENGTH
+    engines = {
+        # Эталон — текущее поведение по точности: полный fp32 без обрезки чанков до max_length
+        "flag_fp32_full": ("flag", 8192),
+        f"flag_fp32_max{max_length}": ("flag", max_length),
+        f"onnx_int8_max{max_length}": ("onnx", max_length),
+    }
+    report: Dict[str, Any] = {"queries": len(requests), "candidates": candidates, "top": top, "engines": {}}
+    reference: List[List[int]] = []
+    for name, (engine, length) in engines.items():
+        try:
+            score = load_reranker_scorer(model_name, engine=engine, max_length=length, threads=config.RERANKER_THREADS)
+        except Exception as exc:
+            print(f"  {name}: пропущен ({exc})")
+            continue
+        score(requests[0][:2])  # прогрев
+        per_pair: List[float] = []
+        tops: List[List[int]] = []
+        for pairs in requests:
+            start = time.perf_counter()
+            scores = np.atleast_1d(np.asarray(score(pairs), dtype=float))
+            per_pair.append((time.perf_counter() - start) * 1000 / len(pairs))
+            tops.append([int(i) for i in np.argsort(-scores)[:top]])
+        if not reference:
+            reference = tops
+        agreement = [len(set(a) & set(b)) / len(a) for a, b in zip(reference, tops) if a]
+        report["engines"][name] = {
+            "per_pair": _summary(per_pair),
+            f"top{top}_agreement": round(statistics.fmean(agreement), 4),
+        }
+        row = report["engines"][name]
+        print(f"  {name:22s} на пару mean={row['per_pair']['mean_ms']:7.2f} мс  p95={row['per_pair']['p95_ms']:7.2f}  "
+              f"top{top} agreement={row[f'top{top}_agreement']:.3f}")
+    _save("reranker", report)
+    return report
+
+
+def run_stemming_benchmark(repeat: int = 50) -> Dict[str, Any]:
+    from bm25_index import build_bm25_index
+    from text_processing import StemMemo, stem_memo
+    from word_tokenizer import word_tokenize
+
+    if stem_memo is None:
+        raise SystemExit("NLTK не установлен — стемминг выключен, сравнивать нечего")
+    stem_fn = stem_memo.stem_fn
+    texts = [c.page_content for c in _load_chunks()]
+    queries = _benchmark_queries()
+    print(f"Корпус: {len(texts)} чанков, вопросов: {len(queries)}, повторов: {repeat}")
+
+    def tokens_of(text: str) -> List[str]:
+        return [t for t in word_tokenize(text.lower()) if t.isalnum()]
+
+    def plain(text: str) -> List[str]:
+        return [stem_fn(t) for t in tokens_of(text)]
+
+    start = time.perf_counter()
+    corpus_tokens = [tokens_of(t) for t in texts]
+    tokenize_sec = time.perf_counter() - start
+    n_tokens = sum(len(t) for t in corpus_tokens)
+
+    start = time.perf_counter()
+    plain_stems = [[stem_fn(t) for t in tokens] for tokens in corpus_tokens]
+    stem_plain_sec = time.perf_counter() - start
+    cold = StemMemo(stem_fn, name=stem_memo.name)
+    start = time.perf_counter()
+    memo_stems = [cold.stem_tokens(tokens) for tokens in corpus_tokens]
+    stem_memo_sec = time.perf_counter() - start
+    if memo_stems != plain_stems:
+        raise SystemExit("Мемо дал другие основы, чем Snowball")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memo_path = Path(tmp) / "stem_memo.json"
+        cold.save(memo_path)
+        warm = StemMemo(stem_fn, name=stem_memo.name)
+        start = time.perf_counter()
+        warm.load(memo_path)
+        memo_load_sec = time.perf_counter() - start
+        memo_file_mb = memo_path.stat().st_size / 1024**2
+
+        build_sec: Dict[str, float] = {}
+        for name, preprocess in (
+            ("snowball", plain),
+            ("stem_memo", lambda text, memo=StemMemo(stem_fn, name=stem_memo.name): memo.stem_tokens(tokens_of(text))),
+        ):
+            start = time.perf_counter()
+            build_bm25_index(Path(tmp) / name, texts, preprocess_func=preprocess, preprocess_name=stem_memo.name)
+            build_sec[name] = round(time.perf_counter() - start, 3)
+
+    query_times: Dict[str, List[float]] = {"snowball": [], "stem_memo": []}
+    for query in queries:
+        query_times["snowball"].extend(_time_ms(lambda: plain(query), repeat))
+        query_times["stem_memo"].extend(_time_ms(lambda: warm.stem_tokens(tokens_of(query)), repeat))
+    query_hits = warm.stats()
+
+    report = {
+        "corpus_chunks": len(texts),
+        "corpus_tokens": n_tokens,
+        "vocabulary": len(cold.table),
+        "corpus_preprocess_sec": {
+            "tokenize": round(tokenize_sec, 3),
+            "stem_snowball": round(stem_plain_sec, 3),
+            "stem_memo_cold": round(stem_memo_sec, 3),
+        },
+        "bm25_index_build_sec": build_sec,
+        "memo_file_mb": round(memo_file_mb, 2),
+        "memo_load_ms": round(memo_load_sec * 1000, 2),
+        "query_preprocess": {name: _summary(times) for name, times in query_times.items()},
+        "query_memo_hit_ratio": query_hits["hit_ratio"],
+    }
+
+    print(f"\nТокенов: {n_tokens}, словоформ: {len(cold.table)} (мемо {memo_file_mb:.2f} МБ, загрузка {memo_load_sec * 1000:.1f} мс)")
+    print(f"Корпус: токенизация {tokenize_sec:.2f} с; стемминг Snowball {stem_plain_sec:.2f} с → мемо {stem_memo_sec:.2f} с")
+    print(f"Сборка BM25-индекса: Snowball {build_sec['snowball']:.2f} с → мемо {build_sec['stem_memo']:.2f} с")
+    for name, row in report["query_preprocess"].items():
+        print(f"  запрос {name:10s} mean={row['mean_ms']:7.3f} мс  p50={row['p50_ms']:7.3f}  p95={row['p95_ms']:7.3f}")
+    print(f"Попадания мемо корпуса по словоформам запросов: {query_hits['hit_ratio']:.1%}")
+    _save("stemming", report)
+    return report
+
+
+def _memory_mb() -> Dict[str, float]:
+    """RSS / PSS / USS текущего процесса (Linux, /proc/self/smaps_rollup), МБ."""
+    fields: Dict[str, float] = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": round(fields.get("Rss", 0.0), 1),
+        "pss": round(fields.get("Pss", 0.0), 1),
+        "uss": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def _chunk_store_worker(mode: str, path: str, top: int, barrier: Any, results: Any) -> None:
+    """Воркер chunk-store: загрузка чанков + ArticleIndex + чтение top документов, замер до и после."""
+    import gc
+
+    from article_index import ArticleIndex
+    from chunk_store import ChunkStore
+
+    gc.collect()
+    before = _memory_mb()
+    start = time.perf_counter()
+    if mode == "pickle":
+        with open(path, "rb") as f:
+            docs = pickle.load(f)
+    else:
+        docs = ChunkStore.load(path)
+    index = ArticleIndex(docs)
+    load_sec = time.perf_counter() - start
+    rows = random.Random(0).sample(range(len(docs)), min(top, len(docs)))
+    start = time.perf_counter()
+    chars = sum(len(docs[i].page_content) for i in rows)
+    fetch_ms = (time.perf_counter() - start) * 1000
+    gc.collect()
+    # Все воркеры живы одновременно: PSS честно делит общие страницы
+    barrier.wait()
+    after = _memory_mb()
+    barrier.wait()
+    results.put({
+        "mode": mode, "before": before, "after": after, "load_sec": load_sec,
+        "fetch_ms": fetch_ms, "chars": chars, "keys": len(index),
+    })
+
+
+def run_chunk_store_benchmark(workers: int = 4, top: int = 200) -> Dict[str, Any]:
+    from chunk_store import ChunkStore
+
+    chunks = _load_chunks()
+    print(f"Корпус: {len(chunks)} чанков, воркеров: {workers}, чтение top-{top}")
+    report: Dict[str, Any] = {"corpus_chunks": len(chunks), "workers": workers, "top": top, "modes": {}}
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        pkl_path = Path(tmp) / "chunks_for_bm25.pkl"
+        with open(pkl_path, "wb") as f:
+            pickle.dump(chunks, f)
+        store = ChunkStore.build(Path(tmp) / "chunk_store", chunks)
+        if any(store[i] != chunks[i] for i in range(len(chunks))):
+            raise SystemExit("ChunkStore вернул другие документы, чем pickle")
+        report["pickle_mb"] = round(pkl_path.stat().st_size / 1024**2, 2)
+        report["store_mb"] = round(sum(p.stat().st_size for p in store.directory.iterdir()) / 1024**2, 2)
+        del store
+
+        for mode, path in (("pickle", pkl_path), ("chunk_store", Path(tmp) / "chunk_store")):
+            barrier = ctx.Barrier(workers)
+            results = ctx.Queue()
+            procs = [
+                ctx.Process(target=_chunk_store_worker, args=(mode, str(path), top, barrier, results))
+                for _ in range(workers)
+            ]
+            for proc in procs:
+                proc.start()
+            rows = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+
+            def mean(stage: str, key: str, rows=rows) -> float:
+                return round(statistics.fmean(r[stage][key] for r in rows), 1)
+
+            report["modes"][mode] = {
+                "rss_before_mb": mean("before", "rss"),
+                "rss_after_mb": mean("after", "rss"),
+                "pss_after_mb": mean("after", "pss"),
+                "uss_after_mb": mean("after", "uss"),
+                "uss_delta_mb": round(mean("after", "uss") - mean("before", "uss"), 1),
+                "load_sec": round(statistics.fmean(r["load_sec"] for r in rows), 3),
+                "fetch_top_ms": round(statistics.fmean(r["fetch_ms"] for r in rows), 2),
+                "article_keys": rows[0]["keys"],
+            }
+
+    print(f"\nНа диске: pickle {report['pickle_mb']} МБ, chunk_store {report['store_mb']} МБ")
+    print(f"{'режим':12s} {'RSS до':>8s} {'RSS после':>10s} {'PSS':>8s} {'USS':>8s} {'ΔUSS':>8s} {'загрузка':>9s} {'top':>8s}")
+    for mode, row in report["modes"].items():
+        print(
+            f"{mode:12s} {row['rss_before_mb']:8.1f} {row['rss_after_mb']:10.1f} {row['pss_after_mb']:8.1f} "
+            f"{row['uss_after_mb']:8.1f} {row['uss_delta_mb']:8.1f} {row['load_sec']:8.3f}с {row['fetch_top_ms']:6.2f}мс"
+        )
+    _save("chunk_store", report)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Микро-бенчмарки компонентов Legal RAG")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bm25 = sub.add_parser("bm25", help="BM25Retriever против предсобранного CSR-индекса")
+    bm25.add_argument("--repeat", type=int, default=20)
+    bm25.add_argument("--k", type=int, default=getattr(config, "HYBRID_K", 20))
+
+    batching = sub.add_parser("rerank-batching", help="Пропускная способность reranker'а: прямые вызовы против микро-батчинга")
+    batching.add_argument("--concurrency", default="1,8,16", help="Число параллельных чатов через запятую")
+    batching.add_argument("--candidates", type=int, default=24)
+
+    emb = sub.add_parser("embeddings", help="ONNX int8 эмбеддинги против fp32: паритет и latency")
+    emb.add_argument("--sample", type=int, default=400)
+    emb.add_argument("--repeat", type=int, default=5)
+
+    rr = sub.add_parser("reranker", help="Движки reranker'а: latency на пару и совпадение top-8")
+    rr.add_argument("--candidates", type=int, default=24)
+    rr.add_argument("--top", type=int, default=8)
+
+    stem = sub.add_parser("stemming", help="Стемминг для BM25: Snowball на каждый токен против мемо словоформ")
+    stem.add_argument("--repeat", type=int, default=50)
+
+    cs = sub.add_parser("chunk-store", help="Память воркеров: pickle списка Document против mmap-хранилища чанков")
+    cs.add_argument("--workers", type=int, default=4)
+    cs.add_argument("--top", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == "bm25":
+        run_bm25_benchmark(repeat=args.repeat, k=args.k)
+    elif args.command == "rerank-batching":
+        levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+        run_rerank_batching_benchmark(levels, candidates=args.candidates)
+    elif args.command == "embeddings":
+        run_embeddings_benchmark(sample=args.sample, repeat=args.repeat)
+    elif args.command == "reranker":
+        run_reranker_benchmark(candidates=args.candidates, top=args.top)
+    elif args.command == "stemming":
+        run_stemming_benchmark(repeat=args.repeat)
+    elif args.command == "chunk-store":
+        run_chunk_store_benchmark(workers=args.workers, top=args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+# bm25_index.py — предсобранный BM25-индекс: словарь, df, длины документов, постинги в numpy
+
+"""
+Собирается в build_vector_db.py один раз, в рантайме открывается через mmap за миллисекунды
+вместо BM25Retriever.from_documents (токенизация + стемминг всего корпуса при каждом старте).
+
+Формат каталога (config.BM25_INDEX_DIR):
+  meta.json        — версия формата, параметры BM25, число документов, схема предобработки
+  vocab.json       — список термов; позиция в списке = term_id
+  postings_ptr.npy — int64 [V + 1], границы постингов терма (CSR по термам)
+  postings_doc.npy — int32 [P], номера документов (по возрастанию внутри терма)
+  postings_tf.npy  — uint16 [P], частота терма в документе
+  postings_w.npy   — float32 [P], готовый вклад постинга в BM25 (idf * насыщенный tf с нормировкой длины)
+  doc_len.npy      — int32 [N], длина документа в токенах
+  block_ptr.npy    — int64 [V + 1], границы блоков терма (по BLOCK_SIZE постингов)
+  block_last.npy   — int32 [B], последний doc_id блока
+  block_max.npy    — float32 [B], максимальный вес постинга в блоке (верхняя граница для прунинга)
+
+Массивы ptr/doc/w — это CSR-матрица терм×документ весов BM25: оценка запроса —
+одно разреженное умножение вектора запроса на матрицу (scipy), затем argpartition по top-k.
+Для top-k есть и динамический прунинг (block-max MaxScore, см. BM25Index.top_k_pruned):
+читаются только постинги, блоки которых ещё могут попасть в текущий top-k.
+Скоринг совпадает с rank_bm25.BM25Okapi (k1=1.5, b=0.75, epsilon=0.25), который стоит за BM25Retriever.
+Номера документов совпадают с порядком чанков в хранилище чанков (chunk_store.ChunkStore).
+Файлы лежат в подкаталоге текущей версии (index_dirs.py): пересборка пишет новую версию и атомарно
+переключает на неё, не трогая файлы, открытые воркерами; новый индекс воркер видит после перезапуска.
+"""
+
+import hashlib
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy as np
+try:
+    from scipy import sparse
+except ImportError:  # без scipy — тот же результат циклом по постингам терминов запроса
+    sparse = None
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from index_dirs import current_version, new_version
+
+FORMAT_VERSION = 3
+META_FILE = "meta.json"
+VOCAB_FILE = "vocab.json"
+PTR_FILE = "postings_ptr.npy"
+DOC_FILE = "postings_doc.npy"
+TF_FILE = "postings_tf.npy"
+WEIGHT_FILE = "postings_w.npy"
+DOC_LEN_FILE = "doc_len.npy"
+BLOCK_PTR_FILE = "block_ptr.npy"
+BLOCK_LAST_FILE = "block_last.npy"
+BLOCK_MAX_FILE = "block_max.npy"
+_INDEX_FILES = (
+    META_FILE, VOCAB_FILE, PTR_FILE, DOC_FILE, TF_FILE, WEIGHT_FILE, DOC_LEN_FILE,
+    BLOCK_PTR_FILE, BLOCK_LAST_FILE, BLOCK_MAX_FILE,
+)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+# Постингов в блоке block-max: меньше — точнее границы, больше — меньше накладных расходов
+BLOCK_SIZE = 64
+
+
+def corpus_fingerprint(texts: Sequence[str]) -> str:
+    """Дешёвый отпечаток корпуса (число и длины текстов) — ловит рассинхрон индекса и чанков."""
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    return hashlib.sha1(lengths.tobytes()).hexdigest()
+
+
+def _okapi_idf(df: np.ndarray, n_docs: int) -> np.ndarray:
+    """idf как в rank_bm25.BM25Okapi: отрицательные idf заменяются на epsilon * средний idf."""
+    df = np.asarray(df, dtype=np.float64)
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    average_idf = float(idf.mean()) if idf.size else 0.0
+    idf[idf < 0] = BM25_EPSILON * average_idf
+    return idf
+
+
+def _length_norm(doc_len: np.ndarray) -> np.ndarray:
+    """Знаменатель BM25 без tf: k1 * (1 - b + b * |d| / avgdl)."""
+    avgdl = float(doc_len.sum()) / max(len(doc_len), 1)
+    return BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(doc_len, dtype=np.float64) / avgdl)
+
+
+def _build_blocks(
+    ptr: np.ndarray, post_doc: np.ndarray, weights: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Режет постинги каждого терма на блоки по BLOCK_SIZE: (block_ptr, последний doc_id, max вес)."""
+    lengths = np.diff(ptr)
+    n_blocks = (lengths + BLOCK_SIZE - 1) // BLOCK_SIZE
+    block_ptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(n_blocks, out=block_ptr[1:])
+    block_term = np.repeat(np.arange(len(lengths)), n_blocks)
+    block_in_term = np.arange(int(block_ptr[-1])) - np.repeat(block_ptr[:-1], n_blocks)
+    block_start = ptr[block_term] + block_in_term * BLOCK_SIZE
+    block_end = np.minimum(block_start + BLOCK_SIZE, ptr[block_term + 1])
+    if len(block_start):
+        block_max = np.maximum.reduceat(weights, block_start).astype(np.float32)
+    else:
+        block_max = np.zeros(0, dtype=np.float32)
+    return block_ptr, post_doc[block_end - 1].astype(np.int32), block_max
+
+
+def build_bm25_index(
+    directory: str | Path,
+    texts: Sequence[str],
+    preprocess_func: Callable[[str], List[str]],
+    preprocess_name: str,
+) -> None:
+    """Токенизирует корпус один раз и записывает компактные массивы BM25 новой версией directory (index_dirs.py)."""
+    vocab: dict[str, int] = {}
+    term_ids: list[int] = []
+    doc_ids: list[int] = []
+    tfs: list[int] = []
+    doc_len = np.zeros(len(texts), dtype=np.int32)
+    for doc_id, text in enumerate(texts):
+        tokens = preprocess_func(text)
+        doc_len[doc_id] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(doc_id)
+            tfs.append(tf)
+
+    terms = np.asarray(term_ids, dtype=np.int64)
+    docs = np.asarray(doc_ids, dtype=np.int32)
+    # Сортировка по (терм, документ): постинги каждого терма лежат подряд и по возрастанию doc_id
+    order = np.lexsort((docs, terms))
+    ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=len(vocab)), out=ptr[1:])
+
+    post_doc = docs[order]
+    post_tf = np.minimum(np.asarray(tfs, dtype=np.int64), np.iinfo(np.uint16).max)[order].astype(np.uint16)
+
+    # Веса BM25 считаются один раз здесь, а не на каждый запрос
+    idf = _okapi_idf(np.diff(ptr), len(texts))
+    length_norm = _length_norm(doc_len)
+    post_term = np.repeat(np.arange(len(vocab)), np.diff(ptr))
+    tf = post_tf.astype(np.float64)
+    weights = idf[post_term] * tf * (BM25_K1 + 1) / (tf + length_norm[post_doc])
+
+    with new_version(directory, _INDEX_FILES) as target:
+        np.save(target / PTR_FILE, ptr)
+        np.save(target / DOC_FILE, post_doc)
+        np.save(target / TF_FILE, post_tf)
+        np.save(target / WEIGHT_FILE, weights.astype(np.float32))
+        np.save(target / DOC_LEN_FILE, doc_len)
+        block_ptr, block_last, block_max = _build_blocks(ptr, post_doc, weights)
+        np.save(target / BLOCK_PTR_FILE, block_ptr)
+        np.save(target / BLOCK_LAST_FILE, block_last)
+        np.save(target / BLOCK_MAX_FILE, block_max)
+        with open(target / VOCAB_FILE, "w", encoding="utf-8") as f:
+            json.dump(list(vocab), f, ensure_ascii=False)
+        with open(target / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "format_version": FORMAT_VERSION,
+                    "n_docs": len(texts),
+                    "n_terms": len(vocab),
+                    "n_postings": int(len(docs)),
+                    "k1": BM25_K1,
+                    "b": BM25_B,
+                    "epsilon": BM25_EPSILON,
+                    "block_size": BLOCK_SIZE,
+                    "preprocess": preprocess_name,
+                    "fingerprint": corpus_fingerprint(texts),
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+class BM25Index:
+    """Только чтение: массивы открыты через mmap, веса BM25 предрасчитаны при сборке."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = current_version(directory)
+        with open(self.directory / META_FILE, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия BM25-индекса: {self.meta.get('format_version')}")
+        with open(self.directory / VOCAB_FILE, "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        self.vocab: dict[str, int] = {t: i for i, t in enumerate(terms)}
+
+        self.ptr = np.load(self.directory / PTR_FILE, mmap_mode="r")
+        self.post_doc = np.load(self.directory / DOC_FILE, mmap_mode="r")
+        self.post_tf = np.load(self.directory / TF_FILE, mmap_mode="r")
+        self.post_w = np.load(self.directory / WEIGHT_FILE, mmap_mode="r")
+        self.doc_len = np.load(self.directory / DOC_LEN_FILE, mmap_mode="r")
+
+        self.block_ptr = np.load(self.directory / BLOCK_PTR_FILE, mmap_mode="r")
+        self.block_last = np.load(self.directory / BLOCK_LAST_FILE, mmap_mode="r")
+        self.block_max = np.load(self.directory / BLOCK_MAX_FILE, mmap_mode="r")
+
+        self.n_docs = int(self.meta["n_docs"])
+        self.n_terms = len(self.vocab)
+        # Верхняя граница вклада терма (max по его блокам) — для упорядочивания в MaxScore
+        self.term_max = np.zeros(self.n_terms, dtype=np.float32)
+        non_empty = np.flatnonzero(np.diff(self.block_ptr) > 0)
+        if len(non_empty):
+            self.term_max[non_empty] = np.maximum.reduceat(self.block_max, self.block_ptr[non_empty])
+
+        # CSR терм×документ поверх mmap-массивов (indptr приводится к int32, если помещается)
+        self.matrix = None
+        if sparse is not None:
+            index_dtype = np.int32 if len(self.post_doc) < np.iinfo(np.int32).max else np.int64
+            self.matrix = sparse.csr_matrix(
+                (self.post_w, self.post_doc, np.asarray(self.ptr, dtype=index_dtype)),
+                shape=(self.n_terms, self.n_docs),
+                copy=False,
+            )
+
+    @classmethod
+    def load(cls, directory: str | Path) -> "BM25Index":
+        if not (current_version(directory) / META_FILE).exists():
+            raise FileNotFoundError(f"BM25-индекс не найден в {directory}. Запустите: python build_vector_db.py")
+        return cls(directory)
+
+    def matches(self, texts: Sequence[str], preprocess_name: str) -> bool:
+        return self.matches_fingerprint(len(texts), corpus_fingerprint(texts), preprocess_name)
+
+    def matches_fingerprint(self, n_docs: int, fingerprint: str, preprocess_name: str) -> bool:
+        return (
+            self.n_docs == n_docs
+            and self.meta.get("preprocess") == preprocess_name
+            and self.meta.get("fingerprint") == fingerprint
+        )
+
+    def _query_vector(self, tokens: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        """(term_ids, qtf): разреженный вектор запроса; повтор терма учитывается, как в rank_bm25."""
+        counts: dict[int, int] = {}
+        for term in tokens:
+            tid = self.vocab.get(term)
+            if tid is not None:
+                counts[tid] = counts.get(tid, 0) + 1
+        term_ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        qtf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return term_ids, qtf
+
+    def score_candidates(self, tokens: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        """(doc_ids, scores) только документов, где встретился хотя бы один терм запроса."""
+        term_ids, qtf = self._query_vector(tokens)
+        if not len(term_ids):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.matrix is not None:
+            query = sparse.csr_matrix(
+                (qtf, (np.zeros(len(term_ids), dtype=np.int64), term_ids)), shape=(1, self.n_terms)
+            )
+            row = (query @ self.matrix).tocsr()
+            return row.indices, row.data
+        scores = self.get_scores(tokens)
+        doc_ids = np.flatnonzero(scores)
+        return doc_ids, scores[doc_ids]
+
+    def get_scores(self, tokens: Sequence[str]) -> np.ndarray:
+        """Плотный вектор оценок BM25 всех документов (поэлементно по постингам терминов запроса)."""
+        scores = np.zeros(self.n_docs, dtype=np.float64)
+        term_ids, qtf = self._query_vector(tokens)
+        for tid, weight in zip(term_ids, qtf):
+            start, end = int(self.ptr[tid]), int(self.ptr[tid + 1])
+            scores[self.post_doc[start:end]] += weight * self.post_w[start:end]
+        return scores
+
+    def top_k(self, tokens: Sequence[str], k: int) -> list[tuple[int, float]]:
+        """(doc_id, score) лучших k документов с положительной оценкой, по убыванию."""
+        doc_ids, scores = self.score_candidates(tokens)
+        k = min(k, len(doc_ids))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(doc_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def top_k_pruned(self, tokens: Sequence[str], k: int, stats: Optional[dict] = None) -> list[tuple[int, float]]:
+        """
+        Тот же top-k, что и top_k, но с динамическим прунингом (block-max MaxScore).
+
+        Термы обрабатываются по убыванию верхней границы вклада. theta — k-я лучшая частичная
+        оценка среди кандидатов (нижняя граница финального порога). Блок постингов терма
+        «открыт» для новых документов, только если max вес блока + границы оставшихся термов >= theta;
+        иначе в нём проверяются лишь уже известные кандидаты (searchsorted), а кандидаты,
+        которые даже с границей блока не дотягивают до theta, отбрасываются.
+        Редкие термы с высоким idf идут первыми и быстро поднимают theta, поэтому длинные
+        постинги частых термов (длинные казахские кейсы) почти не читаются целиком.
+        """
+        term_ids, qtf = self._query_vector(tokens)
+        if k <= 0 or not len(term_ids):
+            return []
+        bounds = qtf * self.term_max[term_ids]
+        order = np.argsort(-bounds, kind="stable")
+        term_ids, qtf, bounds = term_ids[order], qtf[order], bounds[order]
+        # remaining[i] — сумма верхних границ термов после i-го
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1][1:], [0.0]])
+
+        cand_docs = np.zeros(0, dtype=np.int64)
+        cand_scores = np.zeros(0, dtype=np.float64)
+        theta = 0.0
+        scanned = 0
+        for tid, weight, rest in zip(term_ids, qtf, remaining):
+            start, end = int(self.ptr[tid]), int(self.ptr[tid + 1])
+            b_start, b_end = int(self.block_ptr[tid]), int(self.block_ptr[tid + 1])
+            block_bound = weight * self.block_max[b_start:b_end]
+            is_open = block_bound + rest >= theta
+
+            # 1) Открытые блоки: все постинги (новые документы могут войти в top-k)
+            if is_open.all():
+                new_docs = np.asarray(self.post_doc[start:end], dtype=np.int64)
+                new_scores = weight * np.asarray(self.post_w[start:end], dtype=np.float64)
+            else:
+                open_blocks = np.flatnonzero(is_open)
+                pos_start = start + open_blocks * BLOCK_SIZE
+                pos_end = np.minimum(pos_start + BLOCK_SIZE, end)
+                positions = _ranges(pos_start, pos_end)
+                new_docs = np.asarray(self.post_doc[positions], dtype=np.int64)
+                new_scores = weight * np.asarray(self.post_w[positions], dtype=np.float64)
+            scanned += len(new_docs)
+
+            # 2) Закрытые блоки: только уже известные кандидаты, и только если ещё могут дотянуть
+            keep = np.ones(len(cand_docs), dtype=bool)
+            if len(cand_docs) and not is_open.all():
+                cand_block = np.searchsorted(self.block_last[b_start:b_end], cand_docs)
+                in_term = cand_block < (b_end - b_start)
+                closed = in_term.copy()
+                closed[in_term] = ~is_open[cand_block[in_term]]
+                bound = cand_scores[closed] + block_bound[cand_block[closed]] + rest
+                alive = bound >= theta
+                closed_idx = np.flatnonzero(closed)
+                keep[closed_idx[~alive]] = False
+                probe = closed_idx[alive]
+                if len(probe):
+                    postings = self.post_doc[start:end]
+                    pos = np.searchsorted(postings, cand_docs[probe])
+                    pos_ok = pos < len(postings)
+                    hit = np.zeros(len(probe), dtype=bool)
+                    hit[pos_ok] = postings[pos[pos_ok]] == cand_docs[probe[pos_ok]]
+                    cand_scores[probe[hit]] += weight * self.post_w[start + pos[hit]]
+                    scanned += len(probe)
+            cand_docs, cand_scores = cand_docs[keep], cand_scores[keep]
+
+            # 3) Слияние кандидатов с открытыми постингами
+            if len(new_docs):
+                merged_docs = np.concatenate([cand_docs, new_docs])
+                merged_scores = np.concatenate([cand_scores, new_scores])
+                cand_docs, inverse = np.unique(merged_docs, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=merged_scores, minlength=len(cand_docs))
+
+            # 4) Новый порог и отсев кандидатов, которым не хватит даже всех оставшихся термов
+            if len(cand_docs) >= k:
+                theta = float(np.partition(cand_scores, len(cand_scores) - k)[len(cand_scores) - k])
+                viable = cand_scores + rest >= theta
+                cand_docs, cand_scores = cand_docs[viable], cand_scores[viable]
+
+        if stats is not None:
+            stats["postings_total"] = int(sum(int(self.ptr[t + 1] - self.ptr[t]) for t in term_ids))
+            stats["postings_scanned"] = scanned
+        k = min(k, len(cand_docs))
+        if k <= 0:
+            return []
+        top = np.argpartition(-cand_scores, k - 1)[:k] if k < len(cand_scores) else np.arange(len(cand_scores))
+        top = top[np.argsort(-cand_scores[top], kind="stable")]
+        return [(int(cand_docs[i]), float(cand_scores[i])) for i in top if cand_scores[i] > 0]
+
+
+def pad_top_k(hits: list[tuple[int, float]], k: int, n_docs: int) -> list[tuple[int, float]]:
+    """Добивает top-k документами с нулевой оценкой (по порядку индекса), как BM25Retriever/rank_bm25:
+    тот всегда отдаёт k документов, даже если терм запроса встретился в меньшем числе чанков."""
+    if len(hits) >= k or len(hits) >= n_docs:
+        return hits
+    seen = {doc_id for doc_id, _ in hits}
+    padded = list(hits)
+    for doc_id in range(n_docs):
+        if len(padded) >= k:
+            break
+        if doc_id not in seen:
+            padded.append((doc_id, 0.0))
+    return padded
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Конкатенация np.arange(s, e) для пар (s, e) без цикла Python."""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total, dtype=np.int64) + offsets
+
+
+class PrebuiltBM25Retriever(BaseRetriever):
+    """Замена BM25Retriever поверх BM25Index: возвращает те же объекты Document из чанков."""
+    index: Any
+    docs: Any
+    preprocess_func: Callable[[str], List[str]]
+    k: int = 4
+    pruning: bool = True
+
+    @classmethod
+    def load(
+        cls,
+        directory: str | Path,
+        docs: Sequence[Document],
+        preprocess_func: Callable[[str], List[str]],
+        preprocess_name: str,
+        k: int = 4,
+        pruning: bool = True,
+    ) -> "PrebuiltBM25Retriever":
+        index = BM25Index.load(directory)
+        # ChunkStore знает отпечаток корпуса без декодирования текстов
+        if hasattr(docs, "corpus_fingerprint"):
+            fingerprint = docs.corpus_fingerprint()
+        else:
+            fingerprint = corpus_fingerprint([d.page_content for d in docs])
+        if not index.matches_fingerprint(len(docs), fingerprint, preprocess_name):
+            raise ValueError("BM25-индекс не соответствует чанкам (корпус или токенизация изменились).")
+        return cls(index=index, docs=docs, preprocess_func=preprocess_func, k=k, pruning=pruning)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        tokens = self.preprocess_func(query)
+        hits = self.index.top_k_pruned(tokens, self.k) if self.pruning else self.index.top_k(tokens, self.k)
+        # Ансамбль получает столько же BM25-кандидатов, сколько от BM25Retriever
+        hits = pad_top_k(hits, self.k, self.index.n_docs)
+        return [self.docs[doc_id] for doc_id, _ in hits]
@@ -1,13 +1,11 @@
-# build_vector_db.py — Pinecone: чанки из documents/ (парсинг с Adilet)
+# build_vector_db.py — Pinecone (или локальный mmap-индекс): чанки из documents/ (парсинг с Adilet)
 # Если обновили documents/ (например, перекачали УК РК): очистите namespace в Pinecone
 # или удалите индекс и создайте заново, затем запустите этот скрипт (иначе будут дубликаты).
 
-import pickle
 import os
 import time
 
 import config
-from langchain_pinecone import PineconeVectorStore
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 from prepare_data import chunks, raw_docs
@@ -59,43 +57,48 @@ def _make_embeddings() -> PrefixedEmbeddings:
 
 embeddings = _make_embeddings()
 
-api_key = os.environ.get("PINECONE_API_KEY")
-if not api_key:
-    raise SystemExit("Задайте PINECONE_API_KEY: export PINECONE_API_KEY=...")
-
-from pinecone import Pinecone, ServerlessSpec
-pc = Pinecone(api_key=api_key)
-
-index_name = config.PINECONE_INDEX_NAME
-namespace = config.PINECONE_NAMESPACE or "default"
-
-existing = [i.name for i in pc.list_indexes()]
-if index_name not in existing:
-    print(f"Создаём индекс {index_name}...")
-    try:
-        pc.create_index(
-            name=index_name,
-            dimension=config.PINECONE_DIMENSION,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-        print("Индекс создан. Ожидание готовности...")
-        while not pc.describe_index(index_name).status.get("ready"):
-            time.sleep(2)
-        print("Индекс готов.")
-    except Exception as e:
-        if "already exists" in str(e).lower():
-            print("Индекс уже существует.")
-        else:
-            raise e
+vector_store = None
+if config.VECTOR_BACKEND == "local":
+    print(f"Векторный бэкенд: local ({config.LOCAL_INDEX_DIR}), Pinecone не используется")
+else:
+    api_key = os.environ.get("PINECONE_API_KEY")
+    if not api_key:
+        raise SystemExit("Задайте PINECONE_API_KEY: export PINECONE_API_KEY=...")
+
+    from langchain_pinecone import PineconeVectorStore
+    from pinecone import Pinecone, ServerlessSpec
+    pc = Pinecone(api_key=api_key)
+
+    index_name = config.PINECONE_INDEX_NAME
+    namespace = config.PINECONE_NAMESPACE or "default"
+
+    existing = [i.name for i in pc.list_indexes()]
+    if index_name not in existing:
+        print(f"Создаём индекс {index_name}...")
+        try:
+            pc.create_index(
+                name=index_name,
+                dimension=config.PINECONE_DIMENSION,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+            print("Индекс создан. Ожидание готовности...")
+            while not pc.describe_index(index_name).status.get("ready"):
+                time.sleep(2)
+            print("Индекс готов.")
+        except Exception as e:
+            if "already exists" in str(e).lower():
+                print("Индекс уже существует.")
+            else:
+                raise e
 
-print(f"Подключение к индексу {index_name} (namespace: {namespace})")
+    print(f"Подключение к индексу {index_name} (namespace: {namespace})")
 
-vector_store = PineconeVectorStore(
-    index_name=index_name,
-    embedding=embeddings,
-    namespace=namespace
-)
+    vector_store = PineconeVectorStore(
+        index_name=index_name,
+        embedding=embeddings,
+        namespace=namespace
+    )
 
 import json
 
@@ -228,26 +231,59 @@ if max_total_est > 40960:
     print(f"\n⚠️  СТОП: оценка размера > 40 KB. Уменьшите MAX_PAGE_CONTENT_CHARS.")
     raise SystemExit("См. константы MAX_PAGE_CONTENT_CHARS / MAX_TEXT_IN_METADATA_BYTES выше.")
 
-print(f"Загрузка {len(clean_chunks)} чанков (пакетами по 50)...")
+if config.VECTOR_BACKEND == "local":
+    from local_vector_store import LocalVectorStore
 
-BATCH_SIZE = 50
-total_chunks = len(clean_chunks)
+    print(f"Сборка локального индекса из {len(clean_chunks)} чанков в {config.LOCAL_INDEX_DIR}...")
+    vector_store = LocalVectorStore.build(config.LOCAL_INDEX_DIR, clean_chunks, embeddings)
+else:
+    print(f"Загрузка {len(clean_chunks)} чанков (пакетами по 50)...")
+
+    BATCH_SIZE = 50
+    total_chunks = len(clean_chunks)
+
+    for i in range(0, total_chunks, BATCH_SIZE):
+        batch = clean_chunks[i : i + BATCH_SIZE]
+        print(f"   Бач {i // BATCH_SIZE + 1}/{(total_chunks + BATCH_SIZE - 1) // BATCH_SIZE}: документы {i} - {i + len(batch)}")
+        try:
+            vector_store.add_documents(batch, batch_size=32)
+        except Exception as e:
+            print(f"❌ Ошибка в баче {i}: {e}")
+            # Можно добавить break или continue, в зависимости от желаемого поведения
+            # Пока просто логируем и идем дальше (или останавливаемся, если критично)
+
+# Сохраняем очищенные чанки для BM25 и индекса статей: колоночное mmap-хранилище вместо pickle списка Document
+from chunk_store import ChunkStore
+
+ChunkStore.build(config.CHUNK_STORE_DIR, clean_chunks)
+print(f"Хранилище чанков: {len(clean_chunks)} → {config.CHUNK_STORE_DIR}")
+
+# Предсобранный BM25: токенизация и стемминг корпуса один раз здесь, а не при каждом старте rag_chain
+from bm25_index import build_bm25_index
+from text_processing import BM25_PREPROCESS_NAME, bm25_tokenize, stem_memo
+
+print(f"Сборка BM25-индекса в {config.BM25_INDEX_DIR}...")
+_bm25_start = time.perf_counter()
+build_bm25_index(
+    config.BM25_INDEX_DIR,
+    [c.page_content for c in clean_chunks],
+    preprocess_func=bm25_tokenize,
+    preprocess_name=BM25_PREPROCESS_NAME,
+)
+print(f"BM25-индекс готов за {time.perf_counter() - _bm25_start:.1f} с")
+if stem_memo is not None:
+    # Основы словоформ корпуса — рядом с чанками: rag_chain не стеммит их заново на запросах
+    stem_memo.save()
+    print(f"Мемо стемминга: {stem_memo.stats()['size']} словоформ → {config.STEM_MEMO_PATH.name}")
 
-for i in range(0, total_chunks, BATCH_SIZE):
-    batch = clean_chunks[i : i + BATCH_SIZE]
-    print(f"   Бач {i // BATCH_SIZE + 1}/{(total_chunks + BATCH_SIZE - 1) // BATCH_SIZE}: документы {i} - {i + len(batch)}")
-    try:
-        vector_store.add_documents(batch, batch_size=32)
-    except Exception as e:
-        print(f"❌ Ошибка в баче {i}: {e}")
-        # Можно добавить break или continue, в зависимости от желаемого поведения
-        # Пока просто логируем и идем дальше (или останавливаемся, если критично)
+# Новая версия корпуса: кэши рантайма (эмбеддинги, ответы) перестают отдавать старые значения
+from caches import bump_corpus_version
 
-# Сохраняем очищенные чанки для BM25
-with open(config.CHUNKS_PICKLE_PATH, "wb") as f:
-    pickle.dump(clean_chunks, f)
+print(f"Версия корпуса: {bump_corpus_version()}")
+# Индексы записаны новыми версиями каталогов (index_dirs.py): запущенные воркеры дочитывают прежние
+print("Перезапустите api.py / Streamlit, чтобы воркеры открыли новые индексы.")
 
-print("База Pinecone создана!")
+print("Локальный индекс создан!" if config.VECTOR_BACKEND == "local" else "База Pinecone создана!")
 print(f"Документов: {len(raw_docs)}")
 print(f"Чанков: {len(chunks)}")
 
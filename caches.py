@@ -0,0 +1,392 @@
+# caches.py — общие in-memory кэши (LRU + TTL, счётчики попаданий) и версия корпуса для ключей кэшей
+
+import json
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+import config
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Потокобезопасный LRU с ограничением размера, опциональным TTL и счётчиками hit/miss/evictions."""
+
+    def __init__(self, maxsize: int, name: str = "", ttl_sec: Optional[float] = None):
+        self.maxsize = max(0, int(maxsize))
+        self.name = name
+        self.ttl_sec = ttl_sec if ttl_sec and ttl_sec > 0 else None
+        # key -> (value, момент истечения или None)
+        self._data: "OrderedDict[Hashable, tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Ключи, которые сейчас вычисляются: второй поток ждёт первый, а не считает заново
+        self._inflight: dict[Hashable, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key: Hashable) -> Any:
+        """Значение по ключу или _MISSING (вызывать под self._lock); просроченные записи удаляются."""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize == 0:
+            return
+        expires_at = time.monotonic() + self.ttl_sec if self.ttl_sec else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Значение из кэша или compute(); одновременные промахи по одному ключу считаются один раз."""
+        while True:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    self.hits += 1
+                    return value
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self.misses += 1
+                    event = self._inflight[key] = threading.Event()
+                    break
+            waiter.wait()
+        try:
+            value = compute()
+            self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+class SemanticCache:
+    """Кэш по близости векторов: значение прошлого запроса, если косинус с ним >= threshold.
+
+    Векторы хранятся в одной матрице [maxsize, dim] (поиск — один mat-vec, точный, без ANN-индекса:
+    при тысячах записей это доли миллисекунды). Переиспользование — только среди записей с тем же
+    signature (маршрут промпта, фокусные статьи, история, модель, версия корпуса).
+    Вытеснение — по кругу (самая старая запись), TTL как у LRUCache.
+
+    Метрики: hits / misses, гистограмма лучшей близости на каждом поиске (для подбора порога),
+    near_misses (чуть ниже порога) и выборка попаданий для аудита ложных срабатываний:
+    пары (новый запрос, запрос из кэша, близость) — доля audit_rate попаданий, последние audit_size.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        threshold: float,
+        name: str = "",
+        ttl_sec: Optional[float] = None,
+        histogram_bins: Sequence[float] = (0.80, 0.85, 0.90, 0.92, 0.94, 0.96, 0.98, 0.99),
+        audit_rate: float = 1.0,
+        audit_size: int = 100,
+        near_miss_margin: float = 0.02,
+    ):
+        self.maxsize = max(0, int(maxsize))
+        self.threshold = threshold
+        self.name = name
+        self.ttl_sec = ttl_sec if ttl_sec and ttl_sec > 0 else None
+        self.histogram_bins = list(histogram_bins)
+        self.audit_rate = audit_rate
+        self.near_miss_margin = near_miss_margin
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        # signature → int id; по строкам — id signature (-1 — пустая/удалённая запись).
+        # В signature входит дайджест истории, поэтому id считаются по строкам и удаляются вместе
+        # с последней строкой — иначе словарь в долгоживущем API только растёт
+        self._signature_ids: dict = {}
+        self._signature_refs: dict = {}  # id → [signature, число строк]
+        self._next_signature_id = 0
+        self._row_signature = np.full(self.maxsize, -1, dtype=np.int64)
+        self._row_expires = np.full(self.maxsize, np.inf)  # monotonic-время истечения строки (inf — без TTL)
+        self._entries: List[Optional[tuple]] = [None] * self.maxsize
+        self._next = 0
+        self._size = 0
+        self._histogram = [0] * (len(self.histogram_bins) + 1)
+        self._audit: deque = deque(maxlen=audit_size)
+        self.hits = 0
+        self.misses = 0
+        self.near_misses = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else v
+
+    def get(self, vector: Sequence[float], signature: Hashable, query: str = "") -> Any:
+        """Значение ближайшей записи с тем же signature (или None, если близость ниже порога)."""
+        if self.maxsize == 0:
+            return None
+        v = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            best, best_sim = -1, -1.0
+            sid = self._signature_ids.get(signature)
+            if sid is not None and self._vectors is not None and self._size:
+                rows = self._row_signature[: self._size] == sid
+                # Истёкшие строки этого signature убираем до выбора лучшей: иначе истёкший ближайший
+                # сосед скрыл бы живую запись, которая тоже выше порога
+                expired = rows & (self._row_expires[: self._size] <= now)
+                for j in np.flatnonzero(expired):
+                    self._drop(int(j))
+                    self.expirations += 1
+                rows &= ~expired
+                if rows.any():
+                    sims = self._vectors[: self._size] @ v
+                    sims[~rows] = -np.inf
+                    best = int(np.argmax(sims))
+                    best_sim = float(sims[best])
+            if best >= 0:
+                self._histogram[sum(best_sim >= b for b in self.histogram_bins)] += 1
+            if best < 0 or best_sim < self.threshold:
+                self.misses += 1
+                if best >= 0 and best_sim >= self.threshold - self.near_miss_margin:
+                    self.near_misses += 1
+                return None
+            self.hits += 1
+            cached_query, _, value = self._entries[best]
+            if random.random() < self.audit_rate:
+                self._audit.append({
+                    "query": query, "cached_query": cached_query, "similarity": round(best_sim, 4),
+                    "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                })
+            return value
+
+    def has_signature(self, signature: Hashable) -> bool:
+        """Есть ли живые записи с этим signature (иначе get() заведомо промахнётся — вектор можно не считать)."""
+        with self._lock:
+            return signature in self._signature_ids
+
+    def put(self, vector: Sequence[float], signature: Hashable, value: Any, query: str = "") -> None:
+        if self.maxsize == 0:
+            return
+        v = self._unit(vector)
+        expires_at = time.monotonic() + self.ttl_sec if self.ttl_sec else None
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != v.shape[0]:
+                self._vectors = np.zeros((self.maxsize, v.shape[0]), dtype=np.float32)
+                self._reset()
+            i = self._next
+            self._drop(i)
+            sid = self._signature_ids.get(signature)
+            if sid is None:
+                sid = self._signature_ids[signature] = self._next_signature_id
+                self._signature_refs[sid] = [signature, 0]
+                self._next_signature_id += 1
+            self._signature_refs[sid][1] += 1
+            self._vectors[i] = v
+            self._row_signature[i] = sid
+            self._row_expires[i] = expires_at if expires_at is not None else np.inf
+            self._entries[i] = (query, expires_at, value)
+            self._next = (i + 1) % self.maxsize
+            self._size = max(self._size, i + 1)
+
+    def _drop(self, i: int) -> None:
+        # Запись остаётся в матрице, но не совпадёт ни с одним signature
+        sid = int(self._row_signature[i])
+        self._row_signature[i] = -1
+        self._entries[i] = None
+        if sid < 0:
+            return
+        ref = self._signature_refs[sid]
+        ref[1] -= 1
+        if ref[1] == 0:
+            del self._signature_refs[sid]
+            del self._signature_ids[ref[0]]
+
+    def _reset(self) -> None:
+        self._signature_ids.clear()
+        self._signature_refs.clear()
+        self._next_signature_id = 0
+        self._row_signature[:] = -1
+        self._entries = [None] * self.maxsize
+        self._next = self._size = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            bins = self.histogram_bins
+            edges = [f"<{bins[0]}"] + [f"{lo}-{hi}" for lo, hi in zip(bins, bins[1:])] + [f">={bins[-1]}"]
+            return {
+                "name": self.name,
+                "size": sum(1 for e in self._entries[: self._size] if e is not None),
+                "maxsize": self.maxsize,
+                "signatures": len(self._signature_ids),
+                "threshold": self.threshold,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "near_misses": self.near_misses,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+                "best_similarity_histogram": dict(zip(edges, self._histogram)),
+                "audit": list(self._audit),
+            }
+
+
+# ---------------- Версия корпуса/индекса ----------------
+# build_vector_db.py пишет новый id после каждой пересборки; ключи кэшей включают его,
+# поэтому все воркеры перестают отдавать устаревшие значения без перезапуска.
+
+_version_lock = threading.Lock()
+_version_cache: tuple[Optional[float], str] = (None, "")
+
+
+def corpus_version() -> str:
+    """Текущий id версии корпуса (перечитывается при изменении файла)."""
+    global _version_cache
+    path = config.INDEX_VERSION_PATH
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return "unversioned"
+    with _version_lock:
+        if _version_cache[0] == mtime:
+            return _version_cache[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                version = str(json.load(f).get("version") or "unversioned")
+        except Exception:
+            version = "unversioned"
+        _version_cache = (mtime, version)
+        return version
+
+
+def bump_corpus_version() -> str:
+    """Новый id версии корпуса — вызывается после пересборки индексов."""
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    with open(config.INDEX_VERSION_PATH, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f)
+    return version
+
+
+class PrecomputedResults:
+    """Значения для фиксированного набора ключей, посчитанные под конкретную версию корпуса.
+
+    compute() возвращает dict ключ → значение; считается в фоновом потоке при refresh() и заново,
+    как только corpus_version() меняется. Пока пересчёт не готов, get() возвращает None
+    (вызывающий идёт обычным путём), устаревшие значения не отдаются.
+    """
+
+    def __init__(self, compute: Callable[[], dict], name: str = ""):
+        self.compute = compute
+        self.name = name
+        self._lock = threading.Lock()
+        self._values: dict = {}
+        self._version: Optional[str] = None
+        self._building = False
+        self.hits = 0
+        self.misses = 0
+        self.build_sec: Optional[float] = None
+
+    def refresh(self, background: bool = True) -> None:
+        """Пересчитать значения под текущую версию корпуса (если ещё не посчитаны/не считаются)."""
+        version = corpus_version()
+        with self._lock:
+            if self._building or self._version == version:
+                return
+            self._building = True
+        if background:
+            threading.Thread(target=self._build, args=(version,), name=f"precompute-{self.name}", daemon=True).start()
+        else:
+            self._build(version)
+
+    def _build(self, version: str) -> None:
+        start = time.perf_counter()
+        try:
+            values = self.compute()
+        except Exception as exc:
+            print(f"Предвычисление {self.name} не удалось: {exc}")
+            values = None
+        with self._lock:
+            if values is not None:
+                self._values = values
+                self._version = version
+                self.build_sec = round(time.perf_counter() - start, 3)
+            self._building = False
+
+    def get(self, key: Hashable) -> Any:
+        if self._version != corpus_version():
+            with self._lock:
+                self.misses += 1
+            self.refresh()
+            return None
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._values),
+                "corpus_version": self._version,
+                "build_sec": self.build_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
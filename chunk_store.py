@@ -0,0 +1,171 @@
+# chunk_store.py — компактное колоночное хранилище чанков (mmap), вместо pickle списка Document
+
+"""
+chunks_for_bm25.pkl — десятки тысяч объектов Document, у каждого свой dict метаданных с одними и теми же
+строками code_ru / code_kz / source; каждый воркер держит полную копию в куче Python.
+
+Формат каталога (config.CHUNK_STORE_DIR, тот же, что у текстовой части локального векторного индекса):
+  texts.bin     — page_content всех чанков подряд в UTF-8
+  offsets.npy   — int64 [N + 1], байтовые границы текстов в texts.bin
+  lengths.npy   — int32 [N], длины текстов в символах (отпечаток корпуса для BM25 без декодирования)
+  metadata.json — таблицы значений метаданных по полям (интернированные строки)
+  meta_<i>.npy  — int32 [N], индекс значения поля в таблице (-1 — поля у чанка нет);
+                  номера статей — такой же типизированный столбец
+
+Массивы открываются с mmap_mode="r": воркеры делят страницы через page cache ОС.
+Сборка пишет новую версию каталога и атомарно переключает на неё (index_dirs.py): открытые
+воркерами файлы не перезаписываются, а новую версию воркер видит после перезапуска.
+Document создаётся только при обращении store[i] (для итогового top-k), каждый раз новый —
+reranker может писать в metadata, не задевая общие данные.
+"""
+
+import hashlib
+import json
+import mmap
+from collections.abc import Sequence as SequenceABC
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from index_dirs import current_version, new_version
+
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "offsets.npy"
+LENGTHS_FILE = "lengths.npy"
+METADATA_FILE = "metadata.json"
+FORMAT_VERSION = 1
+# Файлы плоского формата (до версий каталога) — удаляются после первой версионированной сборки
+LEGACY_FILES = (TEXTS_FILE, OFFSETS_FILE, LENGTHS_FILE, METADATA_FILE, "meta_*.npy")
+
+
+class ChunkStore(SequenceABC):
+    """Только для чтения: store[i] → Document, store.text(i), столбцы метаданных как int32-коды."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = current_version(directory)
+        with open(self.directory / METADATA_FILE, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Неподдерживаемая версия хранилища чанков: {meta.get('format_version')}. "
+                "Пересоберите: python build_vector_db.py"
+            )
+        self._offsets = np.load(self.directory / OFFSETS_FILE, mmap_mode="r")
+        self._texts: bytes | mmap.mmap = b""
+        if int(self._offsets[-1]) > 0:
+            with open(self.directory / TEXTS_FILE, "rb") as f:
+                # Срез mmap.mmap сразу даёт bytes — без промежуточного numpy-массива на каждый текст
+                self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        lengths_path = self.directory / LENGTHS_FILE
+        self._lengths = np.load(lengths_path, mmap_mode="r") if lengths_path.exists() else None
+        self.fields: List[str] = [c["name"] for c in meta["columns"]]
+        self._values: Dict[str, List[str]] = {c["name"]: c["values"] for c in meta["columns"]}
+        self._codes: Dict[str, np.ndarray] = {
+            c["name"]: np.load(self.directory / c["file"], mmap_mode="r") for c in meta["columns"]
+        }
+        self._value_ids: Optional[Dict[str, Dict[str, int]]] = None
+
+    # ------------------------------------------------------------------ build
+
+    @classmethod
+    def build(cls, directory: str | Path, documents: Sequence[Document]) -> "ChunkStore":
+        """Записывает тексты и метаданные новой версией directory и переключает на неё (векторы — забота LocalVectorStore)."""
+        with new_version(directory, LEGACY_FILES) as target:
+            cls.write(target, documents)
+        return cls(directory)
+
+    @staticmethod
+    def write(directory: Path, documents: Sequence[Document]) -> None:
+        """Файлы хранилища в пустой каталог directory, без версий — для сборщиков, которые версионируют сами."""
+        n = len(documents)
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        lengths = np.zeros(n, dtype=np.int32)
+        with open(directory / TEXTS_FILE, "wb") as f:
+            for i, doc in enumerate(documents):
+                raw = doc.page_content.encode("utf-8")
+                f.write(raw)
+                offsets[i + 1] = offsets[i] + len(raw)
+                lengths[i] = len(doc.page_content)
+        np.save(directory / OFFSETS_FILE, offsets)
+        np.save(directory / LENGTHS_FILE, lengths)
+
+        fields: List[str] = []
+        for doc in documents:
+            for key in doc.metadata:
+                if key not in fields:
+                    fields.append(key)
+        columns = []
+        for i, name in enumerate(fields):
+            values: List[str] = []
+            value_ids: Dict[str, int] = {}
+            codes = np.full(n, -1, dtype=np.int32)
+            for row, doc in enumerate(documents):
+                if name not in doc.metadata:
+                    continue
+                value = str(doc.metadata[name])
+                if value not in value_ids:
+                    value_ids[value] = len(values)
+                    values.append(value)
+                codes[row] = value_ids[value]
+            file_name = f"meta_{i}.npy"
+            np.save(directory / file_name, codes)
+            columns.append({"name": name, "file": file_name, "values": values})
+
+        with open(directory / METADATA_FILE, "w", encoding="utf-8") as f:
+            json.dump({"format_version": FORMAT_VERSION, "count": n, "columns": columns}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str | Path) -> "ChunkStore":
+        if not (current_version(directory) / METADATA_FILE).exists():
+            raise FileNotFoundError(f"Хранилище чанков не найдено в {directory}. Запустите: python build_vector_db.py")
+        return cls(directory)
+
+    # ------------------------------------------------------------------ access
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.document(i) for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return self.document(row)
+
+    def text(self, row: int) -> str:
+        start, end = self._offsets[row : row + 2].tolist()
+        return self._texts[start:end].decode("utf-8")
+
+    def metadata(self, row: int) -> dict:
+        meta = {}
+        for name in self.fields:
+            code = int(self._codes[name][row])
+            if code >= 0:
+                meta[name] = self._values[name][code]
+        return meta
+
+    def document(self, row: int) -> Document:
+        return Document(page_content=self.text(row), metadata=self.metadata(row))
+
+    def column(self, name: str) -> Tuple[Optional[np.ndarray], List[str]]:
+        """(int32-коды по чанкам, таблица значений) поля; (None, []) — поля нет ни у одного чанка."""
+        return self._codes.get(name), self._values.get(name, [])
+
+    def value_ids(self, name: str) -> Dict[str, int]:
+        """Обратная таблица значение → код (для фильтров)."""
+        if self._value_ids is None:
+            self._value_ids = {field: {v: i for i, v in enumerate(values)} for field, values in self._values.items()}
+        return self._value_ids.get(name, {})
+
+    def corpus_fingerprint(self) -> str:
+        """То же, что bm25_index.corpus_fingerprint(texts), без декодирования текстов."""
+        if self._lengths is not None:
+            lengths = np.asarray(self._lengths, dtype=np.int64)
+        else:
+            lengths = np.fromiter((len(self.text(i)) for i in range(len(self))), dtype=np.int64, count=len(self))
+        return hashlib.sha1(lengths.tobytes()).hexdigest()
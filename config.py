@@ -45,6 +45,10 @@ ADILET_SOURCES = [
 PINECONE_INDEX_NAME = os.environ.get("PINECONE_INDEX_NAME", "legal-rag")
 PINECONE_NAMESPACE = os.environ.get("PINECONE_NAMESPACE", "legal_kz")
 PINECONE_DIMENSION = 1024  # multilingual-e5-large
+# Векторный бэкенд: "pinecone" (облако) или "local" (точный поиск по mmap-индексу на диске).
+# Локальный индекс собирает build_vector_db.py при LEGAL_RAG_VECTOR_BACKEND=local.
+VECTOR_BACKEND = os.environ.get("LEGAL_RAG_VECTOR_BACKEND", "pinecone").strip().lower()
+LOCAL_INDEX_DIR = Path(os.environ.get("LEGAL_RAG_LOCAL_INDEX_DIR", str(BASE_DIR / "local_index")))
 
 # Эмбеддинги
 EMBEDDING_MODEL = os.environ.get("LEGAL_RAG_EMBEDDING", "intfloat/multilingual-e5-large")
@@ -53,6 +57,14 @@ HF_CONNECT_TIMEOUT_SEC = int(os.environ.get("LEGAL_RAG_HF_CONNECT_TIMEOUT_SEC",
 HF_OFFLINE = os.environ.get("LEGAL_RAG_HF_OFFLINE", os.environ.get("HF_HUB_OFFLINE", "0")) == "1"
 HF_LOCAL_ONLY = os.environ.get("LEGAL_RAG_HF_LOCAL_ONLY", "0") == "1"
 HF_CACHE_DIR = os.environ.get("LEGAL_RAG_HF_CACHE_DIR", "").strip() or None
+# LRU-кэш эмбеддингов запросов (ключ: модель + версия корпуса + текст); 0 — выключить
+EMBEDDING_CACHE_SIZE = int(os.environ.get("LEGAL_RAG_EMBEDDING_CACHE_SIZE", "2048"))
+# Движок эмбеддингов запросов: "torch" (HuggingFaceEmbeddings, fp32) или "onnx" (ONNX Runtime, int8; onnx_engines.py).
+# Перед включением сверить паритет: python benchmark_components.py embeddings
+EMBEDDING_ENGINE = os.environ.get("LEGAL_RAG_EMBEDDING_ENGINE", "torch").strip().lower()
+EMBEDDING_ONNX_QUANTIZE = os.environ.get("LEGAL_RAG_EMBEDDING_ONNX_QUANTIZE", "1") == "1"
+ONNX_DIR = Path(os.environ.get("LEGAL_RAG_ONNX_DIR", str(BASE_DIR / "onnx_models")))
+ONNX_THREADS = int(os.environ.get("LEGAL_RAG_ONNX_THREADS", "0"))  # 0 — по числу ядер
 
 
 def configure_hf_hub() -> None:
@@ -66,6 +78,17 @@ OLLAMA_BASE_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
 LLM_MODEL = os.environ.get("LEGAL_RAG_LLM", "llama-3.1-8b-instant")
 LLM_TEMPERATURE = 0.0
 LLM_MAX_TOKENS = int(os.environ.get("LEGAL_RAG_LLM_MAX_TOKENS", "2048"))
+# Кэш готовых ответов (invoke_qa / stream_qa): ключ — нормализованный вопрос, история, промпт, модель, версия корпуса.
+# 0 — выключить; пересборка индексов (build_vector_db.py → новая версия корпуса) сбрасывает кэш
+ANSWER_CACHE_SIZE = int(os.environ.get("LEGAL_RAG_ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_SEC = float(os.environ.get("LEGAL_RAG_ANSWER_CACHE_TTL_SEC", "21600"))
+# Семантический кэш ответов (caches.SemanticCache): перефразированный вопрос получает прошлый ответ, если косинус
+# e5-векторов >= SEMANTIC_CACHE_THRESHOLD и совпадают промпт, фокусные статьи и история. По умолчанию выключен:
+# порог подбирается по гистограмме близости и аудиту попаданий в /api/v1/stats (caches.semantic_answers)
+SEMANTIC_CACHE_SIZE = int(os.environ.get("LEGAL_RAG_SEMANTIC_CACHE_SIZE", "0"))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("LEGAL_RAG_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+# Доля попаданий, попадающих в выборку для ручной проверки (пары вопрос → вопрос из кэша)
+SEMANTIC_CACHE_AUDIT_RATE = float(os.environ.get("LEGAL_RAG_SEMANTIC_CACHE_AUDIT_RATE", "1.0"))
 # Контекст (ограничение длины для предотвращения 413/TPM)
 CONTEXT_MAX_DOCS = int(os.environ.get("LEGAL_RAG_CONTEXT_MAX_DOCS", "5"))
 CONTEXT_MAX_CHARS_PER_DOC = int(os.environ.get("LEGAL_RAG_CONTEXT_MAX_CHARS_PER_DOC", "1200"))
@@ -85,13 +108,72 @@ HYBRID_K = 20
 #   LEGAL_RAG_FILTER_ARTICLE_NUMBER="136"
 RETRIEVER_FILTER_CODE_RU = os.environ.get("LEGAL_RAG_FILTER_CODE_RU", None)
 RETRIEVER_FILTER_ARTICLE_NUMBER = os.environ.get("LEGAL_RAG_FILTER_ARTICLE_NUMBER", None)
+# Параллельные доп. поиски law-aware слоя (варианты code_ru, обстоятельства): пул потоков и таймаут на вызов
+# (от фактического старта поиска). Пул не меньше API_WORKERS × число поисков одного вызова (rag_chain._MAX_FANOUT)
+FANOUT_MAX_WORKERS = int(os.environ.get("LEGAL_RAG_FANOUT_MAX_WORKERS", "8"))
+FANOUT_TIMEOUT_SEC = float(os.environ.get("LEGAL_RAG_FANOUT_TIMEOUT_SEC", "10"))
+# api.py: пайплайн выполняется в ограниченном пуле потоков, а не в event loop. Сверх API_MAX_PENDING
+# запросов в работе (выполняются + ждут поток) новые сразу получают 503
+API_WORKERS = int(os.environ.get("LEGAL_RAG_API_WORKERS", "16"))
+API_MAX_PENDING = int(os.environ.get("LEGAL_RAG_API_MAX_PENDING", "64"))
+# Лимиты параллелизма стадий (stage_limits.py; 0 — без лимита): сколько вызовов модели одновременно.
+# Ожидание слота дольше STAGE_WAIT_SEC — StageBusy → 503 с Retry-After
+# (для эмбеддинга — не дольше FANOUT_TIMEOUT_SEC: он идёт и внутри параллельных доп. поисков)
+EMBEDDING_CONCURRENCY = int(os.environ.get("LEGAL_RAG_EMBEDDING_CONCURRENCY", "4"))
+RERANK_CONCURRENCY = int(os.environ.get("LEGAL_RAG_RERANK_CONCURRENCY", "8"))
+LLM_CONCURRENCY = int(os.environ.get("LEGAL_RAG_LLM_CONCURRENCY", "8"))
+STAGE_WAIT_SEC = float(os.environ.get("LEGAL_RAG_STAGE_WAIT_SEC", "30"))
+# Таблица триггеров эвристик запроса (query_features.py): признаки, подзапросы расширения, фокусные статьи
+QUERY_RULES_PATH = Path(os.environ.get("LEGAL_RAG_QUERY_RULES_PATH", str(BASE_DIR / "query_rules.json")))
+# Прямой поиск по (кодекс, статья) для явных ссылок ("ст. 136 УК РК"): без эмбеддингов и Pinecone.
+# Семантический retrieval добавляется, если в запросе есть не меньше ARTICLE_LOOKUP_MIN_FREE_WORDS содержательных слов
+ARTICLE_LOOKUP = os.environ.get("LEGAL_RAG_ARTICLE_LOOKUP", "1") == "1"
+ARTICLE_LOOKUP_MIN_FREE_WORDS = int(os.environ.get("LEGAL_RAG_ARTICLE_LOOKUP_MIN_FREE_WORDS", "1"))
+# Диапазоны статей ("ст. 120–135 УК"): скан индекса статей, упаковка в бюджет контекста RANGE_PROMPT
+RANGE_MAX_SPAN = int(os.environ.get("LEGAL_RAG_RANGE_MAX_SPAN", "60"))
+RANGE_CONTEXT_MAX_CHARS = int(os.environ.get("LEGAL_RAG_RANGE_CONTEXT_MAX_CHARS", "8000"))
+RANGE_MIN_CHARS_PER_ARTICLE = int(os.environ.get("LEGAL_RAG_RANGE_MIN_CHARS_PER_ARTICLE", "250"))
+# Предвычисление постоянных поисков law-aware слоя (обстоятельства) при старте, в фоне
+PRECOMPUTE_FIXED_QUERIES = os.environ.get("LEGAL_RAG_PRECOMPUTE_FIXED_QUERIES", "1") == "1"
+# Ленивая инициализация rag_chain: модели/индексы/LLM создаются при первом обращении (api.py прогревает их при старте).
+# 0 — прежнее поведение: всё загружается при импорте модуля
+LAZY_INIT = os.environ.get("LEGAL_RAG_LAZY_INIT", "1") == "1"
 BM25_WEIGHT = 0.6
 VECTOR_WEIGHT = 0.4
+# Колоночное хранилище чанков (chunk_store.py, mmap, общие страницы между воркерами) — для BM25 и индекса статей
+CHUNK_STORE_DIR = Path(os.environ.get("LEGAL_RAG_CHUNK_STORE_DIR", str(BASE_DIR / "chunk_store")))
+# Прежний pickle списка Document: читается, только если chunk_store ещё не собран
 CHUNKS_PICKLE_PATH = BASE_DIR / "chunks_for_bm25.pkl"
+# Таблица словоформа → основа Snowball для BM25 (text_processing.StemMemo): пишется build_vector_db.py рядом с чанками
+STEM_MEMO_PATH = Path(os.environ.get("LEGAL_RAG_STEM_MEMO_PATH", str(BASE_DIR / "stem_memo.json")))
+# Предсобранный BM25 (build_vector_db.py): в рантайме открывается через mmap без токенизации корпуса
+BM25_INDEX_DIR = Path(os.environ.get("LEGAL_RAG_BM25_INDEX_DIR", str(BASE_DIR / "bm25_index")))
+# Прунинг top-k (block-max MaxScore): "1" — всегда, "0" — полный CSR-скоринг,
+# "auto" — только на корпусах от BM25_PRUNING_MIN_DOCS чанков (на малых mat-vec дешевле)
+BM25_PRUNING = os.environ.get("LEGAL_RAG_BM25_PRUNING", "auto").strip().lower()
+BM25_PRUNING_MIN_DOCS = int(os.environ.get("LEGAL_RAG_BM25_PRUNING_MIN_DOCS", "50000"))
+# Версия корпуса: build_vector_db.py обновляет её после пересборки, кэши включают её в ключи
+INDEX_VERSION_PATH = Path(os.environ.get("LEGAL_RAG_INDEX_VERSION_PATH", str(BASE_DIR / "index_version.json")))
 
 # Reranker
 USE_RERANKER = os.environ.get("LEGAL_RAG_USE_RERANKER", "1") == "1"
+# Движок reranker'а: "flag" (FlagReranker/PyTorch; fp16 только на GPU) или "onnx" (ONNX Runtime int8, onnx_engines.py).
+# Пара обрезается до RERANKER_MAX_LENGTH токенов только за счёт чанка (запрос целиком).
+# RERANKER_THREADS — потоки CPU (0 — по умолчанию); для "flag" это torch.set_num_threads на весь процесс
+RERANKER_ENGINE = os.environ.get("LEGAL_RAG_RERANKER_ENGINE", "flag").strip().lower()
+RERANKER_MAX_LENGTH = int(os.environ.get("LEGAL_RAG_RERANKER_MAX_LENGTH", "384"))
+RERANKER_THREADS = int(os.environ.get("LEGAL_RAG_RERANKER_THREADS", "0"))
 FLASHRANK_MODEL = "ms-marco-MiniLM-L-12-v2"
+# Каскад reranker'а: FlashRank (FLASHRANK_MODEL) сужает кандидатов до RERANK_SHORTLIST_K, затем BGE-M3.
+# По умолчанию выключен: размер шортлиста подбирается по recall@shortlist из benchmark.py
+RERANK_CASCADE = os.environ.get("LEGAL_RAG_RERANK_CASCADE", "0") == "1"
+RERANK_SHORTLIST_K = int(os.environ.get("LEGAL_RAG_RERANK_SHORTLIST_K", "12"))
+# Кэш оценок reranker'а по парам (запрос, sha1 текста чанка): в модель идут только новые пары
+RERANK_CACHE_SIZE = int(os.environ.get("LEGAL_RAG_RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_TTL_SEC = float(os.environ.get("LEGAL_RAG_RERANK_CACHE_TTL_SEC", "86400"))
+# Микро-батчинг reranker'а (reranker_service.py): окно сбора пар от параллельных запросов и размер батча
+RERANK_BATCH_WINDOW_MS = float(os.environ.get("LEGAL_RAG_RERANK_BATCH_WINDOW_MS", "5"))
+RERANK_MAX_BATCH_PAIRS = int(os.environ.get("LEGAL_RAG_RERANK_MAX_BATCH_PAIRS", "128"))
 
 # Бенчмарк
 BENCHMARK_TIMEOUT_SEC = 300
@@ -0,0 +1,71 @@
+# index_dirs.py — версии каталогов индексов: сборка в новый подкаталог, атомарное переключение
+
+"""
+Сборщики индексов (ChunkStore.build, LocalVectorStore.build, build_bm25_index) раньше перезаписывали
+файлы на месте. Работающие воркеры держат эти файлы через mmap: при усечении файла они получают SIGBUS,
+а во время записи — наполовину записанные тексты и массивы.
+
+Теперь сборка пишет в новый подкаталог <directory>/v-<время>-<суффикс>. Только после того как все файлы
+записаны, файл <directory>/CURRENT с именем подкаталога заменяется через os.replace — атомарно,
+в том числе в Windows. Загрузчики открывают каталог из CURRENT (или сам directory — плоский формат
+прежних сборок). У каждого индекса свой каталог: две сборки в одном directory вытеснят версии друг друга.
+
+Воркер, открывший индекс раньше, читает свою версию целиком до конца: прежние файлы удаляются с диска,
+но открытые mmap остаются рабочими, пока процесс их держит (в Windows удалить открытые файлы нельзя —
+они удалятся при следующей сборке). Новую версию воркер видит только после перезапуска или перезагрузки
+компонентов: смена corpus_version сбрасывает кэши, но уже открытые индексы не переоткрывает.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Sequence
+
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v-"
+
+
+def current_version(directory: str | Path) -> Path:
+    """Каталог текущей версии индекса: <directory>/<CURRENT> или сам directory (плоский формат)."""
+    directory = Path(directory)
+    try:
+        name = (directory / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return directory
+    return directory / name
+
+
+@contextmanager
+def new_version(directory: str | Path, legacy_files: Sequence[str] = ()) -> Iterator[Path]:
+    """with new_version(directory) as target: ... — файлы пишутся в target, по выходе target становится текущей версией.
+
+    При исключении внутри with недописанный target удаляется, текущая версия не меняется.
+    После переключения удаляются прежние версии и файлы плоского формата по шаблонам legacy_files.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    target = Path(tempfile.mkdtemp(prefix=f"{VERSION_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-", dir=directory))
+    target.chmod(0o755)  # mkdtemp создаёт 0700 — воркеры под другим пользователем не прочли бы индекс
+    name = target.name
+    try:
+        yield target
+    except BaseException:
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+
+    pointer = directory / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+    pointer.write_text(name, encoding="utf-8")
+    os.replace(pointer, directory / CURRENT_FILE)
+
+    for old in directory.glob(f"{VERSION_PREFIX}*"):
+        if old.name != name and old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+    for pattern in legacy_files:
+        for path in directory.glob(pattern):
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,141 @@
+# load_test.py — нагрузочный тест api.py: пропускная способность при N параллельных клиентах
+
+"""
+Запуск (API уже поднят: python api.py):
+  python load_test.py [--url http://localhost:8000] [--concurrency 1,4,8,16] [--requests 32] [--endpoint chat]
+
+На каждом уровне параллелизма N клиентов отправляют вопросы из test_queries.json (по кругу),
+пока не уйдёт --requests запросов. Параллельно раз в 0.5 с опрашивается /api/v1/stats —
+его latency показывает, не блокирует ли пайплайн event loop.
+
+Печатается: запросов/с, p50/p95 latency, число 503 (перегрузка стадий или очереди), p95 /api/v1/stats.
+Результаты сохраняются в benchmark_results/load_test_<время>.json.
+
+Таблица «до/после» при переносе пайплайна из event loop в пул потоков (1 / 8 / 32 клиента:
+1.24 / 1.25 / 1.25 → 1.24 / 9.77 / 13.7 отв/с) снята на синтетическом пайплайне: invoke_qa подменён
+заглушкой (0.3 с «retrieval» + 0.5 с под слотом LLM, LLM_CONCURRENCY=8) — энкодера, reranker'а и Groq
+в той среде не было. Она показывает только, что event loop больше не блокируется; пропускную
+способность реального пути меряйте этим скриптом против api.py с загруженными моделями.
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+import requests
+
+import config
+
+ENDPOINTS = {
+    "chat": "/api/v1/internal-chat",
+    "eval": "/api/v1/generate-eval-data",
+}
+
+
+def _queries() -> List[str]:
+    with open(config.BASE_DIR / "test_queries.json", "r", encoding="utf-8") as f:
+        queries = [(item.get("query") or "").strip() for item in json.load(f)]
+    return [q for q in queries if q]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1)
+
+
+def run_level(url: str, path: str, queries: List[str], concurrency: int, total: int, timeout: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    stats_latencies: List[float] = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def one(i: int) -> None:
+        start = time.perf_counter()
+        try:
+            resp = requests.post(url + path, json={"query": queries[i % len(queries)]}, timeout=timeout)
+            status = str(resp.status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+
+    def poll_stats() -> None:
+        while not done.wait(0.5):
+            start = time.perf_counter()
+            try:
+                requests.get(url + "/api/v1/stats", timeout=timeout)
+            except requests.RequestException:
+                continue
+            stats_latencies.append((time.perf_counter() - start) * 1000)
+
+    poller = threading.Thread(target=poll_stats, daemon=True)
+    poller.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+    done.set()
+    poller.join()
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "wall_sec": round(wall, 2),
+        "ok_per_sec": round(len(latencies) / wall, 3),
+        "p50_ms": _percentile(latencies, 0.5),
+        "p95_ms": _percentile(latencies, 0.95),
+        "mean_ms": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+        "statuses": statuses,
+        "stats_p95_ms": _percentile(stats_latencies, 0.95),
+        "stats_max_ms": round(max(stats_latencies), 1) if stats_latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Legal RAG API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", default="1,4,8,16", help="Уровни параллелизма через запятую")
+    parser.add_argument("--requests", type=int, default=32, help="Запросов на уровень")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="chat")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    queries = _queries()
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    print(f"{url}{ENDPOINTS[args.endpoint]}: {len(queries)} вопросов, {args.requests} запросов на уровень")
+
+    rows = []
+    for level in levels:
+        row = run_level(url, ENDPOINTS[args.endpoint], queries, level, args.requests, args.timeout)
+        rows.append(row)
+        print(
+            f"  N={level:3d}  {row['ok_per_sec']:7.3f} отв/с  p50={row['p50_ms']:8.1f} мс  p95={row['p95_ms']:8.1f} мс  "
+            f"статусы={row['statuses']}  /stats p95={row['stats_p95_ms']:.1f} мс"
+        )
+
+    try:
+        server = requests.get(url + "/api/v1/stats", timeout=args.timeout).json()
+    except (requests.RequestException, ValueError):
+        server = {}
+    report = {"url": url, "endpoint": args.endpoint, "levels": rows, "server_stats": server}
+    config.BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    path = config.BENCHMARK_DIR / f"load_test_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены: {path}")
+
+
+if __name__ == "__main__":
+    main()
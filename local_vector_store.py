@@ -0,0 +1,247 @@
+# local_vector_store.py — локальный точный векторный поиск (mmap .npy + колоночные метаданные)
+
+"""
+Локальная альтернатива PineconeVectorStore: тот же интерфейс similarity_search / as_retriever,
+без сетевых вызовов.
+
+Формат каталога индекса (config.LOCAL_INDEX_DIR):
+  embeddings.npy  — float32 [N, dim], L2-нормированные векторы (открывается через mmap)
+  texts.bin, offsets.npy, metadata.json, meta_<i>.npy — тексты и метаданные в формате chunk_store.ChunkStore
+
+Все массивы открываются с mmap_mode="r", поэтому несколько воркеров (uvicorn, Streamlit)
+делят одни и те же страницы индекса через page cache ОС. Файлы лежат в подкаталоге текущей версии
+(index_dirs.py): пересборка не трогает открытые воркерами файлы, новый индекс виден после перезапуска.
+Поиск — косинусная близость полным перебором: один matmul по матрице векторов + argpartition.
+Фильтры — подмножество синтаксиса Pinecone: {"поле": v}, $eq, $ne, $in, $nin, $or, $and.
+"""
+
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from chunk_store import LEGACY_FILES as CHUNK_STORE_FILES, METADATA_FILE, ChunkStore
+from index_dirs import current_version, new_version
+
+EMBEDDINGS_FILE = "embeddings.npy"
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorStore(VectorStore):
+    """Точный косинусный поиск по memory-mapped индексу, собранному build_vector_db.py."""
+
+    def __init__(self, directory: str | Path, embedding: Any):
+        self.directory = current_version(directory)
+        self._embedding = embedding
+        # Тексты и метаданные — общий колоночный формат с хранилищем чанков для BM25
+        self.store = ChunkStore(self.directory)
+        self._vectors = np.load(self.directory / EMBEDDINGS_FILE, mmap_mode="r")
+
+        if self._vectors.shape[0] != len(self.store):
+            raise ValueError("Локальный индекс повреждён: число векторов не совпадает с числом текстов.")
+
+    # ------------------------------------------------------------------ build
+
+    @classmethod
+    def build(
+        cls,
+        directory: str | Path,
+        documents: Sequence[Document],
+        embedding: Any,
+        batch_size: int = 64,
+    ) -> "LocalVectorStore":
+        """Эмбеддит документы пакетами и записывает индекс новой версией directory."""
+        n = len(documents)
+        if n == 0:
+            raise ValueError("Нет документов для локального индекса.")
+
+        with new_version(directory, (EMBEDDINGS_FILE, *CHUNK_STORE_FILES)) as target:
+            vectors = None
+            for start in range(0, n, batch_size):
+                batch = documents[start : start + batch_size]
+                emb = _normalize_rows(embedding.embed_documents([d.page_content for d in batch]))
+                if vectors is None:
+                    vectors = np.lib.format.open_memmap(
+                        target / EMBEDDINGS_FILE, mode="w+", dtype=np.float32, shape=(n, emb.shape[1])
+                    )
+                vectors[start : start + len(batch)] = emb
+                print(f"   Локальный индекс: {start + len(batch)}/{n} векторов")
+            vectors.flush()
+            del vectors
+
+            ChunkStore.write(target, documents)
+        return cls(directory, embedding)
+
+    @classmethod
+    def load(cls, directory: str | Path, embedding: Any) -> "LocalVectorStore":
+        if not (current_version(directory) / METADATA_FILE).exists():
+            raise FileNotFoundError(
+                f"Локальный индекс не найден в {directory}. "
+                "Запустите: LEGAL_RAG_VECTOR_BACKEND=local python build_vector_db.py"
+            )
+        return cls(directory, embedding)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        directory: str | Path | None = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        if directory is None:
+            raise ValueError("LocalVectorStore.from_texts требует directory=...")
+        metadatas = metadatas or [{} for _ in texts]
+        docs = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        return cls.build(directory, docs, embedding, **kwargs)
+
+    # ------------------------------------------------------------------ access
+
+    @property
+    def embeddings(self) -> Any:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return int(self._vectors.shape[0])
+
+    def describe_index_stats(self) -> dict:
+        """Совместимо по ключам с Pinecone Index.describe_index_stats()."""
+        return {"total_vector_count": len(self), "dimension": int(self._vectors.shape[1])}
+
+    def _document(self, row: int) -> Document:
+        return self.store.document(row)
+
+    # ------------------------------------------------------------------ filters
+
+    def _field_mask(self, name: str, condition: Any) -> np.ndarray:
+        n = len(self)
+        codes, _ = self.store.column(name)
+        if codes is None:
+            # Поля нет ни у одного чанка: совпадают только отрицания
+            if isinstance(condition, dict) and set(condition) <= {"$ne", "$nin"}:
+                return np.ones(n, dtype=bool)
+            return np.zeros(n, dtype=bool)
+
+        ids = self.store.value_ids(name)
+
+        def _isin(values: Iterable[Any]) -> np.ndarray:
+            wanted = [ids[str(v)] for v in values if str(v) in ids]
+            if not wanted:
+                return np.zeros(n, dtype=bool)
+            return np.isin(codes, np.asarray(wanted, dtype=np.int32))
+
+        if not isinstance(condition, dict):
+            return _isin([condition])
+        mask = np.ones(n, dtype=bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= _isin([value])
+            elif op == "$ne":
+                mask &= ~_isin([value])
+            elif op == "$in":
+                mask &= _isin(value)
+            elif op == "$nin":
+                mask &= ~_isin(value)
+            else:
+                raise ValueError(f"Оператор фильтра {op} не поддерживается локальным индексом.")
+        return mask
+
+    def _filter_mask(self, filter: Optional[dict]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in filter.items():
+            if key == "$and":
+                for clause in value:
+                    mask &= self._filter_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(len(self), dtype=bool)
+                for clause in value:
+                    any_mask |= self._filter_mask(clause)
+                mask &= any_mask
+            else:
+                mask &= self._field_mask(key, value)
+        return mask
+
+    # ------------------------------------------------------------------ search
+
+    def _search_rows(
+        self, query_vectors: np.ndarray, k: int, filter: Optional[dict] = None
+    ) -> list[list[tuple[int, float]]]:
+        """Top-k по косинусу для пакета запросов одним matmul."""
+        queries = _normalize_rows(np.atleast_2d(query_vectors))
+        mask = self._filter_mask(filter)
+        if mask is None:
+            rows = None
+            matrix = self._vectors
+        else:
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return [[] for _ in range(len(queries))]
+            matrix = self._vectors[rows]
+
+        scores = queries @ matrix.T
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for qi in range(len(queries)):
+            cand = top[qi]
+            cand = cand[np.argsort(-scores[qi, cand], kind="stable")]
+            ids = cand if rows is None else rows[cand]
+            results.append([(int(r), float(s)) for r, s in zip(ids, scores[qi, cand])])
+        return results
+
+    def similarity_search_by_vectors(
+        self, vectors: Sequence[Sequence[float]], k: int = 4, filter: Optional[dict] = None
+    ) -> List[List[tuple[Document, float]]]:
+        """Пакетный поиск: несколько запросов — один проход по матрице."""
+        hits = self._search_rows(np.asarray(vectors, dtype=np.float32), k, filter)
+        return [[(self._document(r), s) for r, s in row] for row in hits]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[tuple[Document, float]]:
+        return self.similarity_search_by_vectors([embedding], k=k, filter=filter)[0]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [d for d, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self._embedding.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def batch_similarity_search(
+        self, queries: Sequence[str], k: int = 4, filter: Optional[dict] = None
+    ) -> List[List[Document]]:
+        """Несколько текстовых запросов с одним фильтром — один matmul на всех."""
+        if not queries:
+            return []
+        vectors = [self._embedding.embed_query(q) for q in queries]
+        return [[d for d, _ in row] for row in self.similarity_search_by_vectors(vectors, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
@@ -0,0 +1,170 @@
+# onnx_engines.py — CPU-движки на ONNX Runtime (int8) для моделей, которые на сервере без GPU работают через PyTorch
+
+"""
+Эмбеддинги multilingual-e5-large: экспорт в ONNX (optimum), динамическая int8-квантизация весов
+(onnxruntime.quantization), инференс через onnxruntime с заданным числом intra-op потоков.
+
+Reranker bge-reranker-v2-m3: тот же путь экспорта (sequence classification), пары обрезаются
+по стороне чанка до max_length токенов.
+
+Экспорт выполняется один раз при первой загрузке и кэшируется в config.ONNX_DIR/<модель>/.
+Включение: LEGAL_RAG_EMBEDDING_ENGINE=onnx / LEGAL_RAG_RERANKER_ENGINE=onnx. Проверка перед включением:
+  python benchmark_components.py embeddings
+  python benchmark_components.py reranker
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+import config
+
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+except ImportError:
+    ort = None
+    AutoTokenizer = None
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_quantized.onnx"
+
+
+def _model_dir(model_name: str) -> Path:
+    return Path(config.ONNX_DIR) / model_name.replace("/", "__")
+
+
+def export_onnx_model(model_name: str, task: str = "feature-extraction", quantize: bool = True) -> Path:
+    """ONNX-экспорт модели Hugging Face (+ int8 динамическая квантизация). Возвращает путь к .onnx."""
+    out_dir = _model_dir(model_name)
+    target = out_dir / (INT8_FILE if quantize else FP32_FILE)
+    if target.exists():
+        return target
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForSequenceClassification
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as exc:
+        raise RuntimeError(
+            "Для ONNX-движка нужны optimum и onnxruntime: pip install 'optimum[onnxruntime]'"
+        ) from exc
+
+    if not (out_dir / FP32_FILE).exists():
+        config.configure_hf_hub()
+        model_cls = ORTModelForSequenceClassification if task == "text-classification" else ORTModelForFeatureExtraction
+        print(f"Экспорт {model_name} в ONNX → {out_dir} (однократно)...")
+        model = model_cls.from_pretrained(model_name, export=True, cache_dir=config.HF_CACHE_DIR)
+        model.save_pretrained(out_dir)
+        AutoTokenizer.from_pretrained(model_name, cache_dir=config.HF_CACHE_DIR).save_pretrained(out_dir)
+    if quantize:
+        print(f"Динамическая int8-квантизация {model_name}...")
+        # Внешние данные (>2 ГБ) у e5-large нет, но флаг нужен для больших reranker'ов
+        quantize_dynamic(
+            str(out_dir / FP32_FILE),
+            str(target),
+            weight_type=QuantType.QInt8,
+            use_external_data_format=(out_dir / FP32_FILE).stat().st_size > 2 * 1024**3,
+        )
+    return target
+
+
+def make_session(path: Path, threads: Optional[int] = None) -> "ort.InferenceSession":
+    """CPU-сессия onnxruntime с ограничением intra-op потоков (inter-op — один поток)."""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = threads or config.ONNX_THREADS or (os.cpu_count() or 1)
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(str(path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxEmbeddings:
+    """Эмбеддинги через ONNX Runtime: mean pooling по attention mask + L2-нормализация (как e5 в sentence-transformers).
+
+    Интерфейс как у HuggingFaceEmbeddings (embed_query/embed_documents без префиксов) —
+    оборачивается в PrefixedEmbeddings так же, как PyTorch-версия.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = True,
+        threads: Optional[int] = None,
+        max_length: int = 512,
+        batch_size: int = 16,
+    ):
+        if ort is None:
+            raise RuntimeError("onnxruntime/transformers не установлены: pip install 'optimum[onnxruntime]'")
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        path = export_onnx_model(model_name, quantize=quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(path.parent))
+        self.session = make_session(path, threads)
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start : start + self.batch_size]
+            enc = self.tokenizer(
+                batch, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype(np.float32))
+        return np.vstack(out) if out else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+class OnnxReranker:
+    """Cross-encoder reranker (bge-reranker-v2-m3) на ONNX Runtime int8 с жёстким лимитом длины.
+
+    compute_score(pairs) совместим с FlagReranker.compute_score (сырые логиты, без сигмоиды),
+    поэтому подключается к BatchingReranker без изменений. Обрезается только сторона чанка
+    (truncation="only_second"): запрос всегда целиком.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = True,
+        threads: Optional[int] = None,
+        max_length: int = 512,
+        batch_size: int = 16,
+    ):
+        if ort is None:
+            raise RuntimeError("onnxruntime/transformers не установлены: pip install 'optimum[onnxruntime]'")
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        path = export_onnx_model(model_name, task="text-classification", quantize=quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(path.parent))
+        self.session = make_session(path, threads)
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def compute_score(self, pairs: List[List[str]], batch_size: Optional[int] = None) -> List[float]:
+        batch_size = batch_size or self.batch_size
+        scores: List[float] = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start : start + batch_size]
+            enc = self.tokenizer(
+                [q for q, _ in batch],
+                [p for _, p in batch],
+                padding=True,
+                truncation="only_second",
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            logits = self.session.run(None, feeds)[0]
+            scores.extend(float(x) for x in logits.reshape(len(batch), -1)[:, 0])
+        return scores
@@ -0,0 +1,208 @@
+# query_features.py — признаки запроса за один проход: автомат Ахо–Корасик по таблице триггеров query_rules.json
+
+"""
+Эвристики rag_chain.py (расширение запроса, фокусные статьи, выбор промпта, валидация ответа)
+раньше каждая заново приводили запрос к нижнему регистру и перебирали свои кортежи подстрок.
+Теперь все триггеры из config.QUERY_RULES_PATH компилируются в один автомат, и analyze_query()
+за один проход по запросу возвращает QueryFeatures, общий для всех слоёв (с lru_cache).
+"""
+
+import json
+import re
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import config
+
+
+class AhoCorasick:
+    """Автомат Ахо–Корасик: все вхождения набора подстрок за один проход по тексту."""
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[int]] = [set()]
+        for pid, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                node = nxt
+            self._out[node].add(pid)
+        # BFS: суффиксные ссылки и объединение выходов
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = candidate if candidate != nxt else 0
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def search(self, text: str) -> Set[int]:
+        """Номера шаблонов, встречающихся в text как подстроки."""
+        found: Set[int] = set()
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+@dataclass(frozen=True)
+class QueryFeatures:
+    """Результат разбора запроса: сработавшие признаки, фокусные статьи, подзапросы расширения, диапазон статей."""
+
+    query: str
+    triggers: FrozenSet[str]
+    focus_articles: FrozenSet[str]
+    augment_extras: Tuple[str, ...]
+    article_range: Optional[Tuple[int, int]]
+    # Явные ссылки на статьи ("ст. 136", "статья 188", "136-бап") и названные кодексы (значения code_ru)
+    article_refs: Tuple[str, ...] = ()
+    codes: Tuple[str, ...] = ()
+    # Слова запроса вне ссылок на статьи/кодексы и служебных слов — признак смешанного запроса
+    free_text_words: Tuple[str, ...] = ()
+
+    def has(self, feature: str) -> bool:
+        return feature in self.triggers
+
+    @property
+    def augmented_query(self) -> str:
+        """Запрос для ретривера: исходный текст + фиксированные подзапросы + номера статей диапазона УК."""
+        extras = list(self.augment_extras)
+        if self.article_range and self.has("uk_mention"):
+            start, end = self.article_range
+            extras.append(f"статьи {' '.join(str(n) for n in range(start, end + 1))} УК РК")
+        return (self.query + " " + " ".join(extras)).strip() if extras else self.query
+
+
+# Диапазон статей — только с маркером статьи ("ст. 120–135", "статьи 120-135", "120-135 баптар"):
+# без него "от 3-5 лет" или "1-2 млн" тоже выглядели бы диапазоном
+_RANGE_RE = re.compile(
+    r"(?:\bстать\w*|\bст\.?|\bбап\w*)\s*№?\s*(\d{1,4})\s*[-–—]\s*(\d{1,4})(?!\d)"
+    r"|\b(\d{1,4})\s*[-–—]\s*(\d{1,4})\s*-?\s*ба[пб]\w*",
+    re.IGNORECASE,
+)
+
+
+# Номер статьи: цифры + необязательная буква (как article_number в prepare_data.py); "217-1" → "217"
+_ARTICLE_REF_RE = re.compile(
+    r"(?:\bстать\w*|\bст\.?|\bбап\w*)\s*№?\s*(\d{1,4})(?!\d)([а-яa-z](?![а-яa-z]))?"
+    r"|\b(\d{1,4})\s*-?\s*ба[пб]\w*",
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def extract_article_refs(query: str) -> Tuple[str, ...]:
+    refs = []
+    for m in _ARTICLE_REF_RE.finditer(query or ""):
+        number = m.group(1) or m.group(3)
+        suffix = (m.group(2) or "").lower() if m.group(1) else ""
+        refs.append(number + suffix)
+    return tuple(dict.fromkeys(refs))
+
+
+def extract_article_range(query: str) -> Optional[Tuple[int, int]]:
+    for match in _RANGE_RE.finditer(query or ""):
+        start = int(match.group(1) or match.group(3))
+        end = int(match.group(2) or match.group(4))
+        # "217-1" (конец меньше начала) — номер статьи с дефисом, а не диапазон 1..217
+        if start <= end:
+            return start, end
+    return None
+
+
+class QueryRules:
+    """Таблица правил из JSON, скомпилированная в один автомат."""
+
+    def __init__(self, rules: dict):
+        self.features: Dict[str, List[str]] = {k: list(v) for k, v in rules.get("features", {}).items()}
+        self.augment: List[Tuple[str, Tuple[str, ...]]] = [
+            (r["feature"], tuple(r["extras"])) for r in rules.get("augment", [])
+        ]
+        self.focus: List[Tuple[str, Tuple[str, ...]]] = [
+            (r["feature"], tuple(r["articles"])) for r in rules.get("focus", [])
+        ]
+        # Названия кодексов для прямого поиска статей: регулярки → значения code_ru
+        self.article_codes: List[Tuple[re.Pattern, Tuple[str, ...]]] = [
+            # \w* — съедаем окончание слова ("кодексінің", "уголовного кодекса"), чтобы оно не считалось свободным текстом
+            (re.compile("(?:" + "|".join(r["patterns"]) + r")\w*", re.IGNORECASE), tuple(r["codes"]))
+            for r in rules.get("article_codes", [])
+        ]
+        self.article_default_codes: Tuple[str, ...] = tuple(rules.get("article_default_codes", []))
+        self.article_stopwords: FrozenSet[str] = frozenset(w.lower() for w in rules.get("article_query_stopwords", []))
+        unknown = {f for f, _ in self.augment + self.focus} - set(self.features)
+        if unknown:
+            raise ValueError(f"query_rules: правила ссылаются на неизвестные признаки {sorted(unknown)}")
+        # Один и тот же триггер может принадлежать нескольким признакам
+        patterns = sorted({t.lower() for triggers in self.features.values() for t in triggers})
+        self._pattern_features: List[Set[str]] = [set() for _ in patterns]
+        index = {p: i for i, p in enumerate(patterns)}
+        for feature, triggers in self.features.items():
+            for t in triggers:
+                self._pattern_features[index[t.lower()]].add(feature)
+        self.automaton = AhoCorasick(patterns)
+
+    @classmethod
+    def load(cls, path=None) -> "QueryRules":
+        with open(path or config.QUERY_RULES_PATH, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def analyze(self, query: str) -> QueryFeatures:
+        query = query or ""
+        triggers: Set[str] = set()
+        for pid in self.automaton.search(query.lower()):
+            triggers |= self._pattern_features[pid]
+        extras = tuple(e for feature, rule_extras in self.augment if feature in triggers for e in rule_extras)
+        focus = frozenset(a for feature, articles in self.focus if feature in triggers for a in articles)
+        article_refs = extract_article_refs(query)
+        codes: Tuple[str, ...] = ()
+        free_words: Tuple[str, ...] = ()
+        if article_refs:
+            rest = _ARTICLE_REF_RE.sub(" ", query)
+            matched = []
+            for pattern, code_names in self.article_codes:
+                if pattern.search(rest):
+                    matched.extend(code_names)
+                    rest = pattern.sub(" ", rest)
+            codes = tuple(dict.fromkeys(matched))
+            free_words = tuple(
+                w for w in (m.group(0).lower() for m in _WORD_RE.finditer(rest))
+                if len(w) >= 3 and w not in self.article_stopwords
+            )
+        return QueryFeatures(
+            query=query,
+            triggers=frozenset(triggers),
+            focus_articles=focus,
+            augment_extras=extras,
+            article_range=extract_article_range(query),
+            article_refs=article_refs,
+            codes=codes,
+            free_text_words=free_words,
+        )
+
+
+RULES = QueryRules.load()
+
+
+@lru_cache(maxsize=4096)
+def analyze_query(query: str) -> QueryFeatures:
+    """Признаки запроса (кэшируются: retriever-слои, выбор промпта и валидация разбирают один и тот же текст)."""
+    return RULES.analyze(query)
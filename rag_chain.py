@@ -1,41 +1,40 @@
 # rag_chain.py — Pinecone + BM25, reranker, строгий промпт
 
+import hashlib
+import json
 import pickle
 import os
 import re
-from typing import Any, List, Sequence, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Optional
 from langchain_core.callbacks import Callbacks
 
 import config
-from langchain_pinecone import PineconeVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
 
 from langchain_core.prompts import PromptTemplate
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
+from langchain_core.documents.compressor import BaseDocumentCompressor
 from langchain_core.retrievers import BaseRetriever
 
-try:
-    import nltk
-    from nltk.stem import SnowballStemmer
-    # Download required NLTK data quietly if not present
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        nltk.download('punkt', quiet=True)
-    try:
-        nltk.data.find('tokenizers/punkt_tab')
-    except LookupError:
-        nltk.download('punkt_tab', quiet=True)
-    
-    _stemmer = SnowballStemmer("russian")
-    
-    def bm25_preprocess_func(text: str) -> List[str]:
-        tokens = nltk.word_tokenize(text.lower())
-        return [_stemmer.stem(t) for t in tokens if t.isalnum()]
-except ImportError:
-    print("NLTK not found. BM25 stemming disabled.")
-    bm25_preprocess_func = None
+from caches import LRUCache, PrecomputedResults, SemanticCache, corpus_version
+from query_features import RULES as QUERY_RULES, analyze_query
+from reranker_service import StageTimings
+from stage_limits import StageBusy, StageLimiter
+
+
+# Лимиты параллелизма стадий: не больше N одновременных вызовов модели, остальные ждут или получают StageBusy
+# Эмбеддинг запроса идёт и внутри доп. поисков _parallel_similarity_search: ожидание его слота не дольше
+# FANOUT_TIMEOUT_SEC, иначе поиск снимается по таймауту раньше, чем станет ясно, что стадия перегружена
+_stage_limits: Dict[str, StageLimiter] = {
+    "embedding": StageLimiter(
+        "embedding", config.EMBEDDING_CONCURRENCY, min(config.STAGE_WAIT_SEC, config.FANOUT_TIMEOUT_SEC)
+    ),
+    "rerank": StageLimiter("rerank", config.RERANK_CONCURRENCY, config.STAGE_WAIT_SEC),
+    "llm": StageLimiter("llm", config.LLM_CONCURRENCY, config.STAGE_WAIT_SEC),
+}
 
 
 class PrefixedEmbeddings:
@@ -46,7 +45,30 @@ class PrefixedEmbeddings:
         return self.embeddings.embed_documents(["passage: " + t for t in texts])
 
     def embed_query(self, text):
-        return self.embeddings.embed_query("query: " + text)
+        # Попадания в кэш эмбеддингов сюда не доходят — слот занимает только вызов модели
+        with _stage_limits["embedding"].slot():
+            return self.embeddings.embed_query("query: " + text)
+
+
+class CachedEmbeddings:
+    """LRU-кэш поверх эмбеддингов запросов: один и тот же текст не прогоняется через модель дважды.
+
+    Ключ — (модель, версия корпуса, текст), поэтому смена модели или пересборка индекса
+    не отдаёт старые векторы. embed_documents не кэшируется (используется только при сборке).
+    """
+
+    def __init__(self, embeddings, model_name: str, maxsize: int):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = LRUCache(maxsize, name="query_embeddings")
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = (self.model_name, corpus_version(), text)
+        vector = self.cache.get_or_compute(key, lambda: list(self.embeddings.embed_query(text)))
+        return list(vector)
 
 
 def _make_embeddings() -> PrefixedEmbeddings:
@@ -55,6 +77,14 @@ def _make_embeddings() -> PrefixedEmbeddings:
     if config.HF_LOCAL_ONLY:
         model_kwargs["local_files_only"] = True
     try:
+        if config.EMBEDDING_ENGINE == "onnx":
+            from onnx_engines import OnnxEmbeddings
+
+            return PrefixedEmbeddings(
+                OnnxEmbeddings(config.EMBEDDING_MODEL, quantize=config.EMBEDDING_ONNX_QUANTIZE)
+            )
+        from langchain_huggingface import HuggingFaceEmbeddings
+
         return PrefixedEmbeddings(
             HuggingFaceEmbeddings(
                 model_name=config.EMBEDDING_MODEL,
@@ -74,14 +104,113 @@ def _make_embeddings() -> PrefixedEmbeddings:
         raise RuntimeError(msg) from exc
 
 
-embeddings = _make_embeddings()
+# ------------------- ЛЕНИВАЯ ИНИЦИАЛИЗАЦИЯ КОМПОНЕНТОВ -------------------
+# Модели, индексы и LLM создаются при первом обращении, а не при импорте модуля: инструментам,
+# которым нужны только BM25 или выбор промпта, не приходится ждать энкодер, reranker и Pinecone.
+# Прежние имена (rag_chain.retriever, from rag_chain import llm) работают через модульный __getattr__.
+
+_COMPONENT_FACTORIES: Dict[str, Callable[[], Any]] = {}
+_components: Dict[str, Any] = {}
+_component_load_sec: Dict[str, float] = {}
+# RLock: фабрика компонента запрашивает свои зависимости из того же потока
+_component_lock = threading.RLock()
+# Время загрузки вложенных зависимостей по уровням — в отчёт идёт собственное время компонента
+_loading_child_sec: List[float] = []
+
+
+def _component(name: str) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+    """Регистрирует фабрику компонента под именем модуля."""
+
+    def register(factory: Callable[[], Any]) -> Callable[[], Any]:
+        _COMPONENT_FACTORIES[name] = factory
+        return factory
+
+    return register
+
+
+def get_component(name: str) -> Any:
+    """Компонент по имени: создаётся один раз (потоки, пришедшие одновременно, ждут первый)."""
+    try:
+        return _components[name]
+    except KeyError:
+        pass
+    factory = _COMPONENT_FACTORIES[name]
+    with _component_lock:
+        if name in _components:
+            return _components[name]
+        _loading_child_sec.append(0.0)
+        start = time.perf_counter()
+        try:
+            value = factory()
+        finally:
+            elapsed = time.perf_counter() - start
+            children = _loading_child_sec.pop()
+            if _loading_child_sec:
+                _loading_child_sec[-1] += elapsed
+        _component_load_sec[name] = round(elapsed - children, 3)
+        _components[name] = value
+        return value
+
+
+def __getattr__(name: str) -> Any:
+    if name in _COMPONENT_FACTORIES:
+        return get_component(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def startup_report() -> dict:
+    """Время загрузки уже созданных компонентов (собственное, без зависимостей) в порядке создания."""
+    return {
+        "components": dict(_component_load_sec),
+        "total_sec": round(sum(_component_load_sec.values()), 3),
+    }
+
+
+def warmup(names: Optional[Sequence[str]] = None) -> dict:
+    """Создать компоненты заранее (по умолчанию — все) и напечатать отчёт о времени загрузки.
+
+    Вызывается при старте api.py, чтобы первый запрос не платил за загрузку моделей.
+    """
+    for name in names or list(_COMPONENT_FACTORIES):
+        get_component(name)
+    report = startup_report()
+    print("Загрузка компонентов RAG:")
+    for name, sec in report["components"].items():
+        print(f"  {name:<22} {sec:8.3f} с")
+    print(f"  {'итого':<22} {report['total_sec']:8.3f} с")
+    return report
+
+
+@_component("embeddings")
+def _load_embeddings() -> Any:
+    embeddings = _make_embeddings()
+    if config.EMBEDDING_CACHE_SIZE > 0:
+        embeddings = CachedEmbeddings(
+            embeddings, f"{config.EMBEDDING_MODEL}:{config.EMBEDDING_ENGINE}", config.EMBEDDING_CACHE_SIZE
+        )
+    return embeddings
+
+
+@_component("vector_store")
+def _load_vector_store() -> Any:
+    embeddings = get_component("embeddings")
+    if config.VECTOR_BACKEND == "local":
+        from local_vector_store import LocalVectorStore
+
+        vector_store = LocalVectorStore.load(config.LOCAL_INDEX_DIR, embedding=embeddings)
+        print(f"Локальный векторный индекс: {config.LOCAL_INDEX_DIR} ({len(vector_store)} векторов)")
+        return vector_store
+
+    from langchain_pinecone import PineconeVectorStore
+
+    vector_store = PineconeVectorStore(
+        index_name=config.PINECONE_INDEX_NAME,
+        embedding=embeddings,
+        namespace=config.PINECONE_NAMESPACE or "default",
+    )
+    print(f"Pinecone подключён: {config.PINECONE_INDEX_NAME}")
+    return vector_store
 
-vector_store = PineconeVectorStore(
-    index_name=config.PINECONE_INDEX_NAME,
-    embedding=embeddings,
-    namespace=config.PINECONE_NAMESPACE or "default",
-)
-print(f"Pinecone подключён: {config.PINECONE_INDEX_NAME}")
 
 _hybrid_k = getattr(config, "RETRIEVER_WIDE_K", getattr(config, "HYBRID_K", 8))
 _vector_kwargs = {"k": _hybrid_k}
@@ -119,7 +248,10 @@ if _filter_clauses:
     _vector_kwargs["k"] = min(getattr(config, "RETRIEVER_WIDE_K", getattr(config, "HYBRID_K", 8)) + 4, 30)
     print(f"Фильтр Pinecone search_kwargs: {_vector_kwargs.get('filter')}")
 
-_vector_retriever = vector_store.as_retriever(search_kwargs=_vector_kwargs)
+
+@_component("_vector_retriever")
+def _load_vector_retriever() -> Any:
+    return get_component("vector_store").as_retriever(search_kwargs=_vector_kwargs)
 
 
 class _FilterByCodeRetriever(BaseRetriever):
@@ -145,91 +277,54 @@ class _FilterByCodeRetriever(BaseRetriever):
 
 
 def _extract_article_range(query: str) -> tuple[int, int] | None:
-    match = re.search(r"(?:статья|ст\.|ст|бап)?\s*(\d+)\s*[-–—]\s*(\d+)", query or "", re.IGNORECASE)
-    if not match:
-        return None
-    start = int(match.group(1))
-    end = int(match.group(2))
-    return (start, end) if start <= end else (end, start)
+    return analyze_query(query).article_range
 
 
 def _augment_retrieval_query(query: str) -> str:
-    q = (query or "").lower()
-    extras: list[str] = []
-    if any(token in q for token in ("баланы ауыстыру", "ауыстыр", "нәресте", "білезік", "подмена ребенка")):
-        extras.append("подмена ребенка статья 136 УК РК")
-    if any(token in q for token in ("субсид", "субсидия", "гос", "государ", "бюджет", "грант", "инвест", "смет", "договор", "фиктив", "жалған", "құжат", "алаяқ", "мемлекеттік", "қаржы", "ақша")):
-        extras.append("алаяқтық 190 УК РК")
-        extras.append("қылмыстық жолмен алынған ақшаны заңдастыру 218 УК РК")
-        extras.append("субсидия алу үшін жалған құжаттар 190 УК РК")
-    if any(token in q for token in ("заңсыз кәсіпкер", "кәсіпкерлік", "лицензиясыз", "тіркеусіз", "незаконн", "без регистрации", "без лицензии", "салық төлем", "налог", "уклонен")):
-        extras.append("заңсыз кәсіпкерлік 214 УК РК")
-        extras.append("салық төлеуден жалтару 245 УК РК")
-    if any(token in q for token in ("пирамида", "пирамид", "қаржылық пирамида", "инвестиция", "инвест", "жоғары пайда", "30-50%")):
-        extras.append("қаржылық пирамида құру және басқару 217 УК РК")
-        extras.append("финансовая пирамида создание и руководство 217 УК РК")
-        extras.append("реклама финансовой пирамиды 217-1 УК РК")
-    if any(token in q for token in ("дәрігер", "жедел жәрдем", "медицин", "медициналық", "фельдшер", "санитар")):
-        extras.append("ненадлежащее выполнение профессиональных обязанностей медицинским работником 317 УК РК")
-        extras.append("медициналық қызметкердің кәсіби міндеттерін тиісінше орындамауы 317 УК РК")
-        extras.append("оставление в опасности 119 УК РК")
-    if any(token in q for token in ("қалдық су", "қалдық сулар", "өзен", "су ластау", "суға төгу", "тазарту жүйесі", "эколог", "өндіріс қалдық", "өндірістік қалдық", "химия", "улы зат", "жаппай улану", "жаппай ауру")):
-        extras.append("загрязнение вод 328 УК РК")
-        extras.append("су ластау 328 УК РК")
-        extras.append("нарушение правил охраны окружающей среды 324 УК РК")
-        extras.append("опасные химические вещества 325 УК РК")
-    if any(token in q for token in ("шетел", "сырт ел", "резидент", "жылжымайтын", "жарғылық капитал", "уставный капитал", "капиталға", "вклад", "взнос", "декларация", "деклар", "имущ", "имущественный", "прирост стоимости")):
-        extras.append("доход от прироста стоимости 228 налоговый кодекс")
-        extras.append("имущественный доход физического лица 330 налоговый кодекс")
-        extras.append("вклад в уставный капитал имущество 333 налоговый кодекс")
-        extras.append("иностранные источники дохода 332 налоговый кодекс")
-    range_match = _extract_article_range(query)
-    if range_match and ("ук" in q or "қылмыстық" in q or "уголов" in q):
-        start, end = range_match
-        nums = " ".join(str(n) for n in range(start, end + 1))
-        extras.append(f"статьи {nums} УК РК")
-    return (query + " " + " ".join(extras)).strip() if extras else query
+    return analyze_query(query).augmented_query
 
 
+def _vector_search_text(query: str) -> str:
+    """Текст, который эмбеддит векторный ретривер: _LawAwareRetriever расширяет запрос, а _HeuristicRetriever
+    расширяет уже расширенный ещё раз (расширение не идемпотентно)."""
+    return _augment_retrieval_query(_augment_retrieval_query(query))
+
+
+# Признаки запроса считаются один раз (query_features.analyze_query) и общие для retrieval,
+# выбора промпта и validate_answer; функции ниже — тонкие обёртки для существующих вызовов
 def _is_criminal_query(query: str) -> bool:
-    q = (query or "").lower()
-    return any(token in q for token in ("қылмыстық", "уголов", "преступ", "ук рк"))
+    return analyze_query(query).has("criminal")
 
 
 def _focus_articles_from_query(query: str) -> set[str]:
-    q = (query or "").lower()
-    focus: set[str] = set()
-    if any(token in q for token in ("субсид", "субсидия", "гос", "государ", "бюджет", "грант", "инвест", "смет", "договор", "фиктив", "мемлекеттік", "жалған", "алаяқ", "құжат", "қаржы", "ақша")):
-        focus.update({"190", "218"})
-    if any(token in q for token in ("заңсыз кәсіпкер", "кәсіпкерлік", "лицензиясыз", "тіркеусіз", "незаконн", "без регистрации", "без лицензии", "салық төлем", "налог", "уклонен")):
-        focus.update({"214", "245"})
-    if any(token in q for token in ("пирамида", "пирамид", "қаржылық пирамида", "инвестиция", "инвест", "жоғары пайда", "30-50%")):
-        focus.update({"217", "190"})
-    if any(token in q for token in ("қалдық су", "қалдық сулар", "өзен", "су ластау", "суға төгу", "тазарту жүйесі", "эколог", "өндіріс қалдық", "өндірістік қалдық", "химия", "улы зат", "жаппай улану", "жаппай ауру")):
-        focus.update({"328", "325", "324"})
-    if any(token in q for token in ("шетел", "сырт ел", "резидент", "жылжымайтын", "жарғылық капитал", "уставный капитал", "капиталға", "вклад", "взнос", "декларация", "деклар", "имущ", "имущественный", "прирост стоимости")):
-        focus.update({"228", "330", "332", "333"})
-    return focus
+    return set(analyze_query(query).focus_articles)
 
 
 def _is_subsidy_query(query: str) -> bool:
-    q = (query or "").lower()
-    return any(token in q for token in ("субсид", "субсидия", "грант", "гос", "государ", "мемлекеттік", "бюджет"))
+    return analyze_query(query).has("subsidy")
 
 
 def _is_illegal_business_query(query: str) -> bool:
-    q = (query or "").lower()
-    return any(token in q for token in ("заңсыз кәсіпкер", "кәсіпкерлік", "лицензиясыз", "тіркеусіз", "незаконн", "без регистрации", "без лицензии", "салық төлем", "налог", "уклонен"))
+    return analyze_query(query).has("illegal_business")
 
 
 def _is_pyramid_query(query: str) -> bool:
-    q = (query or "").lower()
-    return any(token in q for token in ("пирамида", "пирамид", "қаржылық пирамида", "инвестиция", "инвест", "жоғары пайда", "30-50%"))
+    return analyze_query(query).has("pyramid")
 
 
 def _needs_circumstances_query(query: str) -> bool:
-    q = (query or "").lower()
-    return any(token in q for token in ("ауырлататын", "жеңілдететін", "смягча", "отягча"))
+    return analyze_query(query).has("circumstances")
+
+
+# Счётчики быстрого пути по статьям: только точные чанки / точные + семантика / диапазон / обычный retrieval
+_article_lookup_stats = {"exact": 0, "merged": 0, "range": 0, "fallthrough": 0}
+
+_CIRCUMSTANCES_QUERIES = (
+    "смягчающие обстоятельства УК РК",
+    "отягчающие обстоятельства УК РК",
+    "жеңілдететін мән-жайлар Қылмыстық кодекс",
+    "ауырлататын мән-жайлар Қылмыстық кодекс",
+)
 
 
 def _doc_key(doc: Document) -> tuple[str, str]:
@@ -239,6 +334,129 @@ def _doc_key(doc: Document) -> tuple[str, str]:
     )
 
 
+# Общий ограниченный пул для доп. similarity_search: раньше до 8 последовательных обращений к индексу на запрос.
+# Один вызов _parallel_similarity_search отправляет до _MAX_FANOUT поисков, а параллельно идут до API_WORKERS
+# запросов API: пул меньше API_WORKERS × _MAX_FANOUT ставит поиски в очередь за чужими запросами
+_MAX_FANOUT = max(len(_uk_variants), len(_CIRCUMSTANCES_QUERIES))
+_FANOUT_WORKERS = max(config.FANOUT_MAX_WORKERS, config.API_WORKERS * _MAX_FANOUT)
+_fanout_pool = ThreadPoolExecutor(max_workers=_FANOUT_WORKERS, thread_name_prefix="rag-fanout")
+# Поиски: запущенные в пуле / взятые из предвычисленных / упавшие / превысившие таймаут после старта /
+# снятые, так и не дождавшись потока
+_fanout_stats = {"submitted": 0, "precomputed": 0, "failed": 0, "timed_out": 0, "dropped": 0}
+_fanout_lock = threading.Lock()
+
+
+def _search_key(query: str, k: int, search_filter: Optional[dict]) -> tuple[str, int, str]:
+    return (query, k, json.dumps(search_filter, sort_keys=True, ensure_ascii=False))
+
+
+def _copy_docs(docs: List[Document]) -> List[Document]:
+    # Reranker пишет relevance_score в metadata — общие предвычисленные документы не отдаём по ссылке
+    return [Document(page_content=d.page_content, metadata=dict(d.metadata)) for d in docs]
+
+
+def _fixed_searches() -> List[tuple[str, int, Optional[dict]]]:
+    """Отдельные поиски с постоянными строками: обстоятельства (law-aware слой).
+
+    Подзапросы расширения (query_rules.json) сюда не входят: они дописываются к запросу
+    в _augment_retrieval_query и отдельными поисками никогда не были.
+    """
+    uk_filter = {"$or": [{"code_ru": v} for v in _uk_variants]}
+    return [(q, 4, uk_filter) for q in _CIRCUMSTANCES_QUERIES]
+
+
+def _compute_fixed_results() -> dict:
+    vector_store = get_component("vector_store")
+    if config.VECTOR_BACKEND == "local":
+        from local_vector_store import LocalVectorStore
+
+        # Пересчёт идёт после смены версии корпуса: уже загруженный store смотрит на прежний индекс
+        # (его mmap не перечитывается), поэтому считаем по индексу, который сейчас лежит на диске
+        vector_store = LocalVectorStore.load(config.LOCAL_INDEX_DIR, embedding=get_component("embeddings"))
+    return {
+        _search_key(q, k, search_filter): vector_store.similarity_search(q, k=k, filter=search_filter)
+        for q, k, search_filter in _fixed_searches()
+    }
+
+
+# Результаты постоянных поисков зависят только от версии корпуса: считаются в фоне при старте
+# и после пересборки индекса (build_vector_db.py меняет corpus_version), затем отдаются из памяти
+_fixed_results = PrecomputedResults(_compute_fixed_results, name="fixed_queries")
+_FIXED_SEARCH_KEYS = frozenset(_search_key(q, k, f) for q, k, f in _fixed_searches())
+
+
+def _fixed_lookup(query: str, k: int, search_filter: Optional[dict]) -> Optional[List[Document]]:
+    key = _search_key(query, k, search_filter)
+    if not config.PRECOMPUTE_FIXED_QUERIES or key not in _FIXED_SEARCH_KEYS:
+        return None
+    cached = _fixed_results.get(key)
+    return _copy_docs(cached) if cached is not None else None
+
+
+def _count_fanout(counter: str, n: int = 1) -> None:
+    with _fanout_lock:
+        _fanout_stats[counter] += n
+
+
+class _FanoutCall:
+    """Поиск в _fanout_pool, запоминающий момент фактического старта: таймаут считается от него, а не от submit."""
+
+    def __init__(self, fn: Callable[..., List[Document]], *args: Any, **kwargs: Any):
+        self.started = threading.Event()
+        self.started_at = 0.0
+        self.future = _fanout_pool.submit(self._run, fn, args, kwargs)
+
+    def _run(self, fn: Callable[..., List[Document]], args: tuple, kwargs: dict) -> List[Document]:
+        self.started_at = time.monotonic()
+        self.started.set()
+        return fn(*args, **kwargs)
+
+    def result(self, timeout: float) -> Optional[List[Document]]:
+        """Результат или None (счётчики _fanout_stats). Уже запущенный поиск не прерывается —
+        он доработает в пуле, а результат будет отброшен; снять можно только поиск, ждущий потока."""
+        if not self.started.wait(timeout) and self.future.cancel():
+            _count_fanout("dropped")
+            return None
+        self.started.wait()
+        try:
+            return self.future.result(timeout=max(0.0, self.started_at + timeout - time.monotonic()))
+        except FutureTimeoutError:
+            _count_fanout("timed_out")
+        except StageBusy:
+            # Перегрузка стадии — не «пустой результат поиска»: запрос целиком получает 503
+            _count_fanout("failed")
+            raise
+        except Exception:
+            _count_fanout("failed")
+        return None
+
+
+def _parallel_similarity_search(vector_store: Any, searches: List[tuple[str, int, Optional[dict]]]) -> List[Document]:
+    """Параллельные similarity_search (запрос, k, filter), каждый с таймаутом FANOUT_TIMEOUT_SEC от своего старта.
+
+    Предвычисленные постоянные поиски берутся из памяти. Результаты склеиваются в порядке searches,
+    а не в порядке завершения, — _merge_unique остаётся детерминированным. Упавшие, не уложившиеся
+    в таймаут и не дождавшиеся потока поиски пропускаются (как раньше except: continue) и считаются в cache_stats;
+    StageBusy пробрасывается вызывающему.
+    """
+    pending: list = []
+    for q, k, search_filter in searches:
+        cached = _fixed_lookup(q, k, search_filter)
+        if cached is not None:
+            pending.append(cached)
+            _count_fanout("precomputed")
+        else:
+            pending.append(_FanoutCall(vector_store.similarity_search, q, k=k, filter=search_filter))
+            _count_fanout("submitted")
+    results: List[Document] = []
+    for item in pending:
+        if isinstance(item, list):
+            results.extend(item)
+        else:
+            results.extend(item.result(config.FANOUT_TIMEOUT_SEC) or [])
+    return results
+
+
 def _merge_unique(base: List[Document], extra: List[Document]) -> List[Document]:
     seen = {_doc_key(d) for d in base}
     merged = list(base)
@@ -267,18 +485,10 @@ class _HeuristicRetriever(BaseRetriever):
             if filtered:
                 docs = filtered
             else:
-                fallback_docs: list[Document] = []
-                for code_ru in _uk_variants:
-                    try:
-                        fallback_docs.extend(
-                            self.vector_store.similarity_search(
-                                search_query,
-                                k=6,
-                                filter={"code_ru": code_ru},
-                            )
-                        )
-                    except Exception:
-                        continue
+                fallback_docs = _parallel_similarity_search(
+                    self.vector_store,
+                    [(search_query, 6, {"code_ru": code_ru}) for code_ru in _uk_variants],
+                )
                 if fallback_docs:
                     docs = fallback_docs
         range_match = _extract_article_range(query)
@@ -318,45 +528,128 @@ class _LawAwareRetriever(BaseRetriever):
             filtered = [d for d in docs if (d.metadata.get("code_ru") or "").strip() in allowed]
             docs = filtered if filtered else docs
             if len(docs) < self.min_k_criminal:
-                extra: list[Document] = []
-                for code_ru in _uk_variants:
-                    try:
-                        extra.extend(
-                            self.vector_store.similarity_search(
-                                search_query,
-                                k=self.min_k_criminal,
-                                filter={"code_ru": code_ru},
-                            )
-                        )
-                    except Exception:
-                        continue
+                extra = _parallel_similarity_search(
+                    self.vector_store,
+                    [(search_query, self.min_k_criminal, {"code_ru": code_ru}) for code_ru in _uk_variants],
+                )
                 if extra:
                     docs = _merge_unique(docs, extra)
 
         if _needs_circumstances_query(query):
-            extra_docs: list[Document] = []
-            for q in (
-                "смягчающие обстоятельства УК РК",
-                "отягчающие обстоятельства УК РК",
-                "жеңілдететін мән-жайлар Қылмыстық кодекс",
-                "ауырлататын мән-жайлар Қылмыстық кодекс",
-            ):
-                try:
-                    extra_docs.extend(
-                        self.vector_store.similarity_search(
-                            q,
-                            k=4,
-                            filter=uk_filter,
-                        )
-                    )
-                except Exception:
-                    continue
+            extra_docs = _parallel_similarity_search(
+                self.vector_store,
+                [(q, 4, uk_filter) for q in _CIRCUMSTANCES_QUERIES],
+            )
             if extra_docs:
                 docs = _merge_unique(docs, extra_docs)
 
         return docs
 
 
+def _query_text(query: str | dict) -> str:
+    if isinstance(query, dict):
+        # If we receive a dict (e.g. from LCEL chain), extract the query string
+        # Try common keys
+        q = query.get("input") or query.get("query") or query.get("question") or ""
+        if not q and "context" not in query: # If it's not a doc chain input
+             print(f"DEBUG: retriever received dict without known keys: {query.keys()}")
+        
+        # If the dict is just {"input": "..."} which is typical for create_retrieval_chain
+        if q:
+            query = q
+    
+    # Ensure query is string for base_retriever
+    return query if isinstance(query, str) else str(query)
+
+
+def _trim_docs(docs: List[Document], max_docs: int, max_chars_per_doc: int) -> List[Document]:
+    trimmed: list[Document] = []
+    for d in docs[:max_docs]:
+        content = d.page_content
+        if len(content) > max_chars_per_doc:
+            content = content[:max_chars_per_doc] + "\n[...текст обрезан...]"
+        trimmed.append(Document(page_content=content, metadata=d.metadata))
+    return trimmed
+
+
+def _pack_range(groups: List[List[Document]], budget_chars: int, min_chars_per_article: int) -> List[Document]:
+    """Статьи диапазона в порядке номеров, по одному документу на статью, в пределах бюджета контекста.
+
+    Бюджет делится поровну между статьями (не меньше min_chars_per_article — начало статьи с названием
+    и первыми частями), чтобы RANGE_PROMPT видел все статьи диапазона, а не первые несколько целиком.
+    Если статей больше, чем помещается, хвост диапазона отбрасывается.
+    """
+    if not groups:
+        return []
+    share = max(budget_chars // len(groups), min_chars_per_article)
+    packed: list[Document] = []
+    used = 0
+    for chunks in groups:
+        if used + min(share, min_chars_per_article) > budget_chars:
+            break
+        text = "\n".join(d.page_content for d in chunks)
+        if len(text) > share:
+            text = text[:share] + "\n[...текст обрезан...]"
+        packed.append(Document(page_content=text, metadata=chunks[0].metadata))
+        used += min(len(text), share)
+    return packed
+
+
+class _ArticleLookupRetriever(BaseRetriever):
+    """Быстрый путь для явных ссылок на статьи: точные чанки из ArticleIndex без энкодера и векторного поиска.
+
+    Кодекс берётся из запроса, иначе — УК (article_default_codes в query_rules.json). Если кроме ссылки
+    в запросе есть содержательный текст, к точным чанкам добавляются результаты обычного retrieval.
+    Диапазоны ("ст. 120–135 УК") отвечаются сканом отсортированного индекса и упаковкой в бюджет RANGE_PROMPT.
+    Стоит поверх _TrimRetriever: свои результаты обрезает/упаковывает сам.
+    """
+    index: Any
+    base_retriever: Any
+    min_free_words: int = 1
+    max_docs: int = 8
+    max_chars_per_doc: int = 1800
+    range_max_span: int = 60
+    range_budget_chars: int = 8000
+    range_min_chars_per_article: int = 250
+
+    def _route(self, query: str) -> tuple[str, Any]:
+        """Путь запроса: ("range", группы) / ("exact", чанки) / ("merged", чанки) / ("fallthrough", None)."""
+        features = analyze_query(query)
+        codes = features.codes or QUERY_RULES.article_default_codes
+        # Диапазон распознаётся только рядом с маркером статьи (_RANGE_RE), так что "от 3-5 лет" сюда не попадёт
+        if features.article_range:
+            start, end = features.article_range
+            if end - start <= self.range_max_span:
+                groups = self.index.range_lookup(codes, start, end)
+                if groups:
+                    return "range", groups
+        # Слишком широкий или пустой диапазон — как обычная ссылка на статью
+        if features.article_refs:
+            exact = self.index.lookup(codes, features.article_refs)
+            if exact:
+                return ("exact" if len(features.free_text_words) < self.min_free_words else "merged"), exact
+        return "fallthrough", None
+
+    def uses_encoder(self, query: str) -> bool:
+        """Пойдёт ли запрос в векторный поиск (False — ответ целиком из ArticleIndex)."""
+        return self._route(query)[0] in ("merged", "fallthrough")
+
+    def _get_relevant_documents(
+        self, query: str | dict, *, run_manager: CallbackManagerForRetrieverRun | None = None
+    ) -> List[Document]:
+        query = _query_text(query)
+        route, found = self._route(query)
+        _article_lookup_stats[route] += 1
+        if route == "range":
+            return _pack_range(found, self.range_budget_chars, self.range_min_chars_per_article)
+        if route == "exact":
+            return _trim_docs(found, self.max_docs, self.max_chars_per_doc)
+        if route == "merged":
+            merged = _merge_unique(found, self.base_retriever.invoke(query))
+            return _trim_docs(merged, self.max_docs, self.max_chars_per_doc)
+        return self.base_retriever.invoke(query)
+
+
 class _TrimRetriever(BaseRetriever):
     """Обрезает количество и длину документов перед LLM, чтобы избежать переполнения контекста."""
     base_retriever: Any
@@ -366,206 +659,378 @@ class _TrimRetriever(BaseRetriever):
     def _get_relevant_documents(
         self, query: str | dict, *, run_manager: CallbackManagerForRetrieverRun | None = None
     ) -> List[Document]:
-        if isinstance(query, dict):
-            # If we receive a dict (e.g. from LCEL chain), extract the query string
-            # Try common keys
-            q = query.get("input") or query.get("query") or query.get("question") or ""
-            if not q and "context" not in query: # If it's not a doc chain input
-                 print(f"DEBUG: _TrimRetriever received dict without known keys: {query.keys()}")
-            
-            # If the dict is just {"input": "..."} which is typical for create_retrieval_chain
-            if q:
-                query = q
-            else:
-                # Fallback: convert to string representation if needed or just empty
-                 pass 
-        
-        # Ensure query is string for base_retriever
-        if not isinstance(query, str):
-             query = str(query)
-
-        docs = self.base_retriever.invoke(query)
-        trimmed: list[Document] = []
-        for d in docs[: self.max_docs]:
-            content = d.page_content
-            if len(content) > self.max_chars_per_doc:
-                content = content[: self.max_chars_per_doc] + "\n[...текст обрезан...]"
-            trimmed.append(Document(page_content=content, metadata=d.metadata))
-        return trimmed
-
-
-base_retriever = _vector_retriever
-
-# Чанки для BM25 (из pickle или prepare_data)
-_chunks = None
-_pkl = getattr(config, "CHUNKS_PICKLE_PATH", None) or (config.BASE_DIR / "chunks_for_bm25.pkl")
-if _pkl and _pkl.exists():
-    try:
-        with open(_pkl, "rb") as f:
-            _chunks = pickle.load(f)
-        if _chunks:
-            print(f"Чанки для BM25: {len(_chunks)} из {_pkl.name}")
-    except Exception as e:
-        print(f"Не удалось загрузить {_pkl.name}: {e}")
-if _chunks is None and config.DOCUMENTS_DIR.exists():
+        docs = self.base_retriever.invoke(_query_text(query))
+        return _trim_docs(docs, self.max_docs, self.max_chars_per_doc)
+
+
+@_component("chunks")
+def _load_chunks() -> Optional[Sequence[Document]]:
+    """Чанки для BM25 и индекса статей (chunk_store, старый pickle или prepare_data)."""
+    chunks = None
+    store_dir = getattr(config, "CHUNK_STORE_DIR", None)
+    if store_dir and store_dir.exists():
+        try:
+            from chunk_store import ChunkStore
+
+            # mmap: тексты и метаданные не копируются в кучу воркера, Document создаётся только для top-k
+            chunks = ChunkStore.load(store_dir)
+            print(f"Чанки для BM25: {len(chunks)} из {store_dir.name}/ (mmap)")
+        except Exception as e:
+            print(f"Не удалось открыть {store_dir.name}/: {e}")
+            chunks = None
+    pkl = getattr(config, "CHUNKS_PICKLE_PATH", None) or (config.BASE_DIR / "chunks_for_bm25.pkl")
+    if chunks is None and pkl and pkl.exists():
+        try:
+            with open(pkl, "rb") as f:
+                chunks = pickle.load(f)
+            if chunks:
+                print(f"Чанки для BM25: {len(chunks)} из {pkl.name}")
+        except Exception as e:
+            print(f"Не удалось загрузить {pkl.name}: {e}")
+    if chunks is None and config.DOCUMENTS_DIR.exists():
+        try:
+            import prepare_data
+            chunks = getattr(prepare_data, "chunks", None)
+            if chunks:
+                print(f"Чанки для BM25 из prepare_data: {len(chunks)}")
+        except Exception as e:
+            print(f"prepare_data не загружен: {e}")
+    return chunks
+
+
+@_component("bm25_retriever")
+def _load_bm25_retriever() -> Any:
+    """BM25 по чанкам (None, если чанков или пакетов нет — тогда работает только векторный поиск)."""
     try:
-        import prepare_data
-        _chunks = getattr(prepare_data, "chunks", None)
-        if _chunks:
-            print(f"Чанки для BM25 из prepare_data: {len(_chunks)}")
+        from langchain_community.retrievers import BM25Retriever
+        # NLTK импортируется ~1 с — только когда BM25 действительно нужен
+        from text_processing import BM25_PREPROCESS_NAME, bm25_preprocess_func, bm25_tokenize
+
+        chunks = get_component("chunks")
+        if not chunks:
+            raise ValueError("Нет чанков. Запустите: python build_vector_db.py")
+
+        bm25_retriever = None
+        try:
+            # Предсобранный индекс из build_vector_db.py: mmap, без токенизации корпуса на старте
+            from bm25_index import PrebuiltBM25Retriever
+
+            bm25_retriever = PrebuiltBM25Retriever.load(
+                config.BM25_INDEX_DIR,
+                docs=chunks,
+                preprocess_func=bm25_tokenize,
+                preprocess_name=BM25_PREPROCESS_NAME,
+                k=_hybrid_k,
+            )
+            _pruning = getattr(config, "BM25_PRUNING", "auto")
+            bm25_retriever.pruning = _pruning == "1" or (
+                _pruning == "auto" and bm25_retriever.index.n_docs >= getattr(config, "BM25_PRUNING_MIN_DOCS", 50000)
+            )
+            print(
+                f"BM25 загружен из {config.BM25_INDEX_DIR} ({bm25_retriever.index.meta['n_terms']} термов, "
+                f"прунинг top-k: {'вкл' if bm25_retriever.pruning else 'выкл'})."
+            )
+        except Exception as e:
+            print(f"Предсобранный BM25 недоступен ({e}). Строим BM25 из чанков.")
+
+        if bm25_retriever is None:
+            # Use preprocessing if available
+            if bm25_preprocess_func:
+                bm25_retriever = BM25Retriever.from_documents(chunks, preprocess_func=bm25_preprocess_func, k=_hybrid_k)
+                print("BM25 инициализирован со стеммингом (Snowball/Russian).")
+            else:
+                bm25_retriever = BM25Retriever.from_documents(chunks, k=_hybrid_k)
+        return bm25_retriever
+    except ImportError as e:
+        print(f"Ошибка импорта BM25: {e}")
+        print("Установите: pip install langchain-community rank_bm25")
     except Exception as e:
-        print(f"prepare_data не загружен: {e}")
+        print(f"BM25 не запустился: {e}. Используется только Pinecone.")
+    return None
 
-# BM25 + EnsembleRetriever (критично для ст. 136 УК и каз. терминов: баланы ауыстыру и т.д.)
-try:
-    from langchain_community.retrievers import BM25Retriever
-    try:
-        from langchain.retrievers import EnsembleRetriever
-    except ImportError:
+
+@_component("base_retriever")
+def _load_base_retriever() -> Any:
+    # BM25 + EnsembleRetriever (критично для ст. 136 УК и каз. терминов: баланы ауыстыру и т.д.)
+    base_retriever = get_component("_vector_retriever")
+    bm25_retriever = get_component("bm25_retriever")
+    if bm25_retriever is not None:
         try:
-            from langchain.retrievers.ensemble import EnsembleRetriever
-        except ImportError:
-            from langchain_classic.retrievers import EnsembleRetriever
+            try:
+                from langchain.retrievers import EnsembleRetriever
+            except ImportError:
+                try:
+                    from langchain.retrievers.ensemble import EnsembleRetriever
+                except ImportError:
+                    from langchain_classic.retrievers import EnsembleRetriever
 
-    if not _chunks:
-        raise ValueError("Нет чанков. Запустите: python build_vector_db.py")
-    
-    # Use preprocessing if available
-    if bm25_preprocess_func:
-        bm25_retriever = BM25Retriever.from_documents(_chunks, preprocess_func=bm25_preprocess_func, k=_hybrid_k)
-        print("BM25 инициализирован со стеммингом (Snowball/Russian).")
-    else:
-        bm25_retriever = BM25Retriever.from_documents(_chunks, k=_hybrid_k)
+            base_retriever = EnsembleRetriever(
+                retrievers=[base_retriever, bm25_retriever],
+                weights=[0.7, 0.3], # Pinecone favors vector search, BM25 supports exact/stem matches
+            )
+            print("Гибридный RAG готов! (BM25 + Pinecone, k=%d)" % _hybrid_k)
+        except ImportError as e:
+            print(f"Ошибка импорта Ensemble: {e}")
+            print("Установите: pip install langchain или langchain-classic")
+
+    if _allowed_code_ru_for_filter or _filter_article:
+        base_retriever = _FilterByCodeRetriever(
+            retriever=base_retriever,
+            allowed_code_ru=_allowed_code_ru_for_filter,
+            article_number=_filter_article,
+        )
+        print("Включён пост-фильтр по кодексу/статье (только разрешённые code_ru/article_number).")
+    return base_retriever
 
-    hybrid_retriever = EnsembleRetriever(
-        retrievers=[_vector_retriever, bm25_retriever],
-        weights=[0.7, 0.3], # Pinecone favors vector search, BM25 supports exact/stem matches
-    )
-    base_retriever = hybrid_retriever
-    print("Гибридный RAG готов! (BM25 + Pinecone, k=%d)" % _hybrid_k)
-except ImportError as e:
-    print(f"Ошибка импорта BM25/Ensemble: {e}")
-    print("Установите: pip install langchain-community rank_bm25 (и langchain или langchain-classic)")
-except Exception as e:
-    print(f"BM25 не запустился: {e}. Используется только Pinecone.")
-
-if _allowed_code_ru_for_filter or _filter_article:
-    base_retriever = _FilterByCodeRetriever(
-        retriever=base_retriever,
-        allowed_code_ru=_allowed_code_ru_for_filter,
-        article_number=_filter_article,
+
+@_component("heuristic_retriever")
+def _load_heuristic_retriever() -> Any:
+    # Эвристический слой для запроса/пост-фильтра
+    return _HeuristicRetriever(base_retriever=get_component("base_retriever"), vector_store=get_component("vector_store"))
+
+
+@_component("law_aware_retriever")
+def _load_law_aware_retriever() -> Any:
+    # Law-aware слой (для УК и обстоятельств)
+    law_aware_retriever = _LawAwareRetriever(
+        base_retriever=get_component("heuristic_retriever"),
+        vector_store=get_component("vector_store"),
+        min_k_criminal=getattr(config, "RETRIEVER_MIN_K_CRIMINAL", 10),
     )
-    print("Включён пост-фильтр по кодексу/статье (только разрешённые code_ru/article_number).")
-
-# Эвристический слой для запроса/пост-фильтра
-heuristic_retriever = _HeuristicRetriever(base_retriever=base_retriever, vector_store=vector_store)
-# Law-aware слой (для УК и обстоятельств)
-law_aware_retriever = _LawAwareRetriever(
-    base_retriever=heuristic_retriever,
-    vector_store=vector_store,
-    min_k_criminal=getattr(config, "RETRIEVER_MIN_K_CRIMINAL", 10),
-)
-retriever = law_aware_retriever
+    if config.PRECOMPUTE_FIXED_QUERIES:
+        _fixed_results.refresh()
+    return law_aware_retriever
+
 # ------------------- УЛУЧШЕННЫЙ RERANKER -------------------
 # ------------------- УЛУЧШЕННЫЙ RERANKER (BGE-M3) -------------------
-if config.USE_RERANKER:
+RERANKER_MODEL_NAME = "BAAI/bge-reranker-v2-m3"
+# Оценки разных движков/длин обрезки не смешиваются в кэше
+_RERANK_CACHE_MODEL = f"{RERANKER_MODEL_NAME}:{config.RERANKER_ENGINE}:{config.RERANKER_MAX_LENGTH}"
+# Оценки пар (запрос, чанк): повторы, follow-up и повторный retrieval в benchmark.py не гоняют модель заново
+_rerank_cache = LRUCache(config.RERANK_CACHE_SIZE, name="rerank_scores", ttl_sec=config.RERANK_CACHE_TTL_SEC)
+
+
+def _normalize_rerank_query(query: str) -> str:
+    # Только пробелы: регистр и пунктуация влияют на оценку модели, их не трогаем
+    return " ".join(query.split())
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+_rerank_timings = StageTimings()
+
+
+@_component("_reranker_service")
+def _load_reranker_service() -> Any:
+    """Единая очередь к модели reranker'а (None, если reranker выключен или не загрузился)."""
+    if not config.USE_RERANKER:
+        print("Reranker отключён в config (USE_RERANKER=False)")
+        return None
     try:
-        from FlagEmbedding import FlagReranker
+        from reranker_service import BatchingReranker, load_reranker_scorer
+
+        print(f"Инициализация {RERANKER_MODEL_NAME} [{config.RERANKER_ENGINE}] (это может занять время)...")
+        _reranker_score = load_reranker_scorer(
+            RERANKER_MODEL_NAME,
+            engine=config.RERANKER_ENGINE,
+            max_length=config.RERANKER_MAX_LENGTH,
+            threads=config.RERANKER_THREADS,
+        )
+        print("BGE-M3 Reranker успешно загружен.")
+    except Exception as e:
+        print(f"Reranker BGE-M3 не запустился: {e}. Проверьте установку FlagEmbedding и peft (или optimum для onnx).")
+        print("Используется только retrieval без переранжирования.")
+        return None
+
+    # Единая очередь к модели: пары от параллельных запросов идут одним батчем
+    return BatchingReranker(
+        _reranker_score,
+        max_batch_pairs=config.RERANK_MAX_BATCH_PAIRS,
+        max_wait_ms=config.RERANK_BATCH_WINDOW_MS,
+        name="bge_reranker",
+    )
+
+
+class BGEReranker(BaseDocumentCompressor):
+    top_n: int = 8
+    
+    def compress_documents(
+        self, documents: Sequence[Document], query: str, callbacks: Optional[Callbacks] = None
+    ) -> Sequence[Document]:
+        if not documents:
+            return []
+
+        start = time.perf_counter()
+        query = _normalize_rerank_query(query)
+        keys = [(_RERANK_CACHE_MODEL, query, _content_hash(d.page_content)) for d in documents]
+        scores: List[Optional[float]] = [_rerank_cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            # BGE expects pairs: [query, doc]
+            pairs = [[query, documents[i].page_content] for i in missing]
+            with _stage_limits["rerank"].slot():
+                fresh = get_component("_reranker_service").score(pairs)
+            for i, score in zip(missing, fresh):
+                scores[i] = float(score)
+                _rerank_cache.put(keys[i], scores[i])
+        
+        # Attach scores and sort
+        scored_docs = []
+        for i, doc in enumerate(documents):
+            doc.metadata["relevance_score"] = scores[i]
+            scored_docs.append((doc, scores[i]))
+        
+        # Sort descending by score
+        scored_docs.sort(key=lambda x: x[1], reverse=True)
+        _rerank_timings.record("bge", time.perf_counter() - start)
+        
+        # Return top_n
+        return [d for d, s in scored_docs[:self.top_n]]
+
+
+class CascadeReranker(BaseDocumentCompressor):
+    """Двухэтапный rerank: дешёвый FlashRank оставляет shortlist_k кандидатов, BGE-M3 ранжирует только их."""
+
+    first_stage: Any
+    second_stage: BaseDocumentCompressor
+    shortlist_k: int = 12
+
+    def shortlist(self, documents: Sequence[Document], query: str, k: Optional[int] = None) -> List[Document]:
+        """Кандидаты в порядке оценки первой стадии (первые k; k=None — shortlist_k)."""
+        from flashrank import RerankRequest
+
+        k = self.shortlist_k if k is None else k
+        passages = [{"id": i, "text": d.page_content} for i, d in enumerate(documents)]
+        ranked = self.first_stage.rerank(RerankRequest(query=query, passages=passages))
+        return [documents[p["id"]] for p in ranked[:k]]
+
+    def compress_documents(
+        self, documents: Sequence[Document], query: str, callbacks: Optional[Callbacks] = None
+    ) -> Sequence[Document]:
+        if len(documents) > self.shortlist_k:
+            start = time.perf_counter()
+            documents = self.shortlist(documents, query)
+            _rerank_timings.record("flashrank", time.perf_counter() - start)
+        return self.second_stage.compress_documents(documents, query, callbacks=callbacks)
+
+
+@_component("reranker")
+def _load_reranker() -> Optional[BaseDocumentCompressor]:
+    """BGE-M3 (или каскад FlashRank → BGE-M3); None — retrieval без переранжирования."""
+    if get_component("_reranker_service") is None:
+        return None
+    compressor = BGEReranker(top_n=getattr(config, "RETRIEVER_TOP_K_AFTER_RERANK", 8))
+    if config.RERANK_CASCADE:
+        try:
+            from flashrank import Ranker
+
+            compressor = CascadeReranker(
+                first_stage=Ranker(model_name=config.FLASHRANK_MODEL, cache_dir=str(config.BASE_DIR / ".flashrank")),
+                second_stage=compressor,
+                shortlist_k=config.RERANK_SHORTLIST_K,
+            )
+            print(f"Каскад reranker'а: {config.FLASHRANK_MODEL} → shortlist {config.RERANK_SHORTLIST_K} → BGE-M3")
+        except Exception as e:
+            print(f"FlashRank не запустился: {e}. Каскад выключен, используется только BGE-M3.")
+    return compressor
+
+
+@_component("rerank_cascade")
+def _load_rerank_cascade() -> Optional[CascadeReranker]:
+    reranker = get_component("reranker")
+    return reranker if isinstance(reranker, CascadeReranker) else None
+
+
+@_component("article_index")
+def _load_article_index() -> Any:
+    chunks = get_component("chunks") if config.ARTICLE_LOOKUP else None
+    if not chunks:
+        return None
+    from article_index import ArticleIndex
+
+    article_index = ArticleIndex(chunks)
+    print(f"Индекс статей: {len(article_index)} пар (кодекс, статья)")
+    return article_index
+
+
+@_component("retriever")
+def _load_retriever() -> Any:
+    retriever = get_component("law_aware_retriever")
+    compressor = get_component("reranker")
+    if compressor is not None:
         try:
             from langchain.retrievers import ContextualCompressionRetriever
-            from langchain.retrievers.document_compressors.base import BaseDocumentCompressor
         except ImportError:
             from langchain_classic.retrievers import ContextualCompressionRetriever
-            from langchain_classic.retrievers.document_compressors.base import BaseDocumentCompressor
-        
-        print("Инициализация BAAI/bge-reranker-v2-m3 (это может занять время)...")
-        # Global initialization to avoid reloading per request
-        _reranker_model = FlagReranker('BAAI/bge-reranker-v2-m3', use_fp16=True)
-        print("BGE-M3 Reranker успешно загружен.")
 
-        class BGEReranker(BaseDocumentCompressor):
-            top_n: int = 8
-            
-            def compress_documents(
-                self, documents: Sequence[Document], query: str, callbacks: Optional[Callbacks] = None
-            ) -> Sequence[Document]:
-                if not documents:
-                    return []
-                
-                # BGE expects pairs: [query, doc]
-                pairs = [[query, d.page_content] for d in documents]
-                scores = _reranker_model.compute_score(pairs)
-                
-                # If single doc, scores is float; if multiple, list[float]
-                if isinstance(scores, float):
-                    scores = [scores]
-                
-                # Attach scores and sort
-                scored_docs = []
-                for i, doc in enumerate(documents):
-                    doc.metadata["relevance_score"] = scores[i]
-                    scored_docs.append((doc, scores[i]))
-                
-                # Sort descending by score
-                scored_docs.sort(key=lambda x: x[1], reverse=True)
-                
-                # Return top_n
-                return [d for d, s in scored_docs[:self.top_n]]
-
-        compressor = BGEReranker(top_n=getattr(config, "RETRIEVER_TOP_K_AFTER_RERANK", 8))
-        
         retriever = ContextualCompressionRetriever(
             base_compressor=compressor,
-            base_retriever=law_aware_retriever,
+            base_retriever=retriever,
         )
-        print(f"Reranker включён (модель: BAAI/bge-reranker-v2-m3, top_n: {compressor.top_n})")
+        print(f"Reranker включён (модель: {RERANKER_MODEL_NAME}, top_n: {getattr(config, 'RETRIEVER_TOP_K_AFTER_RERANK', 8)})")
 
-    except Exception as e:
-        print(f"Reranker BGE-M3 не запустился: {e}. Проверьте установку FlagEmbedding и peft.")
-        print("Используется только retrieval без переранжирования.")
-else:
-    print("Reranker отключён в config (USE_RERANKER=False)")
-
-# Обрезка контекста перед LLM (для защиты от слишком длинных запросов)
-retriever = _TrimRetriever(
-    base_retriever=retriever,
-    max_docs=getattr(config, "CONTEXT_MAX_DOCS", 8),
-    max_chars_per_doc=getattr(config, "CONTEXT_MAX_CHARS_PER_DOC", 1800),
-)
+    # Обрезка контекста перед LLM (для защиты от слишком длинных запросов)
+    retriever = _TrimRetriever(
+        base_retriever=retriever,
+        max_docs=getattr(config, "CONTEXT_MAX_DOCS", 8),
+        max_chars_per_doc=getattr(config, "CONTEXT_MAX_CHARS_PER_DOC", 1800),
+    )
 
-# Выбор LLM: локальная Ollama или облачный Groq (\"облачный оллама\")
-_llm_backend = os.environ.get("LEGAL_RAG_LLM_BACKEND", "groq").lower()
-if _llm_backend == "groq":
-    try:
-        from langchain_groq import ChatGroq  # type: ignore[import]
-    except Exception as e:  # pragma: no cover
-        raise SystemExit(
-            "Для использования облачного Groq установите пакет 'langchain-groq':\n"
-            "  pip install langchain-groq\n"
-            f"Текущая ошибка импорта: {e}"
+    # Прямой поиск (кодекс, статья) и диапазоны статей поверх всего retrieval + rerank + обрезки:
+    # явные ссылки не идут в энкодер, результаты упаковываются под контекст сами
+    article_index = get_component("article_index")
+    if article_index is not None:
+        retriever = _ArticleLookupRetriever(
+            index=article_index,
+            base_retriever=retriever,
+            min_free_words=config.ARTICLE_LOOKUP_MIN_FREE_WORDS,
+            max_docs=getattr(config, "CONTEXT_MAX_DOCS", 8),
+            max_chars_per_doc=getattr(config, "CONTEXT_MAX_CHARS_PER_DOC", 1800),
+            range_max_span=config.RANGE_MAX_SPAN,
+            range_budget_chars=config.RANGE_CONTEXT_MAX_CHARS,
+            range_min_chars_per_article=config.RANGE_MIN_CHARS_PER_ARTICLE,
         )
+    return retriever
 
-    groq_api_key = os.environ.get("GROQ_API_KEY")
-    if not groq_api_key:
-        raise SystemExit("Задайте GROQ_API_KEY для облачного Groq (gsk_...): export GROQ_API_KEY=...")
+@_component("llm")
+def _load_llm() -> Any:
+    # Выбор LLM: локальная Ollama или облачный Groq (\"облачный оллама\")
+    _llm_backend = os.environ.get("LEGAL_RAG_LLM_BACKEND", "groq").lower()
+    if _llm_backend == "groq":
+        try:
+            from langchain_groq import ChatGroq  # type: ignore[import]
+        except Exception as e:  # pragma: no cover
+            raise SystemExit(
+                "Для использования облачного Groq установите пакет 'langchain-groq':\n"
+                "  pip install langchain-groq\n"
+                f"Текущая ошибка импорта: {e}"
+            )
+
+        groq_api_key = os.environ.get("GROQ_API_KEY")
+        if not groq_api_key:
+            raise SystemExit("Задайте GROQ_API_KEY для облачного Groq (gsk_...): export GROQ_API_KEY=...")
+
+        llm = ChatGroq(
+            groq_api_key=groq_api_key,
+            model_name=config.LLM_MODEL,  # например: llama-3.1-70b-versatile
+            temperature=config.LLM_TEMPERATURE,
+            max_tokens=config.LLM_MAX_TOKENS,
+        )
+        print(f"LLM: Groq (model={config.LLM_MODEL})")
+    else:
+        from langchain_ollama import OllamaLLM
+
+        llm = OllamaLLM(
+            model=config.LLM_MODEL,
+            temperature=config.LLM_TEMPERATURE,
+            base_url=config.OLLAMA_BASE_URL,
+            num_predict=config.LLM_MAX_TOKENS,
+        )
+        print(f"LLM: Ollama локально (model={config.LLM_MODEL})")
+    return llm
 
-    llm = ChatGroq(
-        groq_api_key=groq_api_key,
-        model_name=config.LLM_MODEL,  # например: llama-3.1-70b-versatile
-        temperature=config.LLM_TEMPERATURE,
-        max_tokens=config.LLM_MAX_TOKENS,
-    )
-    print(f"LLM: Groq (model={config.LLM_MODEL})")
-else:
-    from langchain_ollama import OllamaLLM
-
-    llm = OllamaLLM(
-        model=config.LLM_MODEL,
-        temperature=config.LLM_TEMPERATURE,
-        base_url=config.OLLAMA_BASE_URL,
-        num_predict=config.LLM_MAX_TOKENS,
-    )
-    print(f"LLM: Ollama локально (model={config.LLM_MODEL})")
 
 UNIVERSAL_PROMPT_TEMPLATE = """Ты — точный юридический ассистент по законодательству Республики Казахстан.
 Ты имеешь доступ только к следующим нормативным актам (НҚА):
@@ -682,23 +1147,22 @@ CRIMINAL_PROMPT = PromptTemplate.from_template(CRIMINAL_PROMPT_TEMPLATE)
 RANGE_PROMPT = PromptTemplate.from_template(RANGE_PROMPT_TEMPLATE)
 
 
+_PROMPT_ROUTES = {"universal": UNIVERSAL_PROMPT, "criminal": CRIMINAL_PROMPT, "range": RANGE_PROMPT}
+
+
 def _select_prompt(question: str) -> PromptTemplate:
+    return _PROMPT_ROUTES[_prompt_route(question)]
+
+
+def _prompt_route(question: str) -> str:
+    """Имя промпта для вопроса: "range" (диапазон статей), "criminal" (УК / ссылка на статью) или "universal"."""
     if _extract_article_range(question):
-        return RANGE_PROMPT
+        return "range"
     q = question or ""
     if _is_criminal_query(q) or re.search(r"(?:ст\.?\s*\d|статья\s*\d|бап\s*\d)", q, re.IGNORECASE):
-        return CRIMINAL_PROMPT
-    return UNIVERSAL_PROMPT
-
+        return "criminal"
+    return "universal"
 
-try:
-    from langchain.chains import create_retrieval_chain
-    from langchain.chains.combine_documents import create_stuff_documents_chain
-except ImportError:
-    from langchain_classic.chains import create_retrieval_chain
-    from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-
-from langchain_core.runnables import RunnablePassthrough
 
 def _fill_missing_metadata(docs):
     # docs is a list of Document objects coming from the retriever
@@ -717,40 +1181,50 @@ def _fill_missing_metadata(docs):
             d.metadata["source"] = "Неизвестно"
     return docs
 
-def _make_qa_chain(prompt: PromptTemplate) -> Any:
+def _make_answer_chain(prompt: PromptTemplate) -> Any:
+    """Document chain: найденные чанки + история + вопрос → текст ответа LLM."""
+    try:
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+    except ImportError:
+        from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+
     # Define a prompt to format each document including metadata
     document_prompt = PromptTemplate(
         input_variables=["page_content", "source", "article_number", "code_ru"],
         template="Источник: {source}\nКодекс: {code_ru}\nСтатья: {article_number}\nТекст: {page_content}"
     )
+    return create_stuff_documents_chain(get_component("llm"), prompt, document_prompt=document_prompt)
+
+
+def _make_qa_chain(prompt: PromptTemplate) -> Any:
+    try:
+        from langchain.chains import create_retrieval_chain
+    except ImportError:
+        from langchain_classic.chains import create_retrieval_chain
 
-    # LCEL pipeline: Retriever -> Document Chain -> Retrieval Chain
-    question_answer_chain = create_stuff_documents_chain(llm, prompt, document_prompt=document_prompt)
-    
     # Wrap retriever to ensure metadata exists before docs hit the document chain
-    retriever_with_safeguard = retriever | _fill_missing_metadata
+    retriever_with_safeguard = get_component("retriever") | _fill_missing_metadata
     
-    return create_retrieval_chain(retriever_with_safeguard, question_answer_chain)
+    return create_retrieval_chain(retriever_with_safeguard, _make_answer_chain(prompt))
 
 
-_QA_CHAINS = {
-    "universal": _make_qa_chain(UNIVERSAL_PROMPT),
-    "criminal": _make_qa_chain(CRIMINAL_PROMPT),
-    "range": _make_qa_chain(RANGE_PROMPT),
-}
+@_component("_ANSWER_CHAINS")
+def _load_answer_chains() -> dict:
+    return {route: _make_answer_chain(prompt) for route, prompt in _PROMPT_ROUTES.items()}
 
-qa_chain = _QA_CHAINS["universal"]
 
+@_component("_QA_CHAINS")
+def _load_qa_chains() -> dict:
+    # Цепочки retriever + LLM целиком — для внешних скриптов; invoke_qa вызывает стадии по отдельности
+    return {route: _make_qa_chain(prompt) for route, prompt in _PROMPT_ROUTES.items()}
 
-def invoke_qa(query: str, history: Optional[List[dict]] = None) -> dict:
-    prompt = _select_prompt(query)
-    if prompt is RANGE_PROMPT:
-        chain = _QA_CHAINS["range"]
-    elif prompt is CRIMINAL_PROMPT:
-        chain = _QA_CHAINS["criminal"]
-    else:
-        chain = _QA_CHAINS["universal"]
-    
+
+@_component("qa_chain")
+def _load_qa_chain() -> Any:
+    return get_component("_QA_CHAINS")["universal"]
+
+
+def _format_history(history: Optional[List[dict]]) -> str:
     # Format chat history for the prompt
     history_str = ""
     if history:
@@ -759,17 +1233,222 @@ def invoke_qa(query: str, history: Optional[List[dict]] = None) -> dict:
             role = "Пользователь" if msg.get("role") == "user" else "Ассистент"
             history_str += f"{role}: {msg.get('content')}\n"
         history_str += "\n"
+    return history_str
+
+
+# ------------------- КЭШ ОТВЕТОВ -------------------
+# Повторы одного вопроса (канонические кейсы, популярные "кража телефона") отдаются без retrieval и LLM.
+
+_answer_cache = LRUCache(config.ANSWER_CACHE_SIZE, name="answers", ttl_sec=config.ANSWER_CACHE_TTL_SEC)
+# Перефразировки (RU/KZ) точный ключ не ловит: ближайший прошлый вопрос по e5-вектору
+_semantic_answer_cache = SemanticCache(
+    config.SEMANTIC_CACHE_SIZE,
+    config.SEMANTIC_CACHE_THRESHOLD,
+    name="semantic_answers",
+    ttl_sec=config.ANSWER_CACHE_TTL_SEC,
+    audit_rate=config.SEMANTIC_CACHE_AUDIT_RATE,
+)
+_answer_cache_version: List[str] = [""]
+_ANSWER_MODEL = ":".join(
+    str(x) for x in (
+        os.environ.get("LEGAL_RAG_LLM_BACKEND", "groq").lower(),
+        config.LLM_MODEL,
+        config.LLM_TEMPERATURE,
+        config.LLM_MAX_TOKENS,
+    )
+)
+# Правка текста промпта не должна отдавать ответы, сгенерированные по старому
+_PROMPT_DIGESTS = {route: _content_hash(prompt.template)[:12] for route, prompt in _PROMPT_ROUTES.items()}
+_TRAILING_PUNCT_RE = re.compile(r"[\s?!.…]+$")
+
+
+def _normalize_answer_query(query: str) -> str:
+    # Регистр, пробелы и финальные "?!." на ответ не влияют; остальная пунктуация (ст. 136, ч.2) значима
+    return _TRAILING_PUNCT_RE.sub("", " ".join((query or "").casefold().split()))
+
+
+def _history_digest(history: Optional[List[dict]]) -> str:
+    if not history:
+        return ""
+    turns = [[msg.get("role"), msg.get("content")] for msg in history]
+    return _content_hash(json.dumps(turns, ensure_ascii=False))
+
+
+def answer_cache_key(query: str, history: Optional[List[dict]] = None) -> tuple:
+    """(вопрос, история, промпт, модель, версия корпуса) — ключ кэша ответов и single-flight в api.py."""
+    route = _prompt_route(query)
+    return (
+        _normalize_answer_query(query),
+        _history_digest(history),
+        f"{route}:{_PROMPT_DIGESTS[route]}",
+        _ANSWER_MODEL,
+        corpus_version(),
+    )
+
+
+class _AnswerLookup:
+    """Ключи запроса для кэшей ответов; e5-вектор — только для запросов, которые retrieval и так эмбеддит."""
+
+    def __init__(self, query: str, history: Optional[List[dict]]):
+        self.query = query
+        self.key = answer_cache_key(query, history)
+        self.vector: Optional[List[float]] = None
+        self._uses_encoder: Optional[bool] = None
+
+    @property
+    def semantic_signature(self) -> tuple:
+        # Маршрут промпта, история, модель и версия корпуса — из точного ключа; плюс фокусные статьи
+        return self.key[1:] + (tuple(sorted(_focus_articles_from_query(self.query))),)
+
+    @property
+    def uses_encoder(self) -> bool:
+        # Явные ссылки на статьи отвечаются из ArticleIndex без энкодера — семантический кэш им не нужен
+        if self._uses_encoder is None:
+            retriever = get_component("retriever")
+            self._uses_encoder = not isinstance(retriever, _ArticleLookupRetriever) or retriever.uses_encoder(
+                self.query
+            )
+        return self._uses_encoder
+
+    def embed(self) -> List[float]:
+        # Ровно тот текст, что эмбеддит векторный ретривер: один проход e5 на запрос, второй — из кэша эмбеддингов
+        if self.vector is None:
+            self.vector = get_component("embeddings").embed_query(_vector_search_text(self.query))
+        return self.vector
+
+
+def _cached_answer(lookup: _AnswerLookup) -> Optional[dict]:
+    version = lookup.key[-1]
+    if _answer_cache_version[0] != version:
+        # Корпус пересобран: записи старой версии недостижимы — освобождаем память сразу
+        _answer_cache.clear()
+        _semantic_answer_cache.clear()
+        _answer_cache_version[0] = version
+    cached = _answer_cache.get(lookup.key)
+    if (
+        cached is None
+        and _semantic_answer_cache.maxsize
+        # Нет записей с такой подписью (частый случай: у follow-up своя история) — сравнивать не с чем
+        and _semantic_answer_cache.has_signature(lookup.semantic_signature)
+        and lookup.uses_encoder
+    ):
+        cached = _semantic_answer_cache.get(lookup.embed(), lookup.semantic_signature, query=lookup.query)
+        if cached is not None:
+            # Повтор этой формулировки — уже точное попадание
+            _answer_cache.put(lookup.key, cached)
+    if cached is None:
+        return None
+    return {"result": cached["result"], "source_documents": _copy_docs(cached["source_documents"])}
+
+
+def _store_answer(lookup: _AnswerLookup, result: str, docs: List[Document]) -> None:
+    if not result:
+        return
+    value = {"result": result, "source_documents": _copy_docs(docs)}
+    _answer_cache.put(lookup.key, value)
+    if _semantic_answer_cache.maxsize and lookup.uses_encoder:
+        # После retrieval вектор этого текста уже в кэше эмбеддингов
+        _semantic_answer_cache.put(lookup.embed(), lookup.semantic_signature, value, query=lookup.query)
+
+
+def clear_answer_cache() -> None:
+    """Явный сброс кэшей ответов (например, после правки промптов без перезапуска)."""
+    _answer_cache.clear()
+    _semantic_answer_cache.clear()
+
+
+def retrieve_for_qa(query: str) -> List[Document]:
+    """Стадия retrieval: гибридный поиск + rerank + обрезка контекста (без LLM)."""
+    return _fill_missing_metadata(list(get_component("retriever").invoke(query)))
+
+
+def answer_from_docs(query: str, docs: List[Document], history: Optional[List[dict]] = None) -> str:
+    """Стадия генерации: ответ LLM по уже найденным чанкам (промпт выбирается по вопросу)."""
+    chain = get_component("_ANSWER_CHAINS")[_prompt_route(query)]
+    with _stage_limits["llm"].slot():
+        # LCEL expects "input" for the question
+        return chain.invoke({"input": query, "chat_history": _format_history(history), "context": docs})
+
+
+def invoke_qa(query: str, history: Optional[List[dict]] = None) -> dict:
+    lookup = _AnswerLookup(query, history)
+    cached = _cached_answer(lookup)
+    if cached is not None:
+        return cached
+    # Те же шаги, что create_retrieval_chain, но стадии раздельно: у каждой свой лимит параллелизма
+    docs = retrieve_for_qa(query)
+    result = answer_from_docs(query, docs, history)
+    _store_answer(lookup, result, docs)
+    return {"result": result, "source_documents": docs}
+
+
+def stream_answer(query: str, docs: List[Document], history: Optional[List[dict]] = None) -> Iterator[str]:
+    """Как answer_from_docs, но фрагменты ответа отдаются по мере генерации LLM."""
+    chain = get_component("_ANSWER_CHAINS")[_prompt_route(query)]
+    # Слот LLM занят, пока генератор не дочитан или не закрыт (отключение клиента — GeneratorExit)
+    with _stage_limits["llm"].slot():
+        for chunk in chain.stream({"input": query, "chat_history": _format_history(history), "context": docs}):
+            if chunk:
+                yield chunk
+
+
+def stream_qa(query: str, history: Optional[List[dict]] = None) -> Iterator[dict]:
+    """Потоковый invoke_qa: события sources → token... → done.
+
+    {"event": "sources", "source_documents": [...]} — сразу после retrieval и rerank, до LLM;
+    {"event": "token", "text": "..."} — фрагменты ответа;
+    {"event": "done", "result": ..., "answer": ..., "valid": bool} — result — вердикт validate_answer
+    (если ответ не прошёл проверку, клиент заменяет показанный текст на result).
+    """
+    lookup = _AnswerLookup(query, history)
+    cached = _cached_answer(lookup)
+    if cached is not None:
+        # Из кэша ответ приходит одним фрагментом
+        docs, answer = cached["source_documents"], cached["result"]
+        yield {"event": "sources", "source_documents": docs}
+        yield {"event": "token", "text": answer}
+    else:
+        docs = retrieve_for_qa(query)
+        yield {"event": "sources", "source_documents": docs}
+        parts: List[str] = []
+        for text in stream_answer(query, docs, history):
+            parts.append(text)
+            yield {"event": "token", "text": text}
+        answer = "".join(parts)
+        _store_answer(lookup, answer, docs)
+    result = validate_answer(query, answer, docs)
+    yield {"event": "done", "result": result, "answer": answer, "valid": result == answer}
+
+
+def cache_stats() -> dict:
+    """Счётчики кэшей рантайма (для /api/v1/stats и бенчмарков)."""
+    # Только уже созданные компоненты: запрос статистики не должен загружать модели
+    stats: dict = {"corpus_version": corpus_version(), "fixed_queries": _fixed_results.stats()}
+    with _fanout_lock:
+        stats["fanout"] = {"workers": _FANOUT_WORKERS, **_fanout_stats}
+    embeddings = _components.get("embeddings")
+    if isinstance(embeddings, CachedEmbeddings):
+        stats["query_embeddings"] = embeddings.cache.stats()
+    if config.USE_RERANKER:
+        stats["rerank_scores"] = _rerank_cache.stats()
+    stats["answers"] = _answer_cache.stats()
+    if _semantic_answer_cache.maxsize:
+        stats["semantic_answers"] = _semantic_answer_cache.stats()
+    if _components.get("article_index") is not None:
+        stats["article_lookup"] = dict(_article_lookup_stats)
+    if _components.get("bm25_retriever") is not None:
+        from text_processing import stem_memo
+
+        if stem_memo is not None:
+            stats["stem_memo"] = stem_memo.stats()
+    reranker_service = _components.get("_reranker_service")
+    if reranker_service is not None:
+        stats["reranker_batching"] = reranker_service.stats()
+        stats["rerank_stages"] = _rerank_timings.stats()
+    stats["stage_limits"] = {name: limiter.stats() for name, limiter in _stage_limits.items()}
+    stats["startup"] = startup_report()
+    return stats
 
-    # LCEL expects "input" for the question
-    res = chain.invoke({
-        "input": query,
-        "chat_history": history_str
-    })
-    
-    return {
-        "result": res.get("answer", ""),
-        "source_documents": res.get("context", [])
-    }
 
 _KZ_CHARS = set("әғқңөұүһі")
 _KZ_COMMON_WORDS = (
@@ -882,15 +1561,20 @@ def validate_answer(question: str, response: str, sources: List[Document]) -> st
 
 def analyze_text(text: str) -> str:
     """Analyses the provided text using the configured LLM."""
-    chain = ANALYSIS_PROMPT | llm
-    result = chain.invoke({"text": text})
+    chain = ANALYSIS_PROMPT | get_component("llm")
+    with _stage_limits["llm"].slot():
+        result = chain.invoke({"text": text})
     # Extract content string if it's an AIMessage
     return result.content if hasattr(result, "content") else str(result)
 
+# LEGAL_RAG_LAZY_INIT=0: все компоненты создаются при импорте, как до ленивой инициализации
+if not config.LAZY_INIT:
+    warmup()
+
 if __name__ == "__main__":
     question = "Статья 136 УК РК баланы ауыстыру"
     print(f"\nВопрос: {question}\n")
-    docs = retriever.invoke(question)
+    docs = get_component("retriever").invoke(question)
     for i, doc in enumerate(docs[:5], 1):
         print(f"{i}. {doc.metadata.get('source')} | {doc.metadata.get('code_ru', '')} ст.{doc.metadata.get('article_number', '')}")
         print(f"   {doc.page_content[:250].replace(chr(10), ' ')}...\n")
@@ -0,0 +1,200 @@
+# reranker_service.py — in-process сервис для cross-encoder reranker'а с динамическим микро-батчингом
+
+"""
+Параллельные запросы FastAPI раньше вызывали FlagReranker.compute_score каждый сам по себе:
+много маленьких батчей с плохим паддингом и конкуренция за потоки CPU.
+
+BatchingReranker собирает пары (запрос, чанк) от всех ожидающих клиентов в течение короткого окна,
+сортирует их по длине (меньше паддинга), делает один батчевый прогон модели и раздаёт оценки обратно.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+
+
+class _Job:
+    __slots__ = ("pairs", "future")
+
+    def __init__(self, pairs: List[List[str]]):
+        self.pairs = pairs
+        self.future: Future = Future()
+
+
+class BatchingReranker:
+    """Очередь + рабочий поток: score(pairs) блокирует вызывающего до готовности его оценок.
+
+    score_fn — функция модели, принимающая список пар [query, passage] (например, FlagReranker.compute_score).
+    Первый запрос в пустой очереди ждёт не дольше max_wait_ms, батч закрывается раньше при max_batch_pairs.
+    """
+
+    def __init__(
+        self,
+        score_fn: Callable[[List[List[str]]], Sequence[float]],
+        max_batch_pairs: int = 128,
+        max_wait_ms: float = 5.0,
+        name: str = "reranker",
+    ):
+        self.score_fn = score_fn
+        self.max_batch_pairs = max(1, int(max_batch_pairs))
+        self.max_wait_sec = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[_Job]" = queue.Queue()
+        self._worker: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.pairs = 0
+        self.model_sec = 0.0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+                self._worker.start()
+
+    def score(self, pairs: Sequence[Sequence[str]]) -> List[float]:
+        """Оценки для пар в исходном порядке (блокирующий вызов, безопасен из любых потоков)."""
+        if not pairs:
+            return []
+        self._ensure_worker()
+        job = _Job([[q, p] for q, p in pairs])
+        self._queue.put(job)
+        return job.future.result()
+
+    def _collect(self) -> List[_Job]:
+        jobs = [self._queue.get()]
+        size = len(jobs[0].pairs)
+        deadline = time.monotonic() + self.max_wait_sec
+        while size < self.max_batch_pairs:
+            timeout = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            jobs.append(job)
+            size += len(job.pairs)
+        return jobs
+
+    def _run(self) -> None:
+        while True:
+            jobs = self._collect()
+            flat = [(j, i, pair) for j, job in enumerate(jobs) for i, pair in enumerate(job.pairs)]
+            # Похожие по длине пары рядом — внутренние батчи модели почти без паддинга
+            flat.sort(key=lambda item: len(item[2][0]) + len(item[2][1]))
+            try:
+                start = time.perf_counter()
+                raw = self.score_fn([pair for _, _, pair in flat])
+                elapsed = time.perf_counter() - start
+                if isinstance(raw, (int, float)):
+                    raw = [raw]
+                raw = list(raw)
+                if len(raw) != len(flat):
+                    raise RuntimeError(f"Reranker вернул {len(raw)} оценок на {len(flat)} пар")
+                results = [[0.0] * len(job.pairs) for job in jobs]
+                for (j, i, _), score in zip(flat, raw):
+                    results[j][i] = float(score)
+            except Exception as exc:
+                for job in jobs:
+                    job.future.set_exception(exc)
+                continue
+            with self._stats_lock:
+                self.requests += len(jobs)
+                self.batches += 1
+                self.pairs += len(flat)
+                self.model_sec += elapsed
+            for job, scores in zip(jobs, results):
+                job.future.set_result(scores)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "requests": self.requests,
+                "batches": self.batches,
+                "pairs": self.pairs,
+                "avg_requests_per_batch": round(self.requests / self.batches, 3) if self.batches else None,
+                "avg_pairs_per_batch": round(self.pairs / self.batches, 2) if self.batches else None,
+                "model_sec": round(self.model_sec, 3),
+                "queue_depth": self._queue.qsize(),
+            }
+
+
+def load_reranker_scorer(
+    model_name: str, engine: str = "flag", max_length: int = 384, threads: int = 0, batch_size: int = 16
+) -> Callable[[List[List[str]]], Sequence[float]]:
+    """compute_score выбранного движка: "flag" (FlagReranker, PyTorch) или "onnx" (onnx_engines.OnnxReranker, int8).
+
+    Оба движка обрезают только сторону чанка (truncation="only_second") до max_length токенов на пару:
+    запрос всегда целиком. FlagReranker.compute_score так не умеет (truncation=True режет пару целиком,
+    а max_length=512 — его значение по умолчанию), поэтому для "flag" пары токенизируются здесь.
+    На CPU FlagReranker работает в fp32 (fp16 на CPU не ускоряет, а на части сборок torch медленнее).
+
+    threads: для "onnx" — потоки сессии onnxruntime; для "flag" — torch.set_num_threads, а это настройка
+    всего процесса: она ограничивает и энкодер запросов, если он тоже на torch (0 — не трогать).
+    """
+    if engine == "onnx":
+        from onnx_engines import OnnxReranker
+
+        return OnnxReranker(model_name, threads=threads or None, max_length=max_length).compute_score
+
+    import torch
+    from FlagEmbedding import FlagReranker
+
+    if threads:
+        torch.set_num_threads(threads)
+    reranker = FlagReranker(model_name, use_fp16=torch.cuda.is_available())
+    model, tokenizer = reranker.model, reranker.tokenizer
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model.to(device)
+    model.eval()
+
+    @torch.no_grad()
+    def compute_score(pairs: List[List[str]]) -> Sequence[float]:
+        scores: List[float] = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start : start + batch_size]
+            enc = tokenizer(
+                [q for q, _ in batch],
+                [p for _, p in batch],
+                padding=True,
+                truncation="only_second",
+                max_length=max_length,
+                return_tensors="pt",
+            ).to(device)
+            logits = model(**enc, return_dict=True).logits
+            scores.extend(float(x) for x in logits.view(len(batch), -1)[:, 0].float().cpu())
+        return scores
+
+    return compute_score
+
+
+class StageTimings:
+    """Накопительные тайминги стадий (count / total / max) — для каскада reranker'а и бенчмарков."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            row = self._stages.setdefault(stage, {"count": 0, "total_sec": 0.0, "max_sec": 0.0})
+            row["count"] += 1
+            row["total_sec"] += seconds
+            row["max_sec"] = max(row["max_sec"], seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    "count": row["count"],
+                    "avg_ms": round(row["total_sec"] * 1000 / row["count"], 2),
+                    "max_ms": round(row["max_sec"] * 1000, 2),
+                }
+                for stage, row in self._stages.items()
+            }
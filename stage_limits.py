@@ -0,0 +1,75 @@
+# stage_limits.py — лимиты параллелизма по стадиям пайплайна (эмбеддинг, rerank, LLM)
+
+"""
+Без лимитов каждый запрос сразу идёт в модель: при всплеске нагрузки N запросов одновременно
+делят CPU энкодера/reranker'а и квоту Groq, и медленными становятся все.
+
+StageLimiter пропускает в стадию не больше limit вызовов; остальные ждут свободного слота
+не дольше wait_sec и получают StageBusy — api.py отвечает 503 с Retry-After вместо бесконечной очереди.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class StageBusy(RuntimeError):
+    """Стадия перегружена: слот не освободился за wait_sec."""
+
+    def __init__(self, stage: str, wait_sec: float):
+        super().__init__(f"Стадия {stage!r} перегружена: нет свободного слота за {wait_sec:g} с")
+        self.stage = stage
+        self.retry_after = max(1, round(wait_sec))
+
+
+class StageLimiter:
+    """Ограничитель одной стадии: with limiter.slot(): ... (limit <= 0 — без ограничения, только счётчики)."""
+
+    def __init__(self, name: str, limit: int, wait_sec: float):
+        self.name = name
+        self.limit = limit
+        self.wait_sec = wait_sec
+        self._semaphore = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.wait_total_sec = 0.0
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        start = time.perf_counter()
+        if self._semaphore is not None and not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.queued += 1
+            if not self._semaphore.acquire(timeout=self.wait_sec):
+                with self._lock:
+                    self.rejected += 1
+                raise StageBusy(self.name, self.wait_sec)
+        with self._lock:
+            self.admitted += 1
+            self.wait_total_sec += time.perf_counter() - start
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_total_sec * 1000 / self.admitted, 2) if self.admitted else 0.0,
+            }
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from caches import SemanticCache
+
+failures = 0
+
+
+def check(name, ok, detail=""):
+    global failures
+    failures += not ok
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}{': ' + detail if detail else ''}")
+
+
+rng = np.random.default_rng(0)
+base = rng.normal(size=64)
+near = base + rng.normal(scale=0.05, size=64)    # косинус с base ~0.999
+nearer = base + rng.normal(scale=0.01, size=64)  # ещё ближе к base
+
+print("--- SemanticCache: истёкший ближайший сосед не скрывает живую запись ---")
+cache = SemanticCache(16, threshold=0.97, ttl_sec=0.2)
+cache.put(nearer, "sig", "old", query="old")
+time.sleep(0.25)
+cache.put(near, "sig", "fresh", query="fresh")
+got = cache.get(base, "sig")
+check("попадание в живую запись после истечения ближайшей", got == "fresh", repr(got))
+check("истёкшая запись удалена", cache.stats()["expirations"] == 1, str(cache.stats()["expirations"]))
+
+time.sleep(0.25)
+check("все записи истекли — промах", cache.get(base, "sig") is None)
+check("id signature освобождён вместе с последней строкой", cache.stats()["signatures"] == 0,
+      str(cache.stats()["signatures"]))
+
+print("--- SemanticCache: signature другого запроса не смешиваются, кольцо освобождает id ---")
+cache = SemanticCache(4, threshold=0.97)
+cache.put(base, "a", "A")
+check("другой signature — промах", cache.get(base, "b") is None)
+for n in range(100):
+    cache.put(rng.normal(size=64), ("history", n), n)
+check("id не копятся при вытеснении по кругу", cache.stats()["signatures"] == 4, str(cache.stats()["signatures"]))
+
+if failures:
+    print(f"\nFAILURE: {failures} проверок не прошли.")
+    sys.exit(1)
+print("\nSUCCESS: SemanticCache отдаёт живые записи и не накапливает signature.")
@@ -0,0 +1,68 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+import nltk
+
+# Импорт text_processing не должен ходить в сеть: любая попытка загрузки — ошибка
+def _no_download(*args, **kwargs):
+    raise AssertionError(f"nltk.download вызван при импорте: {args}")
+
+nltk.download = _no_download
+
+start = time.perf_counter()
+from text_processing import bm25_preprocess_func
+print(f"--- text_processing импортирован за {time.perf_counter() - start:.2f} с, без nltk.download ---")
+
+# Эталон: прежняя предобработка через nltk.word_tokenize (нужны локальные punkt/punkt_tab)
+try:
+    nltk.data.find("tokenizers/punkt_tab")
+except LookupError:
+    print("SKIP: punkt_tab нет в nltk_data — сверять не с чем (скачайте: python -m nltk.downloader punkt_tab)")
+    sys.exit(0)
+
+from nltk.stem import SnowballStemmer
+
+_stemmer = SnowballStemmer("russian")
+
+
+def reference_preprocess(text):
+    return [_stemmer.stem(t) for t in nltk.word_tokenize(text.lower()) if t.isalnum()]
+
+
+texts = [
+    "Статья 136 УК РК. Подмена ребенка.",
+    "ст. 188 ч.2 п.3) — кража; см. также ст.ст. 190-192.",
+    "Баланы ауыстыру (136-бап) «Қылмыстық кодекс»... Не знаю!",
+    "1. Общие положения. 2. Иные вопросы: штраф 100 МРП, т.е. 345 000 тенге?",
+    "Алаяқтық, яғни алдау арқылы бөтеннің мүлкін ұрлау.",
+]
+with open("test_queries.json", "r", encoding="utf-8") as f:
+    texts.extend(item.get("query") or "" for item in json.load(f))
+if os.path.isdir("documents"):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import prepare_data
+    texts.extend(d.page_content for d in prepare_data.chunks)
+
+print(f"--- Сверка потока токенов BM25 на {len(texts)} текстах ---")
+mismatches = 0
+for text in texts:
+    expected = reference_preprocess(text)
+    got = bm25_preprocess_func(text)
+    if got != expected:
+        mismatches += 1
+        if mismatches <= 5:
+            print(f"\nMISMATCH: {text[:120]!r}")
+            print(f"  nltk:  {expected[:30]}")
+            print(f"  regex: {got[:30]}")
+
+if mismatches:
+    print(f"\nFAILURE: {mismatches} текстов с расхождениями.")
+    sys.exit(1)
+print("\nSUCCESS: поток токенов совпадает с nltk.word_tokenize.")
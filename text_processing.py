@@ -0,0 +1,109 @@
+# text_processing.py — токенизация и стемминг для BM25 (общие для build_vector_db.py и rag_chain.py)
+
+import json
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import config
+from word_tokenizer import word_tokenize
+
+
+class StemMemo:
+    """Мемо словоформа → основа поверх стеммера.
+
+    Словарь юридических текстов маленький и повторяющийся: Snowball вызывается один раз на словоформу,
+    а не на каждое вхождение. Размер не ограничен (растёт со словарём корпуса и запросов) и виден в stats().
+    Таблица сохраняется build_vector_db.py рядом с чанками и загружается при старте — запросы
+    со словами корпуса не стеммятся заново.
+    """
+
+    def __init__(self, stem_fn: Callable[[str], str], name: str, path: Optional[Path] = None):
+        self.stem_fn = stem_fn
+        self.name = name
+        self.path = path
+        self.table: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.loaded = 0
+        self.lookups = 0
+        self.misses = 0
+
+    def load(self, path: Optional[Path] = None) -> int:
+        """Подгрузить сохранённую таблицу (если она от того же стеммера); возвращает число записей."""
+        path = Path(path or self.path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if data.get("stemmer") != self.name:
+            return 0
+        stems = data.get("stems") or {}
+        with self._lock:
+            self.table.update(stems)
+            self.loaded = len(stems)
+        return len(stems)
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        path = Path(path or self.path)
+        with self._lock:
+            payload = {"stemmer": self.name, "stems": dict(self.table)}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        return path
+
+    def stem_tokens(self, tokens: List[str]) -> List[str]:
+        table = self.table
+        stems = []
+        misses = 0
+        for token in tokens:
+            stem = table.get(token)
+            if stem is None:
+                # Гонка двух потоков на одной словоформе безвредна: оба запишут одну и ту же основу
+                stem = table[token] = self.stem_fn(token)
+                misses += 1
+            stems.append(stem)
+        with self._lock:
+            self.lookups += len(stems)
+            self.misses += misses
+        return stems
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self.table),
+                "loaded": self.loaded,
+                "lookups": self.lookups,
+                "misses": self.misses,
+                "hit_ratio": round(1 - self.misses / self.lookups, 4) if self.lookups else None,
+            }
+
+
+try:
+    # Стеммеру Snowball данные nltk_data не нужны; токенизация — word_tokenizer.py (без punkt и nltk.download)
+    from nltk.stem import SnowballStemmer
+
+    stem_memo: Optional[StemMemo] = StemMemo(
+        SnowballStemmer("russian").stem, name="nltk_snowball_ru", path=config.STEM_MEMO_PATH
+    )
+    stem_memo.load()
+
+    def bm25_preprocess_func(text: str) -> List[str]:
+        tokens = word_tokenize(text.lower())
+        return stem_memo.stem_tokens([t for t in tokens if t.isalnum()])
+except ImportError:
+    print("NLTK not found. BM25 stemming disabled.")
+    stem_memo = None
+    bm25_preprocess_func = None
+
+# Имя схемы предобработки — сохраняется в BM25-индексе, чтобы не смешать разные токенизации.
+# word_tokenizer.py даёт тот же поток токенов, что nltk.word_tokenize, поэтому имя и собранные индексы прежние
+BM25_PREPROCESS_NAME = "nltk_snowball_ru" if bm25_preprocess_func else "whitespace"
+
+
+def bm25_tokenize(text: str) -> List[str]:
+    """Токены для BM25: стемминг, если доступен NLTK, иначе split() как в BM25Retriever."""
+    if bm25_preprocess_func:
+        return bm25_preprocess_func(text)
+    return text.split()
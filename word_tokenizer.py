@@ -0,0 +1,214 @@
+# word_tokenizer.py — токенизатор слов без NLTK-данных и сетевых загрузок (замена nltk.word_tokenize для BM25)
+
+"""
+nltk.word_tokenize = Punkt (деление на предложения, модель из nltk_data) + NLTKWordTokenizer (регулярки Treebank).
+При старте text_processing.py раньше искал punkt/punkt_tab и при их отсутствии вызывал nltk.download:
+без сети воркер висел на таймаутах до первого запроса.
+
+Здесь тот же конвейер на предкомпилированных регулярках:
+  - Treebank — те же замены, что в nltk.tokenize.destructive.NLTKWordTokenizer;
+  - Punkt — алгоритм PunktSentenceTokenizer без обученных параметров. Английская модель nltk знает только
+    латинские сокращения, коллокации и регистр латинских слов, а BM25 токенизирует текст в нижнем регистре —
+    для кириллицы (русский, казахский) решения о границах предложений совпадают.
+
+Поток токенов для BM25 сверяется с nltk: python test_tokenizer.py
+"""
+
+import re
+from typing import Iterator, List, Optional, Tuple
+
+# ---------------- Punkt: границы предложений ----------------
+
+_SENT_END_CHARS = (".", "?", "!")
+_PUNCTUATION = tuple(";:,.!?")
+_NON_WORD = r"(?:[)\";}\]\*:@\'\({\[‘’“”\xab\xbb?!])"
+_MULTI_CHAR = r"(?:\-{2,}|\.{2,}|(?:\.\s){2,}\.)"
+_WORD_START = r"[^\(\"\`{\[:;&\#\*@\)}\]\-,]"
+
+_PUNKT_WORD_RE = re.compile(
+    r"""(
+        %(MultiChar)s
+        |
+        (?=%(WordStart)s)\S+?
+        (?=
+            \s|
+            $|
+            %(NonWord)s|%(MultiChar)s|
+            ,(?=$|\s|%(NonWord)s|%(MultiChar)s)
+        )
+        |
+        \S
+    )"""
+    % {"NonWord": _NON_WORD, "MultiChar": _MULTI_CHAR, "WordStart": _WORD_START},
+    re.UNICODE | re.VERBOSE,
+)
+_PERIOD_CONTEXT_RE = re.compile(
+    r"""
+        [\.\?!]
+        (?=(?P<after_tok>
+            %(NonWord)s
+            |
+            \s+(?P<next_tok>\S+)
+        ))"""
+    % {"NonWord": _NON_WORD},
+    re.UNICODE | re.VERBOSE,
+)
+_BOUNDARY_REALIGNMENT_RE = re.compile(r'["\')\]}‘’“”\xab\xbb]+?(?:\s+|(?=--)|$)', re.MULTILINE)
+_ELLIPSIS_RE = re.compile(r"\.\.+$")
+_NUMERIC_RE = re.compile(r"^-?[\.,]?\d[\d,\.-]*\.?$")
+_INITIAL_RE = re.compile(r"[^\W\d]\.$", re.UNICODE)
+_WHITESPACE = frozenset(" \t\n\r\x0b\x0c")
+
+
+def _is_sent_starter(tok: str) -> Optional[bool]:
+    """Орфографическая эвристика Punkt без статистики регистра: False — точно не начало предложения."""
+    if tok in _PUNCTUATION or tok[0].islower():
+        return False
+    return None
+
+
+def _contains_sentbreak(context: str) -> bool:
+    """PunktSentenceTokenizer.text_contains_sentbreak: есть граница предложения не на последнем токене."""
+    toks = [t for line in context.split("\n") if line.strip() for t in _PUNKT_WORD_RE.findall(line)]
+    for i, tok in enumerate(toks):
+        if tok in _SENT_END_CHARS:
+            sentbreak = True
+        elif _ELLIPSIS_RE.match(tok) or not tok.endswith(".") or tok.endswith(".."):
+            sentbreak = False
+        else:
+            sentbreak = True
+        if i + 1 == len(toks):
+            return False
+        if tok.endswith(".") and sentbreak:
+            # Инициал ("а.") или число ("136.") перед словом со строчной буквы — не граница
+            typ = _NUMERIC_RE.sub("##number##", tok.lower())
+            typ = typ[:-1] if len(typ) > 1 and typ[-1] == "." else typ
+            is_initial = _INITIAL_RE.match(tok) is not None
+            if is_initial or typ == "##number##":
+                starter = _is_sent_starter(toks[i + 1])
+                if starter is False or (starter is None and is_initial and toks[i + 1][0].isupper()):
+                    sentbreak = False
+        if sentbreak:
+            return True
+    return False
+
+
+def _end_contexts(text: str) -> Iterator[Tuple[re.Match, str]]:
+    """PunktSentenceTokenizer._match_potential_end_contexts: кандидат в конец предложения + его окружение."""
+    previous_slice = slice(0, 0)
+    previous_match = None
+    for match in _PERIOD_CONTEXT_RE.finditer(text):
+        before = text[previous_slice.stop : match.start()]
+        last_space = 0
+        for i in range(len(before) - 1, -1, -1):
+            if before[i] in _WHITESPACE:
+                last_space = i
+                break
+        start = last_space + previous_slice.stop + 1 if last_space else previous_slice.start
+        prev_word_slice = slice(start, match.start())
+        if previous_match and previous_slice.stop <= prev_word_slice.start:
+            yield previous_match, text[previous_slice] + previous_match.group() + previous_match.group("after_tok")
+        previous_match = match
+        previous_slice = prev_word_slice
+    if previous_match:
+        yield previous_match, text[previous_slice] + previous_match.group() + previous_match.group("after_tok")
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) предложений — как PunktSentenceTokenizer.span_tokenize с выравниванием границ."""
+    slices = []
+    last_break = 0
+    for match, context in _end_contexts(text):
+        if _contains_sentbreak(context):
+            slices.append(slice(last_break, match.end()))
+            last_break = match.start("next_tok") if match.group("next_tok") else match.end()
+    slices.append(slice(last_break, len(text.rstrip())))
+
+    spans = []
+    realign = 0
+    for i, sentence in enumerate(slices):
+        sentence = slice(sentence.start + realign, sentence.stop)
+        if i + 1 == len(slices):
+            if text[sentence]:
+                spans.append((sentence.start, sentence.stop))
+            continue
+        following = slices[i + 1]
+        m = _BOUNDARY_REALIGNMENT_RE.match(text[following])
+        if m:
+            spans.append((sentence.start, following.start + len(m.group(0).rstrip())))
+            realign = m.end()
+        else:
+            realign = 0
+            if text[sentence]:
+                spans.append((sentence.start, sentence.stop))
+    return spans
+
+
+# ---------------- Treebank: слова внутри предложения ----------------
+
+_STARTING_QUOTES = [
+    (re.compile("([«“‘„]|[`]+)", re.U), r" \1 "),
+    (re.compile(r"^\""), r"``"),
+    (re.compile(r"(``)"), r" \1 "),
+    (re.compile(r"([ \(\[{<])(\"|\'{2})"), r"\1 `` "),
+    (re.compile(r"(?i)(?<!\w)(\')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)", re.U), r"\1 "),
+]
+_ENDING_QUOTES = [
+    (re.compile("([»”’])", re.U), r" \1 "),
+    (re.compile(r"''"), " '' "),
+    (re.compile(r'"'), " '' "),
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+    (re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+]
+_PUNCTUATION_RULES = [
+    (re.compile(r'([^\.])(\.)([\]\)}>"\'' "»”’ " r"]*)\s*$", re.U), r"\1 \2 \3 "),
+    (re.compile(r"([:,])([^\d])"), r" \1 \2"),
+    (re.compile(r"([:,])$"), r" \1 "),
+    (re.compile(r"\.{2,}", re.U), r" \g<0> "),
+    (re.compile(r"[;@#$%&]"), r" \g<0> "),
+    (re.compile("[\u2012-\u2015]", re.UNICODE), r" \g<0> "),
+    (re.compile(r'([^\.])(\.)([\]\)}>"\']*)\s*$'), r"\1 \2\3 "),
+    (re.compile(r"[?!]"), r" \g<0> "),
+    (re.compile(r"([^'])' "), r"\1 ' "),
+    (re.compile(r"[*]", re.U), r" \g<0> "),
+]
+_PARENS_BRACKETS = (re.compile(r"[\]\[\(\)\{\}\<\>]"), r" \g<0> ")
+_DOUBLE_DASHES = (re.compile(r"--"), r" -- ")
+_CONTRACTIONS = [
+    re.compile(p)
+    for p in (
+        r"(?i)\b(can)(?#X)(not)\b",
+        r"(?i)\b(d)(?#X)('ye)\b",
+        r"(?i)\b(gim)(?#X)(me)\b",
+        r"(?i)\b(gon)(?#X)(na)\b",
+        r"(?i)\b(got)(?#X)(ta)\b",
+        r"(?i)\b(lem)(?#X)(me)\b",
+        r"(?i)\b(more)(?#X)('n)\b",
+        r"(?i)\b(wan)(?#X)(na)(?=\s)",
+        r"(?i) ('t)(?#X)(is)\b",
+        r"(?i) ('t)(?#X)(was)\b",
+    )
+]
+
+
+def treebank_tokenize(sentence: str) -> List[str]:
+    """Токены одного предложения (NLTKWordTokenizer.tokenize без convert_parentheses)."""
+    text = sentence
+    for regexp, substitution in _STARTING_QUOTES:
+        text = regexp.sub(substitution, text)
+    for regexp, substitution in _PUNCTUATION_RULES:
+        text = regexp.sub(substitution, text)
+    text = _PARENS_BRACKETS[0].sub(_PARENS_BRACKETS[1], text)
+    text = _DOUBLE_DASHES[0].sub(_DOUBLE_DASHES[1], text)
+    text = " " + text + " "
+    for regexp, substitution in _ENDING_QUOTES:
+        text = regexp.sub(substitution, text)
+    for regexp in _CONTRACTIONS:
+        text = regexp.sub(r" \1 \2 ", text)
+    return text.split()
+
+
+def word_tokenize(text: str) -> List[str]:
+    """Аналог nltk.word_tokenize(text) для кириллических текстов, без nltk_data."""
+    return [tok for start, end in sentence_spans(text) for tok in treebank_tokenize(text[start:end])]